@@ -1,4 +1,5 @@
 import os
+import click
 from flask import Flask
 from flask_cors import CORS
 from pymongo import MongoClient
@@ -19,6 +20,30 @@ def create_app(config_name=None):
     app.config.from_object(config[config_name])
     app.url_map.strict_slashes = False
     
+    # Encode ObjectId/datetime natively, with orjson when it is installed
+    from app.utils.json_provider import MongoJSONProvider
+    app.json = MongoJSONProvider(app)
+    
+    # gzip/brotli for large JSON responses
+    from app.middleware.compression import init_compression
+    init_compression(app)
+    
+    # Two-tier cache (local LRU + shared backend)
+    from app.utils.cache import app_cache
+    app_cache.configure(app.config)
+    
+    # Listing full-text search
+    from app.services.search_index import listing_index
+    listing_index.configure(app.config)
+    
+    # Pooled, retrying Lodestone client
+    from app.services.lodestone_service import LodestoneService
+    LodestoneService.configure(app.config)
+    
+    # FFLogs GraphQL client
+    from app.services.fflogs_service import FFLogsService
+    FFLogsService.configure(app.config)
+    
     # Simple CORS configuration for development
     CORS(app, resources={r"/api/*": {"origins": [
     "https://static-helper.vercel.app",
@@ -37,7 +62,7 @@ def create_app(config_name=None):
     print(f"✅ Connected to MongoDB: {db.name}")
     
     # Register blueprints
-    from app.routes import auth, users, listings, applications, messages, search
+    from app.routes import auth, users, listings, applications, messages, search, jobs
     
     app.register_blueprint(auth.bp, url_prefix='/api/auth')
     app.register_blueprint(users.bp, url_prefix='/api/users')
@@ -45,6 +70,88 @@ def create_app(config_name=None):
     app.register_blueprint(applications.bp, url_prefix='/api/applications')
     app.register_blueprint(messages.bp, url_prefix='/api/messages')
     app.register_blueprint(search.bp, url_prefix='/api/search')
+    app.register_blueprint(jobs.bp, url_prefix='/api/jobs')
+    
+    # Background jobs
+    from app.services import job_handlers  # registers the job types
+    from app.services.job_queue import JobQueue, JobWorker
+    JobQueue.configure(app.config)
+    
+    app.job_worker = None
+    if app.config['JOB_WORKER_ENABLED']:
+        app.job_worker = JobWorker(app).start()
+        print(f"✅ Started {app.job_worker.threads} background job worker(s)")
+    
+    @app.cli.command('create-indexes')
+    def create_indexes():
+        """Create MongoDB indexes"""
+        from app.models.indexes import ensure_indexes
+        for name in ensure_indexes(app.db):
+            print(f"✅ {name}")
+    
+    @app.cli.command('backfill-search-fields')
+    def backfill_search_fields():
+        """Recompute derived search fields on every user and listing"""
+        from app.services.search_fields import backfill_search_fields
+        for collection, updated in backfill_search_fields(app.db).items():
+            print(f"✅ Updated {updated} {collection}")
+    
+    @app.cli.command('refresh-schedule-hours')
+    @click.option('--schedule', is_flag=True, help='Queue the recurring refresh job instead of running now')
+    def refresh_schedule_hours(schedule):
+        """Re-parse schedule buckets so daylight-saving zones follow the clocks"""
+        from app.services.search_fields import refresh_schedule_hours, schedule_hours_refresh
+        if schedule:
+            job = schedule_hours_refresh()
+            print(f"✅ Queued job {job['_id']}" if job else "✅ A schedule refresh job is already queued")
+            return
+        for collection, updated in refresh_schedule_hours(app.db).items():
+            print(f"✅ Updated {updated} {collection}")
+    
+    @app.cli.command('migrate-job-levels')
+    def migrate_job_levels():
+        """Convert the nested Lodestone 'jobs' field of existing users to job_levels"""
+        from app.services.lodestone_sync import migrate_job_levels
+        print(f"✅ Migrated {migrate_job_levels(app.db)} users")
+    
+    @app.cli.command('refresh-lodestone')
+    @click.option('--restart', is_flag=True, help='Ignore the checkpoint of an interrupted run')
+    @click.option('--schedule', is_flag=True, help='Queue the recurring refresh job instead of running now')
+    def refresh_lodestone(restart, schedule):
+        """Refresh the character data of every linked Lodestone account"""
+        from app.services.lodestone_refresh import refresh_all_characters, schedule_refresh_all
+        if schedule:
+            job = schedule_refresh_all()
+            print(f"✅ Queued job {job['_id']}" if job else "✅ A refresh job is already queued")
+            return
+        totals = refresh_all_characters(
+            app.db,
+            resume=not restart,
+            on_batch=lambda totals: print(f"  {totals['users']} users, {totals['updated']} updated, {totals['failed']} failed")
+        )
+        print(f"✅ Updated {totals['updated']} of {totals['users']} users ({totals['unchanged']} unchanged, {totals['not_modified']} pages not modified)")
+    
+    @app.cli.command('refresh-progression')
+    @click.option('--restart', is_flag=True, help='Ignore the checkpoint of an interrupted run')
+    @click.option('--schedule', is_flag=True, help='Queue the recurring refresh job instead of running now')
+    def refresh_fflogs_progression(restart, schedule):
+        """Refresh the FFLogs progression summary of every user with an fflogs_id"""
+        from app.services.progression_sync import refresh_progression, schedule_progression_refresh
+        if schedule:
+            job = schedule_progression_refresh()
+            print(f"✅ Queued job {job['_id']}" if job else "✅ A progression refresh job is already queued")
+            return
+        totals = refresh_progression(
+            app.db,
+            resume=not restart,
+            on_batch=lambda totals: print(f"  {totals['users']} users, {totals['updated']} updated")
+        )
+        print(f"✅ Refreshed {totals['updated']} of {totals['users']} users ({totals['not_found']} not found on FFLogs, {totals['failed']} failed)")
+    
+    @app.cli.command('run-jobs')
+    def run_jobs():
+        """Run all due background jobs once and exit"""
+        print(f"✅ Ran {JobQueue.run_pending()} job(s)")
     
     # Health check endpoint
     @app.route('/health')
@@ -56,6 +163,19 @@ def create_app(config_name=None):
         except Exception as e:
             return {'status': 'unhealthy', 'database': 'disconnected', 'error': str(e)}, 503
     
+    from app.middleware.auth_middleware import secret_required
+    
+    @app.route('/metrics')
+    @secret_required('METRICS_TOKEN')
+    def metrics():
+        from app.middleware.compression import compressed_cache
+        return {
+            'cache': app_cache.stats(),
+            'compressed_cache': compressed_cache.stats(),
+            'lodestone': LodestoneService.stats(),
+            'fflogs': FFLogsService.stats()
+        }, 200
+    
     @app.route('/')
     def index():
         return {'message': 'FFXIV Recruitment API', 'version': '1.0.0'}, 200
@@ -22,11 +22,95 @@ class Config:
     # External APIs
     FFLOGS_CLIENT_ID = os.getenv('FFLOGS_CLIENT_ID')
     FFLOGS_CLIENT_SECRET = os.getenv('FFLOGS_CLIENT_SECRET')
+    FFLOGS_TOKEN_URL = os.getenv('FFLOGS_TOKEN_URL', 'https://www.fflogs.com/oauth/token')
+    FFLOGS_API_URL = os.getenv('FFLOGS_API_URL', 'https://www.fflogs.com/api/v2/client')
+    FFLOGS_BATCH_SIZE = int(os.getenv('FFLOGS_BATCH_SIZE', 25))  # Characters per GraphQL query
+    FFLOGS_CACHE_SECONDS = int(os.getenv('FFLOGS_CACHE_SECONDS', 6 * 3600))  # Rankings per character and encounter
+    FFLOGS_POINTS_RESERVE = int(os.getenv('FFLOGS_POINTS_RESERVE', 100))  # Hourly API points left unspent
+    FFLOGS_READ_TIMEOUT = float(os.getenv('FFLOGS_READ_TIMEOUT', 15))
+    FFLOGS_RETRIES = int(os.getenv('FFLOGS_RETRIES', 2))  # For connection errors, timeouts and 5xx
+    FFLOGS_PROGRESSION_INTERVAL_SECONDS = int(os.getenv('FFLOGS_PROGRESSION_INTERVAL_SECONDS', 24 * 3600))  # 0 disables
     XIVAPI_KEY = os.getenv('XIVAPI_KEY')
     
+    # Lodestone scraping
+    LODESTONE_BASE_URL = os.getenv('LODESTONE_BASE_URL', 'https://na.finalfantasyxiv.com/lodestone/character')
+    LODESTONE_POOL_SIZE = int(os.getenv('LODESTONE_POOL_SIZE', 10))  # Keep-alive connections per worker
+    LODESTONE_CONNECT_TIMEOUT = float(os.getenv('LODESTONE_CONNECT_TIMEOUT', 3.05))
+    LODESTONE_READ_TIMEOUT = float(os.getenv('LODESTONE_READ_TIMEOUT', 10))
+    LODESTONE_RETRIES = int(os.getenv('LODESTONE_RETRIES', 3))  # For connection errors, timeouts, 429 and 5xx
+    LODESTONE_RETRY_BACKOFF = float(os.getenv('LODESTONE_RETRY_BACKOFF', 0.5))  # Jittered, doubling per retry
+    LODESTONE_CACHE_FRESH_SECONDS = int(os.getenv('LODESTONE_CACHE_FRESH_SECONDS', 3600))  # Reuse, then revalidate
+    LODESTONE_CACHE_RETENTION_SECONDS = int(os.getenv('LODESTONE_CACHE_RETENTION_SECONDS', 7 * 24 * 3600))
+    LODESTONE_FRONT_CACHE_SECONDS = int(os.getenv('LODESTONE_FRONT_CACHE_SECONDS', 60))  # Per-process copies
+    LODESTONE_FRONT_CACHE_ENTRIES = int(os.getenv('LODESTONE_FRONT_CACHE_ENTRIES', 1024))
+    LODESTONE_BREAKER_FAILURE_RATE = float(os.getenv('LODESTONE_BREAKER_FAILURE_RATE', 0.5))  # Opens at this failure rate
+    LODESTONE_BREAKER_MIN_CALLS = int(os.getenv('LODESTONE_BREAKER_MIN_CALLS', 5))  # ...over at least this many calls
+    LODESTONE_BREAKER_WINDOW_SECONDS = int(os.getenv('LODESTONE_BREAKER_WINDOW_SECONDS', 60))  # ...in this window
+    LODESTONE_BREAKER_OPEN_SECONDS = int(os.getenv('LODESTONE_BREAKER_OPEN_SECONDS', 30))  # Fail fast, then probe
+    LODESTONE_FETCH_LOCK_SECONDS = int(os.getenv('LODESTONE_FETCH_LOCK_SECONDS', 10))  # Cross-worker fetch lock; 0 disables
+    LODESTONE_HTML_PARSER = os.getenv('LODESTONE_HTML_PARSER') or None  # lxml or html.parser; default lxml if installed
+    LODESTONE_REFRESH_BATCH_SIZE = int(os.getenv('LODESTONE_REFRESH_BATCH_SIZE', 100))  # Users per bulk write / checkpoint
+    LODESTONE_REFRESH_CONCURRENCY = int(os.getenv('LODESTONE_REFRESH_CONCURRENCY', 4))  # Pages in flight at once
+    LODESTONE_REFRESH_RATE = float(os.getenv('LODESTONE_REFRESH_RATE', 2))  # Page requests per second, all threads
+    LODESTONE_REFRESH_PROCESSES = int(os.getenv('LODESTONE_REFRESH_PROCESSES', 2))  # Parser processes; 0 parses inline
+    LODESTONE_REFRESH_INTERVAL_SECONDS = int(os.getenv('LODESTONE_REFRESH_INTERVAL_SECONDS', 24 * 3600))  # 0 disables
+    
+    # Internal /metrics endpoint: disabled (404) unless set, then requires Authorization: Bearer <token>
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    
     # URLs
     API_BASE_URL = os.getenv('API_BASE_URL', 'http://localhost:5000')
     FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:3000')
+    
+    # Background jobs
+    JOB_WORKER_ENABLED = os.getenv('JOB_WORKER_ENABLED', 'false').lower() == 'true'  # Run workers inside the web process
+    JOB_WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', 2))
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))  # Seconds between polls when idle
+    JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 300))
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+    JOB_RETRY_BACKOFF_SECONDS = int(os.getenv('JOB_RETRY_BACKOFF_SECONDS', 10))
+    JOB_RETRY_BACKOFF_MAX_SECONDS = int(os.getenv('JOB_RETRY_BACKOFF_MAX_SECONDS', 3600))
+    JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', 7 * 24 * 3600))  # Keep finished jobs for a week
+    # Without in-process workers, run a request's jobs in that request. On by
+    # default only on Vercel (which sets VERCEL=1), where no worker can run
+    JOB_RUN_INLINE = os.getenv('JOB_RUN_INLINE', 'true' if os.getenv('VERCEL') else 'false').lower() == 'true'
+    CRON_SECRET = os.getenv('CRON_SECRET')  # Bearer secret for GET /api/jobs/run; unset disables it
+    JOB_CRON_MAX_JOBS = int(os.getenv('JOB_CRON_MAX_JOBS', 20))  # Jobs run per /api/jobs/run call
+    JOB_CRON_MAX_SECONDS = int(os.getenv('JOB_CRON_MAX_SECONDS', 45))  # No job is started after this; keep under the function timeout
+
+    # Response compression
+    COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))  # Bytes; smaller bodies are sent as-is
+    COMPRESSION_MIMETYPES = ['application/json']
+    COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5))  # Used when brotli is installed
+    COMPRESSION_CACHE_ENTRIES = int(os.getenv('COMPRESSION_CACHE_ENTRIES', 512))
+    COMPRESSION_CACHE_BYTES = int(os.getenv('COMPRESSION_CACHE_BYTES', 16 * 1024 * 1024))
+
+    # Cache: in-process LRU in front of an optional shared Redis backend
+    CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'true').lower() == 'true'
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')  # e.g. redis://localhost:6379/0; unset to cache in-process only
+    CACHE_KEY_PREFIX = os.getenv('CACHE_KEY_PREFIX', 'sh')
+    CACHE_TTLS = {  # Seconds per namespace
+        'listings': int(os.getenv('CACHE_TTL_LISTINGS', 30)),  # Anonymous listing and search pages
+        'users': int(os.getenv('CACHE_TTL_USERS', 300)),  # Owner summaries embedded in listings
+        'recommendations': int(os.getenv('CACHE_TTL_RECOMMENDATIONS', 120)),
+        'facets': int(os.getenv('CACHE_TTL_FACETS', 60))  # Listing search facet counts
+    }
+    CACHE_DEFAULT_TTL = 60
+    CACHE_LOCAL_TTL = float(os.getenv('CACHE_LOCAL_TTL', 5))  # Max age of a worker's local copy
+    CACHE_VERSION_TTL = float(os.getenv('CACHE_VERSION_TTL', 1))  # How long a worker trusts its namespace versions
+    CACHE_LOCK_SECONDS = 10  # Max wait for another worker recomputing the same key
+    CACHE_LOCAL_ENTRIES = int(os.getenv('CACHE_LOCAL_ENTRIES', 2048))
+    CACHE_LOCAL_BYTES = int(os.getenv('CACHE_LOCAL_BYTES', 64 * 1024 * 1024))
+
+    # Listing full-text search index
+    SEARCH_INDEX_SYNC_SECONDS = float(os.getenv('SEARCH_INDEX_SYNC_SECONDS', 5))  # Pick up other workers' writes
+    SEARCH_INDEX_REBUILD_SECONDS = int(os.getenv('SEARCH_INDEX_REBUILD_SECONDS', 600))  # Drop deleted listings
+    NAME_SEARCH_MIN_SIMILARITY = float(os.getenv('NAME_SEARCH_MIN_SIMILARITY', 0.25))  # Fuzzy name= cut-off (0-1)
+    SEARCH_CANDIDATE_MARGIN = int(os.getenv('SEARCH_CANDIDATE_MARGIN', 100))  # Extra q= matches read past the page, for hidden listings
+    NAME_SEARCH_MAX_CANDIDATES = int(os.getenv('NAME_SEARCH_MAX_CANDIDATES', 500))  # Users scored per name= query
+    SCHEDULE_REFRESH_INTERVAL_SECONDS = int(os.getenv('SCHEDULE_REFRESH_INTERVAL_SECONDS', 24 * 3600))  # Follow DST changes; 0 disables
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -43,6 +127,12 @@ class TestingConfig(Config):
     DEBUG = True
     TESTING = True
     MONGO_URI = 'mongodb://localhost:27017/ffxiv_recruitment_test'
+    JOB_WORKER_ENABLED = False
+    JOB_RUN_INLINE = False  # Tests run jobs with JobQueue.run_pending()
+    CRON_SECRET = 'test-cron-secret'
+    CACHE_ENABLED = False  # Tests write to the database directly
+    SEARCH_INDEX_SYNC_SECONDS = 0
+    METRICS_TOKEN = 'test-metrics-token'
 
 config = {
     'development': DevelopmentConfig,
@@ -1,3 +1,4 @@
+import hmac
 from functools import wraps
 from flask import request, jsonify, current_app
 import jwt
@@ -72,4 +73,29 @@ def optional_token(f):
         kwargs['current_user'] = current_user
         return f(*args, **kwargs)
     
-    return decorated
\ No newline at end of file
+    return decorated
+
+
+def secret_required(config_key):
+    """
+    Decorator for internal routes called with a shared secret instead of a user token
+
+    The route answers 404 while config_key is unset (the default), and 401
+    unless the request sends Authorization: Bearer <secret>.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            secret = current_app.config.get(config_key)
+            if not secret:
+                return jsonify({'message': 'Not found'}), 404
+            
+            auth_header = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(auth_header.encode('utf-8'), f'Bearer {secret}'.encode('utf-8')):
+                return jsonify({'message': 'Invalid or missing secret'}), 401
+            
+            return f(*args, **kwargs)
+        
+        return decorated
+    
+    return decorator
@@ -0,0 +1,82 @@
+import gzip
+import hashlib
+from flask import current_app, request
+from app.utils.cache import LRUCache
+
+try:
+    import brotli
+except ImportError:  # optional dependency, gzip only
+    brotli = None
+
+# Content codings in server preference order
+CONTENT_CODINGS = ('br', 'gzip')
+
+# Compressed bodies of anonymous responses, keyed by (ETag or body digest, coding)
+compressed_cache = LRUCache()
+
+
+def available_codings():
+    """Content codings this process can produce"""
+    return [coding for coding in CONTENT_CODINGS if coding != 'br' or brotli is not None]
+
+
+def compress(body, coding):
+    """Compress a response body with the given content coding"""
+    config = current_app.config
+    if coding == 'br':
+        return brotli.compress(body, quality=config['COMPRESSION_BROTLI_QUALITY'])
+    return gzip.compress(body, compresslevel=config['COMPRESSION_GZIP_LEVEL'], mtime=0)
+
+
+def compress_response(response):
+    """
+    Compress eligible responses with the client's preferred coding
+
+    Only complete 200 responses of a compressible mimetype at least
+    COMPRESSION_MIN_SIZE bytes long are compressed. Anonymous responses are
+    cached compressed, so a hot listing page is compressed once rather than
+    on every request.
+    """
+    config = current_app.config
+    if (not config['COMPRESSION_ENABLED']
+            or response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or response.mimetype not in config['COMPRESSION_MIMETYPES']
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    coding = request.accept_encodings.best_match(available_codings())
+    if coding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < config['COMPRESSION_MIN_SIZE']:
+        return response
+
+    etag, weak = response.get_etag()
+    if 'Authorization' in request.headers:
+        compressed = compress(body, coding)
+    else:
+        key = (etag or hashlib.blake2b(body, digest_size=16).digest(), coding)
+        compressed = compressed_cache.get(key)
+        if compressed is None:
+            compressed = compress(body, coding)
+            compressed_cache.set(key, compressed)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = coding
+    if etag:
+        # The compressed bytes are a different representation; not_modified()
+        # accepts the suffixed tag back in If-None-Match
+        response.set_etag(f'{etag}-{coding}', weak)
+    return response
+
+
+def init_compression(app):
+    """Register response compression and size the compressed cache from config"""
+    compressed_cache.max_entries = app.config['COMPRESSION_CACHE_ENTRIES']
+    compressed_cache.max_bytes = app.config['COMPRESSION_CACHE_BYTES']
+    app.after_request(compress_response)
@@ -1,10 +1,40 @@
 from datetime import datetime
-from bson import ObjectId
+from app.models.serializers import Field, compile_serializer, isoformat
+
+def _application_spec(convert_date):
+    """Response fields of an application, in output order"""
+    return (
+        Field('id', '_id', convert=str),
+        Field('listing_id', 'listing_id', convert=str),
+        Field('applicant_id', 'applicant_id', convert=str),
+        Field('status', 'status', 'pending'),
+        Field('message', 'message', ''),
+        Field('availability', 'availability', []),
+        Field('preferred_roles', 'preferred_roles', []),
+        Field('experience', 'experience', ''),
+        Field('created_at', 'created_at', convert=convert_date),
+        Field('updated_at', 'updated_at', convert=convert_date)
+    )
 
 class Application:
     """Application model for listing applications"""
     
+    __slots__ = (
+        '_id', 'listing_id', 'applicant_id', 'status', 'message', 'availability',
+        'preferred_roles', 'experience', 'created_at', 'updated_at', 'applicant', 'listing'
+    )
+    
+    # Response fields for list views, and the Mongo projection that feeds them
+    SUMMARY_FIELDS = (
+        'id', 'listing_id', 'applicant_id', 'status', 'preferred_roles', 'created_at', 'updated_at'
+    )
+    SUMMARY_PROJECTION = {
+        'listing_id': 1, 'applicant_id': 1, 'status': 1, 'preferred_roles': 1,
+        'created_at': 1, 'updated_at': 1
+    }
+    
     def __init__(self, listing_id, applicant_id, **kwargs):
+        self._id = kwargs.get('_id')
         self.listing_id = listing_id
         self.applicant_id = applicant_id
         self.status = kwargs.get('status', 'pending')  # pending, accepted, rejected
@@ -14,31 +44,28 @@ class Application:
         self.experience = kwargs.get('experience', '')
         self.created_at = kwargs.get('created_at', datetime.utcnow())
         self.updated_at = kwargs.get('updated_at', datetime.utcnow())
+        self.applicant = kwargs.get('applicant')
+        self.listing = kwargs.get('listing')
     
-    def to_dict(self, include_details=False):
-        """Convert application to dictionary"""
-        app_dict = {
-            'id': str(self._id) if hasattr(self, '_id') else None,
-            'listing_id': str(self.listing_id),
-            'applicant_id': str(self.applicant_id),
-            'status': self.status,
-            'message': self.message,
-            'availability': self.availability,
-            'preferred_roles': self.preferred_roles,
-            'experience': self.experience,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
+    def to_dict(self, include_details=False, fields=None):
+        """Convert application to dictionary, optionally limited to the given fields"""
+        app_dict = _application_to_dict(self, fields)
         
         if include_details:
-            if hasattr(self, 'applicant'):
+            if self.applicant is not None and (fields is None or 'applicant' in fields):
                 app_dict['applicant'] = self.applicant
-            if hasattr(self, 'listing'):
+            if self.listing is not None and (fields is None or 'listing' in fields):
                 app_dict['listing'] = self.listing
         
-        return {k: v for k, v in app_dict.items() if v is not None}
+        return app_dict
+    
+    # serialize(doc, fields=None): Mongo document straight to a response
+    # dict, without building an Application. Datetimes are left to the JSON provider.
+    serialize = staticmethod(compile_serializer('serialize_application', _application_spec(None)))
     
     @classmethod
     def from_dict(cls, data):
         """Create Application instance from dictionary"""
-        return cls(**data)
\ No newline at end of file
+        return cls(**data)
+
+_application_to_dict = compile_serializer('application_to_dict', _application_spec(isoformat), from_attrs=True)
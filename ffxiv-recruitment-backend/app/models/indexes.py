@@ -0,0 +1,61 @@
+"""MongoDB index definitions, applied with `flask create-indexes`"""
+from pymongo import ASCENDING, DESCENDING
+
+# collection name -> [(keys, options), ...]
+INDEXES = {
+    'listings': [
+        # my-listings: owner's listings newest first, (created_at, _id) cursor
+        ([('owner_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)], {}),
+        # Search index sync: listings changed since the last one seen
+        ([('updated_at', ASCENDING)], {}),
+        # Listing search filters and facets (roles_needed_keys is multikey)
+        ([('state', ASCENDING), ('data_center', ASCENDING), ('created_at', DESCENDING)], {}),
+        ([('state', ASCENDING), ('roles_needed_keys', ASCENDING)], {}),
+        # available= overlap queries on UTC hour-of-week buckets (multikey)
+        ([('state', ASCENDING), ('schedule_hours', ASCENDING)], {})
+    ],
+    'users': [
+        # Fuzzy name= player search (multikey)
+        ([('name_trigrams', ASCENDING)], {}),
+        # Player search filters on normalized keys (role_keys is multikey)
+        ([('data_center_key', ASCENDING), ('role_keys', ASCENDING)], {}),
+        ([('server_key', ASCENDING), ('role_keys', ASCENDING)], {}),
+        ([('role_keys', ASCENDING)], {}),
+        ([('schedule_hours', ASCENDING)], {}),
+        # job=&min_level= filters: $elemMatch on {j, l} entries (multikey)
+        ([('job_levels.j', ASCENDING), ('job_levels.l', ASCENDING)], {}),
+        # cleared= filter and listing requirements.progression (multikey)
+        ([('progression_clears', ASCENDING)], {})
+    ],
+    'applications': [
+        # my-applications: applicant's applications newest first
+        ([('applicant_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)], {})
+    ],
+    'lodestone_cache': [
+        # Characters not fetched for LODESTONE_CACHE_RETENTION_SECONDS are removed
+        ([('expires_at', ASCENDING)], {'expireAfterSeconds': 0})
+    ],
+    'fflogs_cache': [
+        # Rankings older than FFLOGS_CACHE_SECONDS are removed
+        ([('expires_at', ASCENDING)], {'expireAfterSeconds': 0})
+    ],
+    'locks': [
+        # Short-lived locks (e.g. one Lodestone fetch per character across workers)
+        ([('expires_at', ASCENDING)], {'expireAfterSeconds': 0})
+    ],
+    'jobs': [
+        ([('status', ASCENDING), ('run_at', ASCENDING)], {}),
+        ([('user_id', ASCENDING), ('created_at', ASCENDING)], {}),
+        # Finished jobs are removed once their retention period is over
+        ([('expires_at', ASCENDING)], {'expireAfterSeconds': 0})
+    ]
+}
+
+
+def ensure_indexes(db):
+    """Create every index in INDEXES (no-op for ones that already exist)"""
+    created = []
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            created.append(f'{collection}.{db[collection].create_index(keys, **options)}')
+    return created
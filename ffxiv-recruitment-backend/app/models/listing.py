@@ -1,5 +1,7 @@
 from datetime import datetime
-from bson import ObjectId
+from app.models.serializers import Field, compile_serializer, isoformat
+from app.utils.schedule import parse_schedule
+from app.utils.validators import normalize_key
 
 class ListingState:
     """Base class for listing states"""
@@ -46,10 +48,56 @@ STATE_MAP = {
     'filled': FilledState()
 }
 
+# can_apply/can_edit per state name, so serializers need no state objects
+CAN_APPLY = {name: state.can_apply() for name, state in STATE_MAP.items()}
+CAN_EDIT = {name: state.can_edit() for name, state in STATE_MAP.items()}
+
+def _listing_spec(convert_date):
+    """Response fields of a listing, in output order"""
+    return (
+        Field('id', '_id', convert=str),
+        Field('title', 'title'),
+        Field('description', 'description'),
+        Field('owner_id', 'owner_id', convert=str),
+        Field('content_type', 'content_type'),
+        Field('content_name', 'content_name'),
+        Field('data_center', 'data_center'),
+        Field('server', 'server'),
+        Field('roles_needed', 'roles_needed', {}),
+        Field('schedule', 'schedule', []),
+        Field('requirements', 'requirements', {}),
+        Field('voice_chat', 'voice_chat'),
+        Field('additional_info', 'additional_info', ''),
+        Field('state', 'state', 'private'),
+        # Unknown states behave like PrivateState
+        Field('can_apply', 'state', 'private', lambda state: CAN_APPLY.get(state, False)),
+        Field('can_edit', 'state', 'private', lambda state: CAN_EDIT.get(state, True)),
+        Field('application_count', 'application_count', 0),
+        Field('created_at', 'created_at', convert=convert_date),
+        Field('updated_at', 'updated_at', convert=convert_date)
+    )
+
+# Fields Listing.search_fields is computed from
+SEARCH_FIELD_SOURCES = ('roles_needed', 'schedule')
+
 class Listing:
     """Recruitment listing model with state pattern"""
     
+    __slots__ = (
+        '_id', 'title', 'description', 'owner_id', 'content_type', 'content_name',
+        'data_center', 'server', 'roles_needed', 'schedule', 'requirements',
+        'voice_chat', 'additional_info', 'state', 'created_at', 'updated_at',
+        'application_count', 'owner'
+    )
+    
+    # Response fields for list views
+    SUMMARY_FIELDS = (
+        'id', 'title', 'content_type', 'content_name', 'data_center', 'server',
+        'state', 'can_apply', 'can_edit', 'application_count', 'created_at', 'updated_at'
+    )
+    
     def __init__(self, title, description, owner_id, **kwargs):
+        self._id = kwargs.get('_id')
         self.title = title
         self.description = description
         self.owner_id = owner_id
@@ -66,6 +114,7 @@ class Listing:
         self.created_at = kwargs.get('created_at', datetime.utcnow())
         self.updated_at = kwargs.get('updated_at', datetime.utcnow())
         self.application_count = kwargs.get('application_count', 0)
+        self.owner = kwargs.get('owner')
     
     def get_state(self):
         """Get the state object"""
@@ -87,36 +136,43 @@ class Listing:
             return True
         return False
     
-    def to_dict(self, include_owner_details=False):
-        """Convert listing to dictionary"""
-        listing_dict = {
-            'id': str(self._id) if hasattr(self, '_id') else None,
-            'title': self.title,
-            'description': self.description,
-            'owner_id': str(self.owner_id),
-            'content_type': self.content_type,
-            'content_name': self.content_name,
-            'data_center': self.data_center,
-            'server': self.server,
-            'roles_needed': self.roles_needed,
-            'schedule': self.schedule,
-            'requirements': self.requirements,
-            'voice_chat': self.voice_chat,
-            'additional_info': self.additional_info,
-            'state': self.state,
-            'can_apply': self.can_apply(),
-            'can_edit': self.can_edit(),
-            'application_count': self.application_count,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
+    def to_dict(self, include_owner_details=False, fields=None):
+        """Convert listing to dictionary, optionally limited to the given fields"""
+        listing_dict = _listing_to_dict(self, fields)
         
-        if include_owner_details and hasattr(self, 'owner'):
+        if include_owner_details and self.owner is not None and (fields is None or 'owner' in fields):
             listing_dict['owner'] = self.owner
         
-        return {k: v for k, v in listing_dict.items() if v is not None}
+        return listing_dict
+    
+    # serialize(doc, fields=None): Mongo document straight to a response
+    # dict, without building a Listing. Datetimes are left to the JSON provider.
+    serialize = staticmethod(compile_serializer('serialize_listing', _listing_spec(None)))
+    
+    @staticmethod
+    def search_fields(listing_data):
+        """
+        Derived fields stored on a listing document for search
+        
+        Recompute them whenever a field they depend on is written:
+        roles_needed_keys lists the lowercase roles with open slots, for role
+        filters and facets, and schedule_hours holds the schedule as UTC
+        hour-of-week buckets for available= search.
+        """
+        roles_needed = listing_data.get('roles_needed') or {}
+        role_keys = (
+            normalize_key(role) for role, count in roles_needed.items()
+            if isinstance(count, (int, float)) and count > 0
+        )
+        return {
+            'roles_needed_keys': [key for key in dict.fromkeys(role_keys) if key],
+            'schedule_hours': parse_schedule(listing_data.get('schedule'))
+        }
     
     @classmethod
     def from_dict(cls, data):
-        """Create Listing instance from dictionary"""
-        return cls(**data)
\ No newline at end of file
+        """Create Listing instance from dictionary (which may be a partial projection)"""
+        data = dict(data)
+        return cls(data.pop('title', None), data.pop('description', None), data.pop('owner_id', None), **data)
+
+_listing_to_dict = compile_serializer('listing_to_dict', _listing_spec(isoformat), from_attrs=True)
@@ -0,0 +1,77 @@
+from collections import namedtuple
+
+# key: response key
+# source: document key / model attribute it is read from
+# default: literal used when the document has no value (rendered into the
+#          generated code, so mutable defaults are fresh for every call)
+# convert: optional callable applied to non-None values
+# sensitive: only emitted when the serializer is called with sensitive=True
+Field = namedtuple('Field', 'key source default convert sensitive', defaults=(None, None, False))
+
+
+def isoformat(value):
+    """Datetime conversion for to_dict(); serialize() leaves datetimes to the JSON provider"""
+    return value.isoformat()
+
+
+def compile_serializer(name, spec, from_attrs=False, keep_none_if_sensitive=False):
+    """
+    Generate a serializer function for a model once, at import time
+
+    The generated function is straight-line code with one block per field,
+    so converting a document allocates nothing but the output dict:
+
+        def serialize(src, fields=None, sensitive=False):
+            out = {}
+            if fields is None or 'title' in fields:
+                v = src.get('title')
+                if v is not None:
+                    out['title'] = v
+            ...
+            return out
+
+    Args:
+        name: Function name, used in tracebacks
+        spec: Sequence of Field
+        from_attrs: Read model attributes (src.title) instead of document
+            keys (src.get('title'))
+        keep_none_if_sensitive: Emit None values when sensitive=True
+
+    Returns:
+        serialize(src, fields=None, sensitive=False) -> dict
+    """
+    namespace = {}
+    lines = [f'def {name}(src, fields=None, sensitive=False):', '    out = {}']
+
+    for i, field in enumerate(spec):
+        condition = f'(fields is None or {field.key!r} in fields)'
+        if field.sensitive:
+            condition = f'sensitive and {condition}'
+        lines.append(f'    if {condition}:')
+
+        if from_attrs:
+            lines.append(f'        v = src.{field.source}')
+        else:
+            lines.append(f'        v = src.get({field.source!r})')
+            if field.default is not None:
+                lines.append('        if v is None:')
+                lines.append(f'            v = {field.default!r}')
+
+        value = 'v'
+        if field.convert is not None:
+            namespace[f'_convert{i}'] = field.convert
+            value = f'_convert{i}(v)'
+
+        if keep_none_if_sensitive:
+            lines.append('        if v is not None:')
+            lines.append(f'            out[{field.key!r}] = {value}')
+            lines.append('        elif sensitive:')
+            lines.append(f'            out[{field.key!r}] = None')
+        else:
+            lines.append('        if v is not None:')
+            lines.append(f'            out[{field.key!r}] = {value}')
+
+    lines.append('    return out')
+
+    exec('\n'.join(lines), namespace)
+    return namespace[name]
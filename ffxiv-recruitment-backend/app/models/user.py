@@ -1,11 +1,45 @@
 from datetime import datetime
-from bson import ObjectId
 import bcrypt
+from app.models.serializers import Field, compile_serializer, isoformat
+from app.utils.schedule import parse_schedule
+from app.utils.trigrams import name_trigrams
+from app.utils.validators import normalize_key
+
+def _user_spec(convert_date):
+    """Response fields of a user, in output order"""
+    return (
+        Field('id', '_id', convert=str),
+        Field('username', 'username'),
+        Field('email', 'email', sensitive=True),
+        Field('character_name', 'character_name'),
+        Field('server', 'server'),
+        Field('data_center', 'data_center'),
+        Field('lodestone_id', 'lodestone_id'),
+        Field('fflogs_id', 'fflogs_id'),
+        Field('bio', 'bio', ''),
+        Field('availability', 'availability', []),
+        Field('roles', 'roles', []),
+        Field('job_levels', 'job_levels', []),
+        Field('progression', 'progression', {}),
+        Field('created_at', 'created_at', convert=convert_date),
+        Field('updated_at', 'updated_at', convert=convert_date)
+    )
+
+# Fields User.search_fields is computed from, and the fields it returns
+SEARCH_FIELD_SOURCES = ('username', 'character_name', 'server', 'data_center', 'roles', 'availability')
+SEARCH_FIELDS = ('name_trigrams', 'server_key', 'data_center_key', 'role_keys', 'schedule_hours')
 
 class User:
     """User model for authentication and profile data"""
     
+    __slots__ = (
+        '_id', 'username', 'email', 'password_hash', 'character_name', 'server',
+        'data_center', 'lodestone_id', 'fflogs_id', 'bio', 'availability', 'roles',
+        'job_levels', 'progression', 'created_at', 'updated_at'
+    )
+    
     def __init__(self, username, email, password_hash, **kwargs):
+        self._id = kwargs.get('_id')
         self.username = username
         self.email = email
         self.password_hash = password_hash
@@ -17,29 +51,22 @@ class User:
         self.bio = kwargs.get('bio', '')
         self.availability = kwargs.get('availability', [])
         self.roles = kwargs.get('roles', [])  # Tank, Healer, DPS
-        self.progression = kwargs.get('progression', {})
+        self.job_levels = kwargs.get('job_levels', [])  # [{'j': 'WAR', 'l': 100}], from the Lodestone
+        self.progression = kwargs.get('progression', {})  # {'P9S': {'kills', 'best_percent', ...}}, from FFLogs
         self.created_at = kwargs.get('created_at', datetime.utcnow())
         self.updated_at = kwargs.get('updated_at', datetime.utcnow())
     
-    def to_dict(self, include_sensitive=False):
-        """Convert user to dictionary"""
-        user_dict = {
-            'id': str(self._id) if hasattr(self, '_id') else None,
-            'username': self.username,
-            'email': self.email if include_sensitive else None,
-            'character_name': self.character_name,
-            'server': self.server,
-            'data_center': self.data_center,
-            'lodestone_id': self.lodestone_id,
-            'fflogs_id': self.fflogs_id,
-            'bio': self.bio,
-            'availability': self.availability,
-            'roles': self.roles,
-            'progression': self.progression,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
-        return {k: v for k, v in user_dict.items() if v is not None or include_sensitive}
+    def to_dict(self, include_sensitive=False, fields=None):
+        """
+        Convert user to dictionary, optionally limited to the given fields
+        
+        include_sensitive adds the email and keeps empty (None) fields.
+        """
+        return _user_to_dict(self, fields, include_sensitive)
+    
+    # serialize(doc, fields=None, sensitive=False): Mongo document straight to
+    # a response dict, without building a User. Datetimes are left to the JSON provider.
+    serialize = staticmethod(compile_serializer('serialize_user', _user_spec(None), keep_none_if_sensitive=True))
     
     @staticmethod
     def hash_password(password):
@@ -51,7 +78,30 @@ class User:
         """Verify a password against its hash"""
         return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
     
+    @staticmethod
+    def search_fields(user_data):
+        """
+        Derived fields stored on a user document for player search
+        
+        Recompute them whenever a field they depend on is written:
+        name_trigrams indexes username and character_name for fuzzy name= search,
+        the *_key fields hold lowercase server, data center and roles for
+        exact, index-backed filters, and schedule_hours holds availability as
+        UTC hour-of-week buckets for available= search.
+        """
+        role_keys = (normalize_key(role) for role in user_data.get('roles') or [])
+        return {
+            'name_trigrams': name_trigrams(user_data.get('username'), user_data.get('character_name')),
+            'server_key': normalize_key(user_data.get('server')),
+            'data_center_key': normalize_key(user_data.get('data_center')),
+            'role_keys': [key for key in dict.fromkeys(role_keys) if key],
+            'schedule_hours': parse_schedule(user_data.get('availability'))
+        }
+    
     @classmethod
     def from_dict(cls, data):
-        """Create User instance from dictionary"""
-        return cls(**data)
\ No newline at end of file
+        """Create User instance from dictionary (which may be a partial projection)"""
+        data = dict(data)
+        return cls(data.pop('username', None), data.pop('email', None), data.pop('password_hash', None), **data)
+
+_user_to_dict = compile_serializer('user_to_dict', _user_spec(isoformat), from_attrs=True, keep_none_if_sensitive=True)
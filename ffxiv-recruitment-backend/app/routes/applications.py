@@ -1,11 +1,15 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from app import get_db
 from app.models.application import Application
 from app.models.listing import Listing
 from app.models.user import User
 from app.middleware.auth_middleware import token_required
+from app.utils.constants import APPLICATION_STATUSES, MAX_BULK_STATUS_UPDATES
+from app.utils.helpers import parse_limit, apply_cursor, cursor_page
 
 bp = Blueprint('applications', __name__)
 
@@ -13,6 +17,7 @@ bp = Blueprint('applications', __name__)
 @bp.route('/', methods=['OPTIONS'])
 @bp.route('/<application_id>', methods=['OPTIONS'])
 @bp.route('/<application_id>/status', methods=['OPTIONS'])
+@bp.route('/bulk-status', methods=['OPTIONS'])
 def handle_options(application_id=None):
     """Handle CORS preflight requests"""
     return '', 204
@@ -93,10 +98,7 @@ def create_application(current_user):
         )
         
         # Create application object
-        application = Application.from_dict(application_data)
-        application._id = result.inserted_id
-        
-        return jsonify(application.to_dict()), 201
+        return jsonify(Application.serialize(application_data)), 201
         
     except Exception as e:
         return jsonify({'message': f'Failed to create application: {str(e)}'}), 500
@@ -104,21 +106,53 @@ def create_application(current_user):
 @bp.route('/', methods=['GET'])
 @token_required
 def get_my_applications(current_user):
-    """Get all applications by current user"""
+    """
+    Get applications by current user, newest first
+    
+    Query Parameters:
+        status: Only applications with this status
+        view: 'summary' to omit message, experience and availability
+        limit: Page size (default 20, max 100)
+        cursor: next_cursor from the previous page
+    """
     try:
-        applications_cursor = get_applications_collection().find(
-            {'applicant_id': ObjectId(current_user['_id'])}
-        ).sort('created_at', -1)
+        query = {'applicant_id': ObjectId(current_user['_id'])}
+        
+        status = request.args.get('status')
+        if status:
+            if status not in APPLICATION_STATUSES:
+                return jsonify({'message': 'Invalid status. Must be pending, accepted, or rejected'}), 400
+            query['status'] = status
+        
+        summary = request.args.get('view') == 'summary'
+        projection = Application.SUMMARY_PROJECTION if summary else None
+        fields = Application.SUMMARY_FIELDS if summary else None
+        
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            query = apply_cursor(query, request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'message': 'Invalid limit or cursor'}), 400
+        
+        applications_page, next_cursor = cursor_page(
+            get_applications_collection().find(query, projection), limit
+        )
+        
+        # Get listing info for the whole page in one query
+        listing_ids = list({app_data['listing_id'] for app_data in applications_page})
+        listings_by_id = {
+            listing['_id']: listing
+            for listing in get_listings_collection().find(
+                {'_id': {'$in': listing_ids}},
+                {'title': 1, 'content_type': 1, 'data_center': 1, 'state': 1}
+            )
+        }
         
         applications = []
-        for app_data in applications_cursor:
-            # Get listing info
-            listing = get_listings_collection().find_one({'_id': app_data['listing_id']})
-            
-            application = Application.from_dict(app_data)
-            application._id = app_data['_id']
+        for app_data in applications_page:
+            listing = listings_by_id.get(app_data['listing_id'])
             
-            app_dict = application.to_dict()
+            app_dict = Application.serialize(app_data, fields=fields)
             if listing:
                 app_dict['listing'] = {
                     'id': str(listing['_id']),
@@ -130,7 +164,11 @@ def get_my_applications(current_user):
             
             applications.append(app_dict)
         
-        return jsonify({'applications': applications}), 200
+        return jsonify({
+            'applications': applications,
+            'limit': limit,
+            'next_cursor': next_cursor
+        }), 200
         
     except Exception as e:
         return jsonify({'message': f'Failed to get applications: {str(e)}'}), 500
@@ -163,10 +201,7 @@ def get_listing_applications(listing_id, current_user):
             # Get applicant info
             applicant = get_users_collection().find_one({'_id': app_data['applicant_id']})
             
-            application = Application.from_dict(app_data)
-            application._id = app_data['_id']
-            
-            app_dict = application.to_dict()
+            app_dict = Application.serialize(app_data)
             if applicant:
                 app_dict['applicant'] = {
                     'id': str(applicant['_id']),
@@ -208,10 +243,7 @@ def get_application(application_id, current_user):
         # Get applicant and listing info
         applicant = get_users_collection().find_one({'_id': app_data['applicant_id']})
         
-        application = Application.from_dict(app_data)
-        application._id = app_data['_id']
-        
-        app_dict = application.to_dict()
+        app_dict = Application.serialize(app_data)
         
         if applicant:
             app_dict['applicant'] = {
@@ -273,14 +305,116 @@ def update_application_status(application_id, current_user):
         
         # Get updated application
         updated_app_data = get_applications_collection().find_one({'_id': ObjectId(application_id)})
-        application = Application.from_dict(updated_app_data)
-        application._id = updated_app_data['_id']
-        
-        return jsonify(application.to_dict()), 200
+        return jsonify(Application.serialize(updated_app_data)), 200
         
     except Exception as e:
         return jsonify({'message': f'Failed to update application status: {str(e)}'}), 500
 
+@bp.route('/bulk-status', methods=['PATCH'])
+@token_required
+def bulk_update_application_status(current_user):
+    """
+    Update the status of many applications at once (listing owner only)
+    
+    Body:
+        updates: [{"id": <application_id>, "status": "accepted"}, ...]
+    
+    Uses at most three database round trips regardless of batch size:
+    one $in lookup for the applications, one $in ownership check on their
+    listings and one unordered bulk_write.
+    """
+    try:
+        data = request.get_json()
+        updates = data.get('updates') if isinstance(data, dict) else None
+        
+        if not isinstance(updates, list) or not updates:
+            return jsonify({'message': 'updates must be a non-empty list'}), 400
+        
+        if len(updates) > MAX_BULK_STATUS_UPDATES:
+            return jsonify({'message': f'Cannot update more than {MAX_BULK_STATUS_UPDATES} applications at once'}), 400
+        
+        # Validate each item up front; invalid items are reported, not fatal
+        results = []
+        pending = {}
+        for item in updates:
+            item = item if isinstance(item, dict) else {}
+            application_id = str(item.get('id', ''))
+            new_status = item.get('status')
+            result = {'id': application_id}
+            results.append(result)
+            
+            if not ObjectId.is_valid(application_id):
+                result.update(success=False, message='Invalid application ID')
+            elif new_status not in APPLICATION_STATUSES:
+                result.update(success=False, message='Invalid status. Must be pending, accepted, or rejected')
+            elif application_id in pending:
+                result.update(success=False, message='Duplicate application ID')
+            else:
+                pending[application_id] = (result, new_status)
+        
+        if pending:
+            # Round trip 1: the applications themselves
+            app_ids = [ObjectId(app_id) for app_id in pending]
+            apps_by_id = {
+                str(app_data['_id']): app_data
+                for app_data in get_applications_collection().find(
+                    {'_id': {'$in': app_ids}},
+                    {'listing_id': 1}
+                )
+            }
+            
+            # Round trip 2: ownership check for every referenced listing
+            listing_ids = list({app_data['listing_id'] for app_data in apps_by_id.values()})
+            owned_listing_ids = {
+                listing['_id']
+                for listing in get_listings_collection().find(
+                    {'_id': {'$in': listing_ids}, 'owner_id': ObjectId(current_user['_id'])},
+                    {'_id': 1}
+                )
+            }
+            
+            operations = []
+            operation_results = []
+            now = datetime.utcnow()
+            for app_id, (result, new_status) in pending.items():
+                app_data = apps_by_id.get(app_id)
+                if not app_data:
+                    result.update(success=False, message='Application not found')
+                elif app_data['listing_id'] not in owned_listing_ids:
+                    result.update(success=False, message='Unauthorized')
+                else:
+                    operations.append(UpdateOne(
+                        {'_id': app_data['_id'], 'listing_id': app_data['listing_id']},
+                        {'$set': {'status': new_status, 'updated_at': now}}
+                    ))
+                    operation_results.append((result, new_status))
+            
+            # Round trip 3: apply every permitted change in one unordered batch
+            if operations:
+                failed = {}
+                try:
+                    get_applications_collection().bulk_write(operations, ordered=False)
+                except BulkWriteError as e:
+                    failed = {error['index']: error.get('errmsg', 'Write failed')
+                              for error in e.details.get('writeErrors', [])}
+                
+                for index, (result, new_status) in enumerate(operation_results):
+                    if index in failed:
+                        result.update(success=False, message=failed[index])
+                    else:
+                        result.update(success=True, status=new_status, updated_at=now)
+        
+        updated = sum(1 for result in results if result['success'])
+        
+        return jsonify({
+            'results': results,
+            'updated': updated,
+            'failed': len(results) - updated
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Failed to update application statuses: {str(e)}'}), 500
+
 @bp.route('/<application_id>', methods=['DELETE'])
 @token_required
 def delete_application(application_id, current_user):
@@ -5,6 +5,7 @@ from bson import ObjectId
 from app import get_db
 from app.models.user import User
 from app.middleware.auth_middleware import token_required
+from app.utils.validators import validate_location
 from email_validator import validate_email, EmailNotValidError
 
 bp = Blueprint('auth', __name__)
@@ -32,6 +33,12 @@ def register():
         except EmailNotValidError as e:
             return jsonify({'message': str(e)}), 400
         
+        # Validate server and data center
+        try:
+            location = validate_location(data)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
         # Check if user already exists
         if get_users_collection().find_one({'email': email}):
             return jsonify({'message': 'Email already registered'}), 400
@@ -52,6 +59,8 @@ def register():
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow()
         }
+        user_data.update(location)
+        user_data.update(User.search_fields(user_data))
         
         result = get_users_collection().insert_one(user_data)
         user_data['_id'] = result.inserted_id
@@ -63,12 +72,9 @@ def register():
         }, current_app.config['JWT_SECRET_KEY'], algorithm='HS256')
         
         # Create user object for response
-        user = User.from_dict(user_data)
-        user._id = result.inserted_id
-        
         return jsonify({
             'token': token,
-            'user': user.to_dict()
+            'user': User.serialize(user_data)
         }), 201
         
     except Exception as e:
@@ -100,12 +106,9 @@ def login():
         }, current_app.config['JWT_SECRET_KEY'], algorithm='HS256')
         
         # Create user object
-        user = User.from_dict(user_data)
-        user._id = user_data['_id']
-        
         return jsonify({
             'token': token,
-            'user': user.to_dict()
+            'user': User.serialize(user_data)
         }), 200
         
     except Exception as e:
@@ -116,9 +119,7 @@ def login():
 def get_current_user(current_user):
     """Get current user profile"""
     try:
-        user = User.from_dict(current_user)
-        user._id = current_user['_id']
-        return jsonify(user.to_dict(include_sensitive=True)), 200
+        return jsonify(User.serialize(current_user, sensitive=True)), 200
     except Exception as e:
         return jsonify({'message': f'Failed to get user: {str(e)}'}), 500
 
@@ -0,0 +1,46 @@
+from flask import Blueprint, current_app, jsonify
+from app.middleware.auth_middleware import secret_required, token_required
+from app.services.job_queue import JobQueue
+
+bp = Blueprint('jobs', __name__)
+
+# Add OPTIONS handler for CORS preflight
+@bp.route('/<job_id>', methods=['OPTIONS'])
+def handle_options(job_id=None):
+    """Handle CORS preflight requests"""
+    return '', 204
+
+@bp.route('/run', methods=['GET', 'POST'])
+@secret_required('CRON_SECRET')
+def run_jobs():
+    """
+    Run due jobs (for a scheduler such as Vercel Cron, when no worker process runs)
+
+    Runs at most JOB_CRON_MAX_JOBS jobs and starts none after
+    JOB_CRON_MAX_SECONDS.
+    """
+    try:
+        count = JobQueue.run_pending(
+            max_jobs=current_app.config['JOB_CRON_MAX_JOBS'],
+            max_seconds=current_app.config['JOB_CRON_MAX_SECONDS']
+        )
+        return jsonify({'jobs_run': count}), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Failed to run jobs: {str(e)}'}), 500
+
+@bp.route('/<job_id>', methods=['GET'])
+@token_required
+def get_job(job_id, current_user):
+    """Poll the status of a background job (job owner only)"""
+    try:
+        job = JobQueue.get(job_id)
+        
+        # Other users' jobs are reported as missing rather than forbidden
+        if not job or str(job.get('user_id')) != str(current_user['_id']):
+            return jsonify({'message': 'Job not found'}), 404
+        
+        return jsonify(JobQueue.to_dict(job)), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Failed to get job: {str(e)}'}), 500
@@ -4,6 +4,16 @@ from bson import ObjectId
 from app import get_db
 from app.models.listing import Listing
 from app.middleware.auth_middleware import token_required, optional_token
+from app.services.job_queue import JobQueue
+from app.services.search_index import listing_index
+from app.utils.constants import LISTING_STATES
+from app.services.user_summaries import get_user_summaries
+from app.utils.cache import app_cache
+from app.utils.helpers import (
+    job_accepted, parse_limit, apply_cursor, cursor_page, make_etag, not_modified, with_etag,
+    page_cache_key, json_response
+)
+from app.utils.validators import LISTING_FIELDS, parse_fields, wants
 
 bp = Blueprint('listings', __name__)
 
@@ -15,11 +25,52 @@ def get_users_collection():
     """Helper to get users collection"""
     return get_db().users
 
+# Everything a listing response depends on besides its content: updated_at
+# covers edits and state changes, application_count changes without touching
+# updated_at, and state/owner_id decide visibility
+LISTING_VERSION_PROJECTION = {'updated_at': 1, 'application_count': 1, 'state': 1, 'owner_id': 1}
+
+def listing_etag(listings, owners, current_user, **extra):
+    """
+    ETag for a response built from listings and their owners
+
+    The request's query string and the viewer are part of the tag, so
+    different filters, pages, field selections and viewers never share one.
+    """
+    return make_etag(
+        sorted(request.args.items(multi=True)),
+        current_user and str(current_user['_id']),
+        [(str(listing_data['_id']), listing_data.get('updated_at'), listing_data.get('application_count'),
+          listing_data.get('state')) for listing_data in listings],
+        sorted((str(owner_id), owner.get('updated_at')) for owner_id, owner in owners.items()),
+        extra
+    )
+
+def invalidate_listing_caches():
+    """Drop cached listing pages, facet counts and recommendations after a listing write"""
+    app_cache.invalidate('listings')
+    app_cache.invalidate('facets')
+    app_cache.invalidate('recommendations')
+
+def fetch_page(listing_versions, projection):
+    """Load full documents for a page of version rows, keeping the page order"""
+    listing_ids = [listing_data['_id'] for listing_data in listing_versions]
+    listings = {
+        listing_data['_id']: listing_data
+        for listing_data in get_listings_collection().find({'_id': {'$in': listing_ids}}, projection)
+    }
+    return [listings[listing_id] for listing_id in listing_ids if listing_id in listings]
+
 @bp.route('/', methods=['GET'])
 @optional_token
 def get_listings(current_user=None):
     """Get all listings with optional filtering"""
     try:
+        try:
+            fields, projection = parse_fields(request.args.get('fields'), LISTING_FIELDS)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
         # Build filter query
         query = {}
         
@@ -58,36 +109,67 @@ def get_listings(current_user=None):
         per_page = int(request.args.get('per_page', 20))
         skip = (page - 1) * per_page
         
-        # Get listings
-        listings_cursor = get_listings_collection().find(query).sort('created_at', -1).skip(skip).limit(per_page)
-        total = get_listings_collection().count_documents(query)
-        
-        listings = []
-        for listing_data in listings_cursor:
-            # Get owner info
-            owner = get_users_collection().find_one({'_id': listing_data['owner_id']})
-            
-            listing = Listing.from_dict(listing_data)
-            listing._id = listing_data['_id']
+        def load_page():
+            # Page through version fields only, so a client that already has
+            # the page gets its 304 without the full documents being read
+            listing_versions = list(
+                get_listings_collection().find(query, LISTING_VERSION_PROJECTION)
+                .sort('created_at', -1).skip(skip).limit(per_page)
+            )
+            total = get_listings_collection().count_documents(query)
             
-            listing_dict = listing.to_dict()
-            if owner:
-                listing_dict['owner'] = {
-                    'id': str(owner['_id']),
-                    'username': owner['username'],
-                    'character_name': owner.get('character_name'),
-                    'server': owner.get('server')
-                }
+            # Get owner info for the whole page at once
+            owners = {}
+            if wants(fields, 'owner'):
+                owners = get_user_summaries(listing_data['owner_id'] for listing_data in listing_versions)
             
-            listings.append(listing_dict)
+            return listing_versions, total, owners
         
-        return jsonify({
-            'listings': listings,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'pages': (total + per_page - 1) // per_page
-        }), 200
+        def render_page(listing_versions, total, owners):
+            # Tag the response with the versions that were actually read
+            projection.update(LISTING_VERSION_PROJECTION)
+            listings_page = fetch_page(listing_versions, projection)
+            etag = listing_etag(listings_page, owners, current_user, total=total)
+            
+            listings = []
+            for listing_data in listings_page:
+                owner = owners.get(listing_data.get('owner_id'))
+                
+                listing_dict = Listing.serialize(listing_data, fields=fields)
+                if owner:
+                    listing_dict['owner'] = {
+                        'id': str(owner['_id']),
+                        'username': owner['username'],
+                        'character_name': owner.get('character_name'),
+                        'server': owner.get('server')
+                    }
+                
+                listings.append(listing_dict)
+            
+            body = jsonify({
+                'listings': listings,
+                'total': total,
+                'page': page,
+                'per_page': per_page,
+                'pages': (total + per_page - 1) // per_page
+            }).get_data()
+            return body, etag
+        
+        # Anonymous pages are shared through the cache
+        cache_key = page_cache_key(current_user, (
+            data_center, content_type, server, page, per_page,
+            tuple(sorted(fields)) if fields is not None else None
+        ))
+        if cache_key:
+            body, etag = app_cache.get_or_set('listings', cache_key, lambda: render_page(*load_page()))
+            return json_response(body, etag), 200
+        
+        listing_versions, total, owners = load_page()
+        cached = not_modified(listing_etag(listing_versions, owners, current_user, total=total))
+        if cached:
+            return cached
+        
+        return json_response(*render_page(listing_versions, total, owners)), 200
         
     except Exception as e:
         return jsonify({'message': f'Failed to get listings: {str(e)}'}), 500
@@ -100,23 +182,42 @@ def get_listing(listing_id, current_user=None):
         if not ObjectId.is_valid(listing_id):
             return jsonify({'message': 'Invalid listing ID'}), 400
         
-        listing_data = get_listings_collection().find_one({'_id': ObjectId(listing_id)})
+        try:
+            fields, projection = parse_fields(request.args.get('fields'), LISTING_FIELDS)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
         
-        if not listing_data:
+        # Check visibility and answer conditional requests from the version
+        # fields alone, before loading the full document
+        listing_version = get_listings_collection().find_one(
+            {'_id': ObjectId(listing_id)}, LISTING_VERSION_PROJECTION
+        )
+        
+        if not listing_version:
             return jsonify({'message': 'Listing not found'}), 404
         
         # Check if user can view this listing
-        if listing_data['state'] == 'private':
-            if not current_user or str(listing_data['owner_id']) != str(current_user['_id']):
+        if listing_version['state'] == 'private':
+            if not current_user or str(listing_version['owner_id']) != str(current_user['_id']):
                 return jsonify({'message': 'Listing not found'}), 404
         
         # Get owner info
-        owner = get_users_collection().find_one({'_id': listing_data['owner_id']})
+        owners = {}
+        if wants(fields, 'owner'):
+            owners = get_user_summaries([listing_version['owner_id']])
+        owner = owners.get(listing_version['owner_id'])
         
-        listing = Listing.from_dict(listing_data)
-        listing._id = listing_data['_id']
+        cached = not_modified(listing_etag([listing_version], owners, current_user))
+        if cached:
+            return cached
         
-        listing_dict = listing.to_dict()
+        projection.update(LISTING_VERSION_PROJECTION)
+        listing_data = get_listings_collection().find_one({'_id': ObjectId(listing_id)}, projection)
+        if not listing_data:
+            return jsonify({'message': 'Listing not found'}), 404
+        etag = listing_etag([listing_data], owners, current_user)
+        
+        listing_dict = Listing.serialize(listing_data, fields=fields)
         if owner:
             listing_dict['owner'] = {
                 'id': str(owner['_id']),
@@ -127,10 +228,10 @@ def get_listing(listing_id, current_user=None):
             }
         
         # Check if current user is the owner
-        if current_user:
-            listing_dict['is_owner'] = str(listing_data['owner_id']) == str(current_user['_id'])
+        if current_user and wants(fields, 'is_owner'):
+            listing_dict['is_owner'] = str(listing_version['owner_id']) == str(current_user['_id'])
         
-        return jsonify(listing_dict), 200
+        return with_etag(jsonify(listing_dict), etag), 200
         
     except Exception as e:
         return jsonify({'message': f'Failed to get listing: {str(e)}'}), 500
@@ -167,14 +268,14 @@ def create_listing(current_user):
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow()
         }
+        listing_data.update(Listing.search_fields(listing_data))
         
         result = get_listings_collection().insert_one(listing_data)
         listing_data['_id'] = result.inserted_id
+        listing_index.add(listing_data)
+        invalidate_listing_caches()
         
-        listing = Listing.from_dict(listing_data)
-        listing._id = result.inserted_id
-        
-        return jsonify(listing.to_dict()), 201
+        return jsonify(Listing.serialize(listing_data)), 201
         
     except Exception as e:
         return jsonify({'message': f'Failed to create listing: {str(e)}'}), 500
@@ -217,18 +318,18 @@ def update_listing(listing_id, current_user):
         for field in allowed_fields:
             if field in data:
                 update_data[field] = data[field]
+        update_data.update(Listing.search_fields(dict(listing_data, **update_data)))
         
         get_listings_collection().update_one(
             {'_id': ObjectId(listing_id)},
             {'$set': update_data}
         )
+        invalidate_listing_caches()
         
         # Get updated listing
         updated_listing_data = get_listings_collection().find_one({'_id': ObjectId(listing_id)})
-        updated_listing = Listing.from_dict(updated_listing_data)
-        updated_listing._id = updated_listing_data['_id']
-        
-        return jsonify(updated_listing.to_dict()), 200
+        listing_index.add(updated_listing_data)
+        return jsonify(Listing.serialize(updated_listing_data)), 200
         
     except Exception as e:
         return jsonify({'message': f'Failed to update listing: {str(e)}'}), 500
@@ -252,10 +353,21 @@ def delete_listing(listing_id, current_user):
         
         # Delete the listing
         get_listings_collection().delete_one({'_id': ObjectId(listing_id)})
+        listing_index.remove(listing_data['_id'])
+        invalidate_listing_caches()
         
-        # TODO: Also delete associated applications
+        # Associated applications are cleaned up in the background (or
+        # right here when no worker runs)
+        job = JobQueue.run_inline(JobQueue.enqueue(
+            'listing.cascade_delete',
+            {'listing_id': listing_id},
+            user_id=current_user['_id']
+        ))
         
-        return jsonify({'message': 'Listing deleted successfully'}), 200
+        return jsonify({
+            'message': 'Listing deleted successfully',
+            'job_id': str(job['_id'])
+        }), 200
         
     except Exception as e:
         return jsonify({'message': f'Failed to delete listing: {str(e)}'}), 500
@@ -288,33 +400,106 @@ def change_listing_state(listing_id, current_user):
             {'_id': ObjectId(listing_id)},
             {'$set': {'state': new_state, 'updated_at': datetime.utcnow()}}
         )
+        invalidate_listing_caches()
         
         # Get updated listing
         updated_listing_data = get_listings_collection().find_one({'_id': ObjectId(listing_id)})
-        updated_listing = Listing.from_dict(updated_listing_data)
-        updated_listing._id = updated_listing_data['_id']
-        
-        return jsonify(updated_listing.to_dict()), 200
+        return jsonify(Listing.serialize(updated_listing_data)), 200
         
     except Exception as e:
         return jsonify({'message': f'Failed to change state: {str(e)}'}), 500
 
+@bp.route('/<listing_id>/repair-count', methods=['POST'])
+@token_required
+def repair_application_count(listing_id, current_user):
+    """Recount a listing's applications in the background (owner only)"""
+    try:
+        if not ObjectId.is_valid(listing_id):
+            return jsonify({'message': 'Invalid listing ID'}), 400
+        
+        listing_data = get_listings_collection().find_one(
+            {'_id': ObjectId(listing_id)},
+            {'owner_id': 1}
+        )
+        
+        if not listing_data:
+            return jsonify({'message': 'Listing not found'}), 404
+        
+        # Check ownership
+        if str(listing_data['owner_id']) != str(current_user['_id']):
+            return jsonify({'message': 'Unauthorized'}), 403
+        
+        job = JobQueue.run_inline(JobQueue.enqueue(
+            'listing.repair_application_count',
+            {'listing_id': listing_id},
+            user_id=current_user['_id']
+        ))
+        
+        return job_accepted(job, 'Application count repair queued')
+        
+    except Exception as e:
+        return jsonify({'message': f'Failed to queue repair: {str(e)}'}), 500
+
 @bp.route('/my-listings', methods=['GET'])
 @token_required
 def get_my_listings(current_user):
-    """Get all listings owned by current user"""
+    """
+    Get listings owned by current user, newest first
+    
+    Query Parameters:
+        state: Only listings in this state
+        view: 'summary' to omit description, requirements and other long fields
+        fields: Comma-separated response fields (overrides view)
+        limit: Page size (default 20, max 100)
+        cursor: next_cursor from the previous page
+    """
     try:
-        listings_cursor = get_listings_collection().find(
-            {'owner_id': ObjectId(current_user['_id'])}
-        ).sort('created_at', -1)
+        query = {'owner_id': ObjectId(current_user['_id'])}
+        
+        state = request.args.get('state')
+        if state:
+            if state not in LISTING_STATES:
+                return jsonify({'message': 'Invalid state. Must be private, recruiting, or filled'}), 400
+            query['state'] = state
+        
+        summary = request.args.get('view') == 'summary'
+        
+        try:
+            fields, projection = parse_fields(
+                request.args.get('fields'), LISTING_FIELDS,
+                default=Listing.SUMMARY_FIELDS if summary else None
+            )
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            query = apply_cursor(query, request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'message': 'Invalid limit or cursor'}), 400
+        
+        listing_versions, next_cursor = cursor_page(
+            # created_at is needed to build next_cursor
+            get_listings_collection().find(query, dict(LISTING_VERSION_PROJECTION, created_at=1)), limit
+        )
+        
+        cached = not_modified(listing_etag(listing_versions, {}, current_user))
+        if cached:
+            return cached
+        
+        projection.update(LISTING_VERSION_PROJECTION)
+        listings_page = fetch_page(listing_versions, projection)
+        etag = listing_etag(listings_page, {}, current_user)
         
         listings = []
-        for listing_data in listings_cursor:
-            listing = Listing.from_dict(listing_data)
-            listing._id = listing_data['_id']
-            listings.append(listing.to_dict())
+        for listing_data in listings_page:
+            listings.append(Listing.serialize(listing_data, fields=fields))
         
-        return jsonify({'listings': listings}), 200
+        return with_etag(jsonify({
+            'listings': listings,
+            'limit': limit,
+            'next_cursor': next_cursor
+        }), etag), 200
         
     except Exception as e:
         return jsonify({'message': f'Failed to get listings: {str(e)}'}), 500
\ No newline at end of file
@@ -1,81 +1,502 @@
-from flask import Blueprint, request, jsonify
-from datetime import datetime
+from flask import Blueprint, current_app, request, jsonify
 from bson import ObjectId
 from app import get_db
-from app.models.application import Application
 from app.models.listing import Listing
 from app.models.user import User
-from app.middleware.auth_middleware import token_required
+from app.middleware.auth_middleware import token_required, optional_token
+from app.services.player_search import rank_players_by_name
+from app.services.search_index import listing_index
+from app.services.user_summaries import get_user_summaries
+from app.utils.cache import app_cache
+from app.utils.helpers import make_etag, page_cache_key, json_response
+from app.utils.schedule import parse_schedule, resolve_timezone
+from app.utils.constants import (
+    ALL_SERVERS, CONTENT_TYPES, DATA_CENTERS, JOB_CODES, MAX_JOB_LEVEL, PROGRESSION_ENCOUNTERS, ROLES
+)
+from app.utils.validators import LISTING_FIELDS, USER_FIELDS, normalize_key, parse_choices, parse_fields, wants
 
-bp = Blueprint('users', __name__)
-@bp.route('/recommended', methods=['GET'])
-@token_required
-def get_recommended_listings(current_user):
-    """Get personalized listing recommendations for current user"""
+bp = Blueprint('search', __name__)
+
+# Add OPTIONS handler for CORS preflight
+@bp.route('/players', methods=['OPTIONS'])
+@bp.route('/listings', methods=['OPTIONS'])
+@bp.route('/recommended', methods=['OPTIONS'])
+def handle_options():
+    """Handle CORS preflight requests"""
+    return '', 204
+
+def get_users_collection():
+    """Helper to get users collection"""
+    return get_db().users
+
+def get_listings_collection():
+    """Helper to get listings collection"""
+    return get_db().listings
+
+# Fields returned when the client does not pass ?fields=
+PLAYER_DEFAULT_FIELDS = (
+    'id', 'username', 'character_name', 'server', 'data_center',
+    'bio', 'roles', 'progression', 'availability'
+)
+LISTING_DEFAULT_FIELDS = (
+    'id', 'title', 'description', 'content_type', 'content_name', 'data_center',
+    'server', 'state', 'roles_needed', 'schedule', 'application_count',
+    'created_at', 'owner'
+)
+
+@bp.route('/players', methods=['GET'])
+@optional_token
+def search_players(current_user=None):
+    """Search for players based on criteria"""
     try:
-        # Get user's data center and roles
-        user_data_center = current_user.get('data_center')
-        user_roles = current_user.get('roles', [])
+        try:
+            fields, projection = parse_fields(
+                request.args.get('fields'), USER_FIELDS, default=PLAYER_DEFAULT_FIELDS
+            )
+            # Comma-separated values match any of them
+            data_centers = parse_choices(request.args.get('data_center'), DATA_CENTERS, 'data center')
+            servers = parse_choices(request.args.get('server'), ALL_SERVERS, 'server')
+            roles = parse_choices(request.args.get('role'), ROLES, 'role')
+            job_levels = parse_job_levels(request.args)
+            cleared = parse_choices(request.args.get('cleared'), list(PROGRESSION_ENCOUNTERS), 'encounter')
+            available = parse_available(request.args)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        # Build query on the normalized, indexed *_key fields
+        query = {}
+        if data_centers:
+            query['data_center_key'] = {'$in': [normalize_key(value) for value in data_centers]}
+        if servers:
+            query['server_key'] = {'$in': [normalize_key(value) for value in servers]}
+        if roles:
+            query['role_keys'] = {'$in': [normalize_key(value) for value in roles]}
+        if job_levels:
+            query['job_levels'] = job_levels
+        if cleared:
+            # Every listed clear, on the multikey progression_clears index
+            query['progression_clears'] = {'$all': cleared}
+        if available:
+            query['schedule_hours'] = available
+        
+        # Pagination
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 50))
+        skip = (page - 1) * per_page
         
-        # Build query for recruiting listings
-        query = {'state': 'recruiting'}
+        # Exclude current user if authenticated
+        if current_user:
+            query['_id'] = {'$ne': ObjectId(current_user['_id'])}
         
-        # Exclude user's own listings
-        query['owner_id'] = {'$ne': ObjectId(current_user['_id'])}
+        # Fuzzy match on username / character name, closest first
+        name = (request.args.get('name') or '').strip()
+        total_capped = False
+        if name:
+            # total only counts the NAME_SEARCH_MAX_CANDIDATES closest
+            # candidates; total_capped tells clients more may match
+            ranked, total_capped = rank_players_by_name(name, query)
+            total = len(ranked)
+            page_ids = [user_id for user_id, _ in ranked[skip:skip + per_page]]
+            found = {
+                player_data['_id']: player_data
+                for player_data in get_users_collection().find({'_id': {'$in': page_ids}}, projection)
+            }
+            players_cursor = [found[user_id] for user_id in page_ids if user_id in found]
+        else:
+            players_cursor = get_users_collection().find(query, projection).skip(skip).limit(per_page)
+            total = get_users_collection().count_documents(query)
         
-        # Get all recruiting listings
-        listings_cursor = get_listings_collection().find(query).sort('created_at', -1)
+        players = []
+        for player_data in players_cursor:
+            players.append(User.serialize(player_data, fields=fields))
         
-        recommendations = []
+        return jsonify({
+            'players': players,
+            'total': total,
+            'total_capped': total_capped,
+            'page': page,
+            'per_page': per_page,
+            'pages': (total + per_page - 1) // per_page
+        }), 200
         
-        for listing_data in listings_cursor:
-            # Calculate match score
-            match_score = calculate_match_score(current_user, listing_data)
+    except Exception as e:
+        return jsonify({'message': f'Failed to search players: {str(e)}'}), 500
+
+# Multi-value filters on /listings: parameter -> (listing field, allowed values, name in errors).
+# Each is also a facet clients may request with ?facets=
+LISTING_FILTERS = {
+    'data_center': ('data_center', DATA_CENTERS, 'data center'),
+    'content_type': ('content_type', CONTENT_TYPES, 'content type'),
+    'server': ('server', ALL_SERVERS, 'server'),
+    'role': ('roles_needed_keys', ROLES, 'role')
+}
+
+def parse_listing_filters(args):
+    """
+    Filter conditions for the multi-value listing filters in args
+
+    Returns:
+        {parameter: Mongo condition} for each parameter given
+
+    Raises:
+        ValueError: If a value or facet name is unknown
+    """
+    filters = {}
+    for parameter, (field, choices, name) in LISTING_FILTERS.items():
+        values = parse_choices(args.get(parameter), choices, name)
+        if field == 'roles_needed_keys':
+            values = [normalize_key(value) for value in values]
+        if values:
+            filters[parameter] = {field: {'$in': values}}
+    return filters
+
+def parse_job_levels(args):
+    """
+    Condition for ?job=WAR,PLD&min_level=100, or None when job is absent
+
+    A player matches when one job_levels entry is one of the jobs at
+    min_level (default 1, i.e. unlocked) or above. $elemMatch keeps job and
+    level on the same entry, so both bound the (job_levels.j, job_levels.l)
+    multikey index.
+
+    Raises:
+        ValueError: If a job code or min_level is invalid, or min_level has no job
+    """
+    jobs = parse_choices(args.get('job'), JOB_CODES, 'job')
+    min_level = args.get('min_level')
+    if min_level:
+        if not min_level.isdigit() or not 1 <= int(min_level) <= MAX_JOB_LEVEL:
+            raise ValueError(f'min_level must be a number from 1 to {MAX_JOB_LEVEL}')
+        if not jobs:
+            raise ValueError('min_level requires job')
+    if not jobs:
+        return None
+    return {'$elemMatch': {'j': {'$in': jobs}, 'l': {'$gte': int(min_level or 1)}}}
+
+def parse_available(args):
+    """
+    Overlap condition for ?available= ("Tue/Thu 7-11 PM"), or None when absent
+
+    Times are read in ?tz= (an abbreviation such as PT or an IANA name),
+    unless the value names its own time zone, and default to UTC. A listing
+    or player matches when its schedule shares at least one UTC hour of the
+    week with the requested window.
+
+    Raises:
+        ValueError: If the time zone or window cannot be understood
+    """
+    available = (args.get('available') or '').strip()
+    if not available:
+        return None
+    tz = resolve_timezone(args.get('tz') or 'UTC')
+    if tz is None:
+        raise ValueError(f"Unknown time zone: {args.get('tz')}")
+    hours = parse_schedule(available, default_tz=tz)
+    if not hours:
+        raise ValueError(f'Could not understand available={available}')
+    return {'$in': hours}
+
+def search_page(text, query, projection, skip, per_page):
+    """
+    One page of the listings matching text and query, in rank order
+
+    The index only ranks ids; query (visibility and filters) is applied by
+    MongoDB on the ranked ids, so the index can never reveal a listing the
+    caller may not see. Only the best ranked ids are read: twice the end of
+    the page plus SEARCH_CANDIDATE_MARGIN, four times more each round while
+    too few of them are visible and the index has more.
+
+    Returns:
+        (listings, total, ranked, capped): ranked is the window of ids read
+        and capped is True when the index had more matches past it, in
+        which case total only counts those visible in the window
+    """
+    limit = 2 * (skip + per_page) + current_app.config.get('SEARCH_CANDIDATE_MARGIN', 100)
+    while True:
+        ranked = [listing_id for listing_id, _ in listing_index.search(text, limit=limit + 1)]
+        capped = len(ranked) > limit
+        ranked = ranked[:limit]
+        visible = {
+            listing_data['_id']
+            for listing_data in get_listings_collection().find({'$and': [query, {'_id': {'$in': ranked}}]}, {'_id': 1})
+        } if ranked else set()
+        ordered = [listing_id for listing_id in ranked if listing_id in visible]
+        if len(ordered) >= skip + per_page or not capped:
+            break
+        limit *= 4
+    page_ids = ordered[skip:skip + per_page]
+    
+    listings = {
+        listing_data['_id']: listing_data
+        for listing_data in get_listings_collection().find({'_id': {'$in': page_ids}}, projection)
+    }
+    return [listings[listing_id] for listing_id in page_ids if listing_id in listings], len(ordered), ranked, capped
+
+def listing_facets(base, filters, facet_names, page=None):
+    """
+    Counts per value of each facet for listings matching base, in one $facet aggregation
+
+    Each facet is counted under every filter except its own, so with
+    data_center=Aether selected the other data centers still show how many
+    listings picking them would add.
+
+    Args:
+        base: Visibility query every count and result is limited to
+        filters: {parameter: condition} from parse_listing_filters
+        facet_names: Facets to count
+        page: Optional (projection, skip, limit); the newest-first page of
+            results and its total are then computed in the same aggregation
+
+    Returns:
+        (facets, listings, total) where facets maps each name to
+        [{'value', 'count'}] most common first; listings and total are None
+        without page
+    """
+    stages = {}
+    for name in facet_names:
+        field = LISTING_FILTERS[name][0]
+        others = [condition for other, condition in filters.items() if other != name]
+        stages[name] = ([{'$match': {'$and': others}}] if others else []) + [
+            {'$unwind': f'${field}'},  # one row per role for roles_needed_keys
+            {'$group': {'_id': f'${field}', 'count': {'$sum': 1}}}
+        ]
+    
+    if page:
+        projection, skip, limit = page
+        matching = [{'$match': {'$and': list(filters.values())}}] if filters else []
+        stages['_listings'] = matching + [
+            {'$sort': {'created_at': -1}}, {'$skip': skip}, {'$limit': limit}, {'$project': projection}
+        ]
+        stages['_total'] = matching + [{'$count': 'count'}]
+    
+    result = next(get_listings_collection().aggregate([{'$match': base}, {'$facet': stages}]))
+    
+    facets = {
+        name: [
+            {'value': row['_id'], 'count': row['count']}
+            for row in sorted(result[name], key=lambda row: (-row['count'], str(row['_id'])))
+            if row['_id'] is not None
+        ]
+        for name in facet_names
+    }
+    if not page:
+        return facets, None, None
+    total = result['_total'][0]['count'] if result['_total'] else 0
+    return facets, result['_listings'], total
+
+@bp.route('/listings', methods=['GET'])
+@optional_token
+def search_listings(current_user=None):
+    """Search for listings (enhanced search)"""
+    try:
+        try:
+            fields, projection = parse_fields(
+                request.args.get('fields'), LISTING_FIELDS, default=LISTING_DEFAULT_FIELDS
+            )
+            # Comma-separated values match any of them
+            filters = parse_listing_filters(request.args)
+            available = parse_available(request.args)
+            facet_names = sorted({name.strip() for name in (request.args.get('facets') or '').split(',') if name.strip()})
+            unknown = set(facet_names) - LISTING_FILTERS.keys()
+            if unknown:
+                raise ValueError(f"Unknown facets: {', '.join(sorted(unknown))}")
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        # Build visibility query
+        base = {}
+        
+        # Only show recruiting and filled listings to non-owners
+        if current_user:
+            base['$or'] = [
+                {'state': {'$in': ['recruiting', 'filled']}},
+                {'owner_id': ObjectId(current_user['_id'])}
+            ]
+        else:
+            base['state'] = {'$in': ['recruiting', 'filled']}
+        
+        # Filter by state
+        state = request.args.get('state')
+        if state and current_user:
+            if state == 'private':
+                base = {'owner_id': ObjectId(current_user['_id']), 'state': 'private'}
+            else:
+                base['state'] = state
+        
+        # Filter by schedule overlap
+        if available:
+            base['schedule_hours'] = available
+        
+        query = dict(base)
+        for condition in filters.values():
+            query.update(condition)
+        
+        # Text search
+        search_text = (request.args.get('q') or '').strip()
+        
+        # Pagination
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 20))
+        skip = (page - 1) * per_page
+        
+        def render_page():
+            facet_base = base
+            total_capped = False
+            if search_text:
+                listing_index.sync()
+                listings_page, total, ranked, total_capped = search_page(search_text, query, projection, skip, per_page)
+                # Facets count the same window of matches
+                facet_base = {'$and': [base, {'_id': {'$in': ranked}}]}
             
-            if match_score > 0:  # Only include if there's some match
-                # Get reasons for match
-                reasons = get_match_reasons(current_user, listing_data)
-                
-                # Get owner info
-                owner = get_users_collection().find_one({'_id': listing_data['owner_id']})
+            # Facet counts are cached per filter signature; listing writes
+            # invalidate the namespace
+            facets = None
+            if facet_names:
+                facet_key = make_etag(facet_base, filters, facet_names)
+                facet_version = app_cache.version('facets')
+                facets = app_cache.get('facets', facet_key)
+            count_facets = facet_names and facets is None
+            
+            # Text searches already have their page and total from search_page
+            if not search_text and count_facets:
+                # Page, total and facets from a single aggregation
+                facets, listings_page, total = listing_facets(
+                    facet_base, filters, facet_names, page=(projection, skip, per_page)
+                )
+            elif not search_text:
+                listings_page = list(
+                    get_listings_collection().find(query, projection).sort('created_at', -1).skip(skip).limit(per_page)
+                )
+                total = get_listings_collection().count_documents(query)
+            
+            if count_facets:
+                if facets is None:
+                    facets, _, _ = listing_facets(facet_base, filters, facet_names)
+                app_cache.set('facets', facet_key, facets, version=facet_version)
+            
+            # Get owner info for the whole page at once
+            owners = {}
+            if wants(fields, 'owner'):
+                owners = get_user_summaries(listing_data['owner_id'] for listing_data in listings_page)
+            
+            listings = []
+            for listing_data in listings_page:
+                owner = owners.get(listing_data.get('owner_id'))
                 
-                listing = {
-                    'id': str(listing_data['_id']),
-                    'title': listing_data['title'],
-                    'description': listing_data['description'],
-                    'content_type': listing_data['content_type'],
-                    'content_name': listing_data.get('content_name'),
-                    'data_center': listing_data['data_center'],
-                    'server': listing_data.get('server'),
-                    'state': listing_data['state'],
-                    'roles_needed': listing_data.get('roles_needed', {}),
-                    'schedule': listing_data.get('schedule', []),
-                    'created_at': listing_data['created_at'].isoformat() if listing_data.get('created_at') else None
-                }
+                listing = Listing.serialize(listing_data, fields=fields)
                 
                 if owner:
                     listing['owner'] = {
                         'id': str(owner['_id']),
                         'username': owner['username'],
-                        'character_name': owner.get('character_name')
+                        'character_name': owner.get('character_name'),
+                        'server': owner.get('server')
                     }
                 
-                recommendation = {
-                    'listing': listing,
-                    'matchScore': match_score,
-                    'reasons': reasons
-                }
-                
-                recommendations.append(recommendation)
+                listings.append(listing)
+            
+            response = {
+                'listings': listings,
+                'total': total,
+                'total_capped': total_capped,
+                'page': page,
+                'per_page': per_page,
+                'pages': (total + per_page - 1) // per_page
+            }
+            if facets is not None:
+                response['facets'] = facets
+            return jsonify(response).get_data()
         
-        # Sort by match score (highest first)
-        recommendations.sort(key=lambda x: x['matchScore'], reverse=True)
+        # Anonymous searches are shared through the cache
+        cache_key = page_cache_key(current_user, (
+            search_text, filters, available, facet_names, page, per_page,
+            tuple(sorted(fields)) if fields is not None else None
+        ))
+        if cache_key:
+            return json_response(app_cache.get_or_set('listings', cache_key, render_page)), 200
+        
+        return json_response(render_page()), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Failed to search listings: {str(e)}'}), 500
+
+# Listing fields used to score and render recommendations
+RECOMMENDATION_PROJECTION = {
+    'title': 1, 'description': 1, 'owner_id': 1, 'content_type': 1, 'content_name': 1,
+    'data_center': 1, 'server': 1, 'state': 1, 'roles_needed': 1, 'schedule': 1, 'requirements': 1,
+    'created_at': 1
+}
+
+@bp.route('/recommended', methods=['GET'])
+@token_required
+def get_recommended_listings(current_user):
+    """Get personalized listing recommendations for current user"""
+    try:
+        # Keyed by profile version, so profile edits miss; listing writes
+        # invalidate the whole namespace
+        cache_key = f"{current_user['_id']}:{current_user.get('updated_at')}"
+        recommendations = app_cache.get_or_set(
+            'recommendations', cache_key, lambda: build_recommendations(current_user)
+        )
         
         return jsonify({'recommendations': recommendations}), 200
         
     except Exception as e:
         return jsonify({'message': f'Failed to get recommendations: {str(e)}'}), 500
 
+def build_recommendations(current_user):
+    """Score every recruiting listing for a user, best match first"""
+    # Recruiting listings, excluding the user's own
+    query = {
+        'state': 'recruiting',
+        'owner_id': {'$ne': ObjectId(current_user['_id'])}
+    }
+    
+    matches = []
+    for listing_data in get_listings_collection().find(query, RECOMMENDATION_PROJECTION).sort('created_at', -1):
+        # Calculate match score
+        match_score = calculate_match_score(current_user, listing_data)
+        
+        if match_score > 0:  # Only include if there's some match
+            matches.append((listing_data, match_score))
+    
+    # Get owner info for all matches at once
+    owners = get_user_summaries(listing_data['owner_id'] for listing_data, _ in matches)
+    
+    recommendations = []
+    for listing_data, match_score in matches:
+        listing = {
+            'id': str(listing_data['_id']),
+            'title': listing_data['title'],
+            'description': listing_data['description'],
+            'content_type': listing_data['content_type'],
+            'content_name': listing_data.get('content_name'),
+            'data_center': listing_data['data_center'],
+            'server': listing_data.get('server'),
+            'state': listing_data['state'],
+            'roles_needed': listing_data.get('roles_needed', {}),
+            'schedule': listing_data.get('schedule', []),
+            'created_at': listing_data['created_at'].isoformat() if listing_data.get('created_at') else None
+        }
+        
+        owner = owners.get(listing_data['owner_id'])
+        if owner:
+            listing['owner'] = {
+                'id': str(owner['_id']),
+                'username': owner['username'],
+                'character_name': owner.get('character_name')
+            }
+        
+        recommendations.append({
+            'listing': listing,
+            'matchScore': match_score,
+            'reasons': get_match_reasons(current_user, listing_data)
+        })
+    
+    # Sort by match score (highest first)
+    recommendations.sort(key=lambda x: x['matchScore'], reverse=True)
+    return recommendations
+
 def calculate_match_score(user, listing):
     """Calculate match score between user and listing (0-100)"""
     score = 0
@@ -105,12 +526,29 @@ def calculate_match_score(user, listing):
     if user.get('bio'):
         score += 5
     
-    # Has progression (experience indicator - 5 points)
-    if user.get('progression') and len(user['progression']) > 0:
+    # Progression (up to 15 points): share of the listing's required clears
+    # the user has, plus their best parses on them; without requirements,
+    # any clear is an experience indicator
+    required, cleared = progression_match(user, listing)
+    if required:
+        score += round(10 * len(cleared) / len(required))
+        parses = [user['progression'][code].get('best_percent') or 0 for code in cleared]
+        if parses:
+            score += round(5 * sum(parses) / len(parses) / 100)
+    elif user.get('progression_clears'):
         score += 5
     
     return min(score, 100)
 
+def progression_match(user, listing):
+    """(encounter codes the listing's requirements.progression asks for, the ones user has cleared)"""
+    requirements = listing.get('requirements') or {}
+    required = list(dict.fromkeys(
+        str(code).strip().upper() for code in requirements.get('progression') or [] if str(code).strip()
+    ))
+    clears = set(user.get('progression_clears') or [])
+    return required, [code for code in required if code in clears]
+
 def get_match_reasons(user, listing):
     """Get reasons why user matches this listing"""
     reasons = []
@@ -133,6 +571,11 @@ def get_match_reasons(user, listing):
         if matching:
             reasons.append(f"You play {', '.join(matching)} (needed)")
     
+    # Required clears
+    _, cleared = progression_match(user, listing)
+    if cleared:
+        reasons.append(f"You've cleared {', '.join(cleared)}")
+    
     # Content type
     if listing.get('content_type'):
         reasons.append(f"Looking for {listing['content_type'].capitalize()} raiders")
@@ -141,185 +584,4 @@ def get_match_reasons(user, listing):
     if listing.get('schedule') and user.get('availability'):
         reasons.append(f"Raid schedule may work for you")
     
-    return reasons[:5]  # Return top 5 reasonsfrom flask import Blueprint, request, jsonify
-from bson import ObjectId
-from app import get_db
-from app.middleware.auth_middleware import optional_token
-
-bp = Blueprint('search', __name__)
-
-# Add OPTIONS handler for CORS preflight
-@bp.route('/players', methods=['OPTIONS'])
-@bp.route('/listings', methods=['OPTIONS'])
-def handle_options():
-    """Handle CORS preflight requests"""
-    return '', 204
-
-def get_users_collection():
-    """Helper to get users collection"""
-    return get_db().users
-
-def get_listings_collection():
-    """Helper to get listings collection"""
-    return get_db().listings
-
-@bp.route('/players', methods=['GET'])
-@optional_token
-def search_players(current_user=None):
-    """Search for players based on criteria"""
-    try:
-        # Build query
-        query = {}
-        
-        # Filter by data center
-        data_center = request.args.get('data_center')
-        if data_center:
-            query['data_center'] = data_center
-        
-        # Filter by server
-        server = request.args.get('server')
-        if server:
-            query['server'] = {'$regex': server, '$options': 'i'}
-        
-        # Filter by role
-        role = request.args.get('role')
-        if role:
-            query['roles'] = role
-        
-        # Pagination
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 50))
-        skip = (page - 1) * per_page
-        
-        # Exclude current user if authenticated
-        if current_user:
-            query['_id'] = {'$ne': ObjectId(current_user['_id'])}
-        
-        # Get players
-        players_cursor = get_users_collection().find(query).skip(skip).limit(per_page)
-        total = get_users_collection().count_documents(query)
-        
-        players = []
-        for player_data in players_cursor:
-            player = {
-                'id': str(player_data['_id']),
-                'username': player_data['username'],
-                'character_name': player_data.get('character_name'),
-                'server': player_data.get('server'),
-                'data_center': player_data.get('data_center'),
-                'bio': player_data.get('bio'),
-                'roles': player_data.get('roles', []),
-                'progression': player_data.get('progression', {}),
-                'availability': player_data.get('availability', [])
-            }
-            players.append(player)
-        
-        return jsonify({
-            'players': players,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'pages': (total + per_page - 1) // per_page
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'message': f'Failed to search players: {str(e)}'}), 500
-
-@bp.route('/listings', methods=['GET'])
-@optional_token
-def search_listings(current_user=None):
-    """Search for listings (enhanced search)"""
-    try:
-        # Build query
-        query = {}
-        
-        # Only show recruiting and filled listings to non-owners
-        if current_user:
-            query['$or'] = [
-                {'state': {'$in': ['recruiting', 'filled']}},
-                {'owner_id': ObjectId(current_user['_id'])}
-            ]
-        else:
-            query['state'] = {'$in': ['recruiting', 'filled']}
-        
-        # Text search
-        search_text = request.args.get('q')
-        if search_text:
-            query['$or'] = [
-                {'title': {'$regex': search_text, '$options': 'i'}},
-                {'description': {'$regex': search_text, '$options': 'i'}},
-                {'content_name': {'$regex': search_text, '$options': 'i'}}
-            ]
-        
-        # Filter by data center
-        data_center = request.args.get('data_center')
-        if data_center:
-            query['data_center'] = data_center
-        
-        # Filter by content type
-        content_type = request.args.get('content_type')
-        if content_type:
-            query['content_type'] = content_type
-        
-        # Filter by server
-        server = request.args.get('server')
-        if server:
-            query['server'] = server
-        
-        # Filter by state
-        state = request.args.get('state')
-        if state and current_user:
-            if state == 'private':
-                query = {'owner_id': ObjectId(current_user['_id']), 'state': 'private'}
-            else:
-                query['state'] = state
-        
-        # Pagination
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 20))
-        skip = (page - 1) * per_page
-        
-        # Get listings
-        listings_cursor = get_listings_collection().find(query).sort('created_at', -1).skip(skip).limit(per_page)
-        total = get_listings_collection().count_documents(query)
-        
-        listings = []
-        for listing_data in listings_cursor:
-            # Get owner info
-            owner = get_users_collection().find_one({'_id': listing_data['owner_id']})
-            
-            listing = {
-                'id': str(listing_data['_id']),
-                'title': listing_data['title'],
-                'description': listing_data['description'],
-                'content_type': listing_data['content_type'],
-                'content_name': listing_data.get('content_name'),
-                'data_center': listing_data['data_center'],
-                'server': listing_data.get('server'),
-                'state': listing_data['state'],
-                'roles_needed': listing_data.get('roles_needed', {}),
-                'schedule': listing_data.get('schedule', []),
-                'application_count': listing_data.get('application_count', 0),
-                'created_at': listing_data['created_at'].isoformat() if listing_data.get('created_at') else None
-            }
-            
-            if owner:
-                listing['owner'] = {
-                    'id': str(owner['_id']),
-                    'username': owner['username'],
-                    'character_name': owner.get('character_name'),
-                    'server': owner.get('server')
-                }
-            
-            listings.append(listing)
-        
-        return jsonify({
-            'listings': listings,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'pages': (total + per_page - 1) // per_page
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'message': f'Failed to search listings: {str(e)}'}), 500
\ No newline at end of file
+    return reasons[:5]  # Return top 5 reasons
@@ -4,7 +4,13 @@ from bson import ObjectId
 from app import get_db
 from app.models.user import User
 from app.middleware.auth_middleware import token_required
+from app.services.job_queue import JobQueue
 from app.services.lodestone_service import LodestoneService
+from app.services.lodestone_sync import apply_character
+from app.services.progression_sync import empty_progression, queue_user_progression
+from app.services.user_summaries import invalidate_user_summary
+from app.utils.helpers import job_accepted, make_etag, not_modified, with_etag
+from app.utils.validators import USER_FIELDS, parse_fields, validate_location
 
 bp = Blueprint('users', __name__)
 
@@ -20,14 +26,16 @@ def get_users_collection():
     """Helper to get users collection"""
     return get_db().users
 
+def user_etag(user_data):
+    """ETag for a public profile response; fields= is covered by the query string"""
+    return make_etag(str(user_data['_id']), user_data.get('updated_at'), sorted(request.args.items(multi=True)))
+
 @bp.route('/profile', methods=['GET'])
 @token_required
 def get_profile(current_user):
     """Get current user's profile"""
     try:
-        user = User.from_dict(current_user)
-        user._id = current_user['_id']
-        return jsonify(user.to_dict(include_sensitive=True)), 200
+        return jsonify(User.serialize(current_user, sensitive=True)), 200
     except Exception as e:
         return jsonify({'message': f'Failed to get profile: {str(e)}'}), 500
 
@@ -53,18 +61,29 @@ def update_profile(current_user):
             if field in data:
                 update_data[field] = data[field]
         
+        try:
+            update_data.update(validate_location(update_data))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        update_data.update(User.search_fields(dict(current_user, **update_data)))
+        
+        # A new FFLogs character starts without progression until its job runs
+        fflogs_changed = 'fflogs_id' in update_data and update_data['fflogs_id'] != current_user.get('fflogs_id')
+        if fflogs_changed:
+            update_data.update(empty_progression())
+        
         # Update user
         get_users_collection().update_one(
             {'_id': ObjectId(current_user['_id'])},
             {'$set': update_data}
         )
+        invalidate_user_summary(current_user['_id'])
+        if fflogs_changed and update_data['fflogs_id']:
+            queue_user_progression(current_user['_id'])
         
         # Get updated user
         updated_user_data = get_users_collection().find_one({'_id': ObjectId(current_user['_id'])})
-        user = User.from_dict(updated_user_data)
-        user._id = updated_user_data['_id']
-        
-        return jsonify(user.to_dict(include_sensitive=True)), 200
+        return jsonify(User.serialize(updated_user_data, sensitive=True)), 200
         
     except Exception as e:
         return jsonify({'message': f'Failed to update profile: {str(e)}'}), 500
@@ -76,15 +95,28 @@ def get_user(user_id):
         if not ObjectId.is_valid(user_id):
             return jsonify({'message': 'Invalid user ID'}), 400
         
-        user_data = get_users_collection().find_one({'_id': ObjectId(user_id)})
+        try:
+            fields, projection = parse_fields(request.args.get('fields'), USER_FIELDS)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
         
-        if not user_data:
+        # Answer conditional requests from updated_at alone
+        user_version = get_users_collection().find_one({'_id': ObjectId(user_id)}, {'updated_at': 1})
+        
+        if not user_version:
             return jsonify({'message': 'User not found'}), 404
         
-        user = User.from_dict(user_data)
-        user._id = user_data['_id']
+        cached = not_modified(user_etag(user_version))
+        if cached:
+            return cached
+        
+        projection['updated_at'] = 1
+        user_data = get_users_collection().find_one({'_id': ObjectId(user_id)}, projection)
         
-        return jsonify(user.to_dict()), 200
+        if not user_data:
+            return jsonify({'message': 'User not found'}), 404
+        
+        return with_etag(jsonify(User.serialize(user_data, fields=fields)), user_etag(user_data)), 200
         
     except Exception as e:
         return jsonify({'message': f'Failed to get user: {str(e)}'}), 500
@@ -93,18 +125,21 @@ def get_user(user_id):
 def get_users():
     """Get all users (public endpoint - use for admin features)"""
     try:
+        try:
+            fields, projection = parse_fields(request.args.get('fields'), USER_FIELDS)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 50))
         skip = (page - 1) * per_page
         
-        users_cursor = get_users_collection().find().skip(skip).limit(per_page)
+        users_cursor = get_users_collection().find({}, projection).skip(skip).limit(per_page)
         total = get_users_collection().count_documents({})
         
         users = []
         for user_data in users_cursor:
-            user = User.from_dict(user_data)
-            user._id = user_data['_id']
-            users.append(user.to_dict())
+            users.append(User.serialize(user_data, fields=fields))
         
         return jsonify({
             'users': users,
@@ -117,6 +152,63 @@ def get_users():
     except Exception as e:
         return jsonify({'message': f'Failed to get users: {str(e)}'}), 500
 
+def wants_refresh(data=None):
+    """Whether the client asked to bypass the Lodestone cache (?force=true or "force": true)"""
+    if request.args.get('force', '').lower() == 'true':
+        return True
+    return bool(data and data.get('force') is True)
+
+def refresh_character(current_user, lodestone_id, link, message):
+    """
+    Apply cached character data right away, or queue a lodestone.refresh job
+
+    A fresh copy in the Lodestone cache is applied in this request (200).
+    Otherwise the fetch runs on the job queue and the client polls the
+    returned status_url (202); forced refreshes always go to the queue
+    unless the Lodestone is known to be down. Without a worker
+    (JobQueue.RUN_INLINE) the job's first attempt runs in this request:
+    success answers 200 as well, and a failed job 400 with its error.
+    """
+    force = wants_refresh(request.get_json(silent=True))
+    lodestone_data = None if force else LodestoneService.get_cached_character(lodestone_id)
+    
+    # While the Lodestone circuit breaker is open, answer now: with a stale
+    # cached copy if there is one, otherwise 503 and when to try again
+    if lodestone_data is None and LodestoneService.breaker.retry_after():
+        lodestone_data = LodestoneService.get_character(lodestone_id)
+        if not lodestone_data['success'] and 'retry_after' in lodestone_data:
+            response = jsonify({
+                'message': 'The Lodestone is unavailable right now. Please try again later.',
+                'retry_after': lodestone_data.get('retry_after')
+            })
+            response.headers['Retry-After'] = str(lodestone_data['retry_after'])
+            return response, 503
+        if not lodestone_data['success']:
+            lodestone_data = None  # the breaker let this call through as a probe
+    
+    if lodestone_data is None:
+        job = JobQueue.run_inline(JobQueue.enqueue(
+            'lodestone.refresh',
+            {'user_id': str(current_user['_id']), 'lodestone_id': lodestone_id, 'link': link, 'force': force},
+            user_id=current_user['_id']
+        ))
+        if job['status'] == 'failed':
+            return jsonify({'message': 'Failed to fetch Lodestone data', 'error': job.get('error')}), 400
+        if job['status'] != 'succeeded':
+            return job_accepted(job, 'Lodestone refresh queued')
+        return jsonify({
+            'message': message,
+            'user': User.serialize(get_users_collection().find_one({'_id': current_user['_id']}), sensitive=True),
+            'character_data': LodestoneService.get_cached_character(lodestone_id)
+        }), 200
+    
+    updated_user_data = apply_character(current_user['_id'], lodestone_id, lodestone_data, link=link)
+    return jsonify({
+        'message': message,
+        'user': User.serialize(updated_user_data, sensitive=True),
+        'character_data': lodestone_data
+    }), 200
+
 @bp.route('/lodestone/link', methods=['POST'])
 @token_required
 def link_lodestone(current_user):
@@ -137,46 +229,7 @@ def link_lodestone(current_user):
         if not lodestone_id.isdigit():
             return jsonify({'message': 'Lodestone ID must be numeric'}), 400
         
-        # Fetch character data to verify the Lodestone ID is valid
-        lodestone_data = LodestoneService.fetch_character_data(lodestone_id)
-        
-        if not lodestone_data['success']:
-            return jsonify({
-                'message': 'Failed to fetch Lodestone data. Please verify the ID is correct.',
-                'error': lodestone_data.get('error')
-            }), 400
-        
-        # Update user with lodestone_id and character data from Lodestone
-        update_data = {
-            'lodestone_id': lodestone_id,
-            'character_name': lodestone_data.get('character_name'),
-            'server': lodestone_data.get('server'),
-            'data_center': lodestone_data.get('data_center'),
-            'free_company': lodestone_data.get('free_company'),
-            'gender' : lodestone_data.get('gender'),
-            'race' : lodestone_data.get('race'),
-            'sub_race' : lodestone_data.get('sub_race'),
-            'grand_company' : lodestone_data.get('grand_company'),
-            'grand_company_rank' : lodestone_data.get('grand_company_rank'),
-            'jobs' : lodestone_data.get('jobs'),
-            'updated_at': datetime.utcnow()
-        }
-        
-        get_users_collection().update_one(
-            {'_id': ObjectId(current_user['_id'])},
-            {'$set': update_data}
-        )
-        
-        # Return updated user data
-        updated_user_data = get_users_collection().find_one({'_id': ObjectId(current_user['_id'])})
-        user = User.from_dict(updated_user_data)
-        user._id = updated_user_data['_id']
-        
-        return jsonify({
-            'message': 'Lodestone account linked successfully!',
-            'user': user.to_dict(include_sensitive=True),
-            'character_data': lodestone_data
-        }), 200
+        return refresh_character(current_user, lodestone_id, True, 'Lodestone account linked successfully!')
         
     except Exception as e:
         return jsonify({'message': f'Failed to link Lodestone account: {str(e)}'}), 500
@@ -188,7 +241,8 @@ def verify_lodestone(current_user):
     """
     Verify and refresh Lodestone character data
     
-    This endpoint fetches the latest data from Lodestone and updates the user's profile
+    Updates the user's profile from the latest Lodestone data, from the
+    cache when it is fresh and in the background otherwise
     """
     try:
         lodestone_id = current_user.get('lodestone_id')
@@ -196,46 +250,7 @@ def verify_lodestone(current_user):
         if not lodestone_id:
             return jsonify({'message': 'User has no linked Lodestone account'}), 400
         
-        # Fetch latest character data
-        lodestone_data = LodestoneService.fetch_character_data(lodestone_id)
-        
-        if not lodestone_data['success']:
-            return jsonify({
-                'message': 'Failed to fetch Lodestone data',
-                'error': lodestone_data.get('error')
-            }), 400
-        
-        # Update user data from Lodestone
-        update_data = {
-            'lodestone_id': lodestone_id,
-            'character_name': lodestone_data.get('character_name'),
-            'server': lodestone_data.get('server'),
-            'data_center': lodestone_data.get('data_center'),
-            'free_company': lodestone_data.get('free_company'),
-            'gender' : lodestone_data.get('gender'),
-            'race' : lodestone_data.get('race'),
-            'sub_race' : lodestone_data.get('sub_race'),
-            'grand_company' : lodestone_data.get('grand_company'),
-            'grand_company_rank' : lodestone_data.get('grand_company_rank'),
-            'jobs' : lodestone_data.get('jobs'),
-            'updated_at': datetime.utcnow()
-        }
-        
-        get_users_collection().update_one(
-            {'_id': ObjectId(current_user['_id'])},
-            {'$set': update_data}
-        )
-        
-        # Return updated user data
-        updated_user_data = get_users_collection().find_one({'_id': ObjectId(current_user['_id'])})
-        user = User.from_dict(updated_user_data)
-        user._id = updated_user_data['_id']
-        
-        return jsonify({
-            'message': 'Lodestone data verified and updated!',
-            'user': user.to_dict(include_sensitive=True),
-            'character_data': lodestone_data
-        }), 200
+        return refresh_character(current_user, lodestone_id, False, 'Lodestone data verified and updated!')
         
     except Exception as e:
         return jsonify({'message': f'Failed to verify Lodestone account: {str(e)}'}), 500
@@ -248,16 +263,17 @@ def unlink_lodestone(current_user):
     try:
         get_users_collection().update_one(
             {'_id': ObjectId(current_user['_id'])},
-            {'$unset': {'lodestone_id': '', 'lodestone_verified_at': ''}}
+            {
+                '$set': {'updated_at': datetime.utcnow()},
+                '$unset': {'lodestone_id': '', 'lodestone_verified_at': ''}
+            }
         )
+        invalidate_user_summary(current_user['_id'])
         
         updated_user_data = get_users_collection().find_one({'_id': ObjectId(current_user['_id'])})
-        user = User.from_dict(updated_user_data)
-        user._id = updated_user_data['_id']
-        
         return jsonify({
             'message': 'Lodestone account unlinked',
-            'user': user.to_dict(include_sensitive=True)
+            'user': User.serialize(updated_user_data, sensitive=True)
         }), 200
         
     except Exception as e:
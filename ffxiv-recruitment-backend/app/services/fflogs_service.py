@@ -0,0 +1,351 @@
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+import requests
+from pymongo import UpdateOne
+from app import get_db
+from app.utils.http_client import HttpClient
+
+
+class FFLogsError(Exception):
+    """A failed FFLogs call; retryable is False for answers that will not change (bad credentials, bad query)"""
+
+    def __init__(self, message, retryable=True, retry_after=None):
+        self.retryable = retryable
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+class FFLogsRateLimited(FFLogsError):
+    """The hourly points budget is spent; retry_after says when it resets"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'FFLogs rate limit reached; retry in {math.ceil(retry_after)}s', retry_after=retry_after)
+
+
+class FFLogsService:
+    """Service for reading character rankings from the FFLogs v2 GraphQL API"""
+
+    TOKEN_URL = "https://www.fflogs.com/oauth/token"
+    API_URL = "https://www.fflogs.com/api/v2/client"
+
+    CLIENT_ID = None
+    CLIENT_SECRET = None
+
+    # Characters per GraphQL query; each is one aliased character() field
+    BATCH_SIZE = 25
+
+    # Rankings per (character, encounter) are kept in the fflogs_cache
+    # collection for CACHE_SECONDS, characters without logs included
+    CACHE_SECONDS = 6 * 3600
+
+    # Points left unspent each hour, so a bulk refresh cannot starve
+    # on-demand lookups; queries are refused below this
+    POINTS_RESERVE = 100
+
+    # Tokens are renewed this long before they expire
+    TOKEN_EXPIRY_MARGIN = 300
+
+    # Queries only read, so POSTs are retried like GETs; a 429 is not
+    # retried here (the points budget decides when to try again)
+    http = HttpClient(retry_methods=('GET', 'POST'), retry_statuses=(500, 502, 503, 504))
+
+    _token = None
+    _token_expires_at = 0.0
+    _token_lock = threading.Lock()
+
+    # Last rateLimitData seen: limit_per_hour, points_spent, reset_at (monotonic)
+    _budget = None
+    _budget_lock = threading.Lock()
+
+    _counts = {'queries': 0, 'lookups': 0, 'cache_hits': 0, 'tokens': 0, 'rate_limited': 0}
+    _counts_lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, config):
+        """Load FFLogs settings from the Flask config"""
+        cls.CLIENT_ID = config.get('FFLOGS_CLIENT_ID')
+        cls.CLIENT_SECRET = config.get('FFLOGS_CLIENT_SECRET')
+        cls.TOKEN_URL = config.get('FFLOGS_TOKEN_URL', cls.TOKEN_URL)
+        cls.API_URL = config.get('FFLOGS_API_URL', cls.API_URL)
+        cls.BATCH_SIZE = config.get('FFLOGS_BATCH_SIZE', cls.BATCH_SIZE)
+        cls.CACHE_SECONDS = config.get('FFLOGS_CACHE_SECONDS', cls.CACHE_SECONDS)
+        cls.POINTS_RESERVE = config.get('FFLOGS_POINTS_RESERVE', cls.POINTS_RESERVE)
+        cls.http.configure(
+            read_timeout=config.get('FFLOGS_READ_TIMEOUT'),
+            retries=config.get('FFLOGS_RETRIES')
+        )
+
+    @classmethod
+    def _count(cls, name, n=1):
+        with cls._counts_lock:
+            cls._counts[name] += n
+
+    @classmethod
+    def stats(cls):
+        """HTTP client counters, lookups served from cache and the points budget"""
+        with cls._counts_lock:
+            counts = dict(cls._counts)
+        return {'http': cls.http.stats(), 'counts': counts, 'budget': cls.budget()}
+
+    @classmethod
+    def reset(cls):
+        """Forget the token and points budget and zero the counters"""
+        with cls._token_lock:
+            cls._token, cls._token_expires_at = None, 0.0
+        with cls._budget_lock:
+            cls._budget = None
+        with cls._counts_lock:
+            cls._counts = dict.fromkeys(cls._counts, 0)
+
+    @classmethod
+    def is_configured(cls):
+        return bool(cls.CLIENT_ID and cls.CLIENT_SECRET)
+
+    @classmethod
+    def _access_token(cls, renew=False):
+        """
+        Client-credentials access token, requested once and reused until
+        TOKEN_EXPIRY_MARGIN seconds before it expires
+
+        Raises:
+            FFLogsError: Missing or rejected credentials (not retryable), or
+                the token endpoint could not be reached
+        """
+        with cls._token_lock:
+            if cls._token and not renew and time.monotonic() < cls._token_expires_at:
+                return cls._token
+            if not cls.is_configured():
+                raise FFLogsError('FFLOGS_CLIENT_ID and FFLOGS_CLIENT_SECRET are not set', retryable=False)
+
+            try:
+                response = cls.http.post(
+                    cls.TOKEN_URL,
+                    data={'grant_type': 'client_credentials'},
+                    auth=(cls.CLIENT_ID, cls.CLIENT_SECRET)
+                )
+                if response.status_code in (400, 401):
+                    raise FFLogsError('FFLogs rejected the client credentials', retryable=False)
+                response.raise_for_status()
+                token = response.json()
+            except requests.exceptions.RequestException as e:
+                raise FFLogsError(f'Failed to get FFLogs access token: {str(e)}')
+
+            cls._count('tokens')
+            cls._token = token['access_token']
+            cls._token_expires_at = time.monotonic() + max(0, token.get('expires_in', 0) - cls.TOKEN_EXPIRY_MARGIN)
+            return cls._token
+
+    @classmethod
+    def budget(cls):
+        """Last known points budget, or None before the first query"""
+        with cls._budget_lock:
+            if cls._budget is None:
+                return None
+            budget = dict(cls._budget)
+        budget['reset_in'] = max(0, math.ceil(budget.pop('reset_at') - time.monotonic()))
+        return budget
+
+    @classmethod
+    def _check_budget(cls):
+        """Raise FFLogsRateLimited while fewer than POINTS_RESERVE points are left this hour"""
+        with cls._budget_lock:
+            budget = cls._budget
+            if budget is None:
+                return
+            retry_after = budget['reset_at'] - time.monotonic()
+            if retry_after <= 0:
+                cls._budget = None
+                return
+            if budget['limit_per_hour'] - budget['points_spent'] > cls.POINTS_RESERVE:
+                return
+        cls._count('rate_limited')
+        raise FFLogsRateLimited(retry_after)
+
+    @classmethod
+    def _record_budget(cls, rate_limit):
+        with cls._budget_lock:
+            cls._budget = {
+                'limit_per_hour': rate_limit['limitPerHour'],
+                'points_spent': rate_limit['pointsSpentThisHour'],
+                'reset_at': time.monotonic() + rate_limit['pointsResetIn']
+            }
+
+    @classmethod
+    def query(cls, query, errors=None):
+        """
+        Run a GraphQL query and return its data
+
+        Queries that select rateLimitData update the points budget. An
+        expired or revoked token is renewed once.
+
+        Args:
+            errors: List that receives the errors FFLogs reports next to
+                partial data (their path names the fields nulled by them).
+                Without it, any error fails the query.
+
+        Raises:
+            FFLogsRateLimited: The budget is down to POINTS_RESERVE, or FFLogs answered 429
+            FFLogsError: Any other failure
+        """
+        cls._check_budget()
+        token = cls._access_token()
+        try:
+            response = cls.http.post(cls.API_URL, json={'query': query}, headers={'Authorization': f'Bearer {token}'})
+            if response.status_code == 401:
+                token = cls._access_token(renew=True)
+                response = cls.http.post(cls.API_URL, json={'query': query}, headers={'Authorization': f'Bearer {token}'})
+            cls._count('queries')
+            if response.status_code == 429:
+                retry_after = float(response.headers.get('Retry-After') or 60)
+                with cls._budget_lock:
+                    cls._budget = {'limit_per_hour': 0, 'points_spent': 0, 'reset_at': time.monotonic() + retry_after}
+                cls._count('rate_limited')
+                raise FFLogsRateLimited(retry_after)
+            response.raise_for_status()
+            body = response.json()
+        except requests.exceptions.RequestException as e:
+            status = getattr(e.response, 'status_code', None)
+            raise FFLogsError(f'Failed to query FFLogs: {str(e)}', retryable=status is None or status >= 500)
+
+        data = body.get('data') or {}
+        if body.get('errors') and (not data or errors is None):
+            message = '; '.join(error.get('message', '') for error in body['errors'])
+            raise FFLogsError(f'FFLogs query failed: {message}', retryable=bool(data))
+        if data.get('rateLimitData'):
+            cls._record_budget(data['rateLimitData'])
+        if body.get('errors'):
+            errors.extend(body['errors'])
+        return data
+
+    @staticmethod
+    def rankings_query(character_ids, encounter_ids):
+        """
+        One query for every (character, encounter) pair
+
+        Each character is an aliased character(id:) field (c0, c1, ...) with
+        an aliased encounterRankings field per encounter (e<encounter id>).
+        """
+        encounters = ' '.join(f'e{e}: encounterRankings(encounterID: {e})' for e in encounter_ids)
+        characters = ' '.join(f'c{i}: character(id: {c}) {{ {encounters} }}' for i, c in enumerate(character_ids))
+        return (
+            'query { rateLimitData { limitPerHour pointsSpentThisHour pointsResetIn } '
+            f'characterData {{ {characters} }} }}'
+        )
+
+    @staticmethod
+    def failed_fields(errors):
+        """
+        Fields of a rankings_query() that errors nulled
+
+        Returns:
+            {(character alias, encounter alias)}, with None as the encounter
+            alias when the whole character failed; None when an error is
+            not below a character (every field is suspect)
+        """
+        failed = set()
+        for error in errors:
+            path = error.get('path') or []
+            if len(path) < 2 or path[0] != 'characterData':
+                return None
+            failed.add((path[1], path[2] if len(path) > 2 else None))
+        return failed
+
+    @staticmethod
+    def summarize_rankings(rankings):
+        """
+        Compact clears and best parse for one encounter
+
+        Returns:
+            dict with kills, best_percent (highest rankPercent), best_spec
+            and fastest_kill (ms), or None without any kill
+        """
+        if not rankings or not rankings.get('totalKills'):
+            return None
+        ranks = rankings.get('ranks') or []
+        best = max(ranks, key=lambda rank: rank.get('rankPercent') or 0, default={})
+        return {
+            'kills': rankings['totalKills'],
+            'best_percent': round(best['rankPercent'], 1) if best.get('rankPercent') is not None else None,
+            'best_spec': best.get('spec'),
+            'fastest_kill': rankings.get('fastestKill')
+        }
+
+    @classmethod
+    def get_encounter_rankings(cls, character_ids, encounter_ids, force=False):
+        """
+        Clears and best parses of FFLogs characters on encounters
+
+        Pairs cached in fflogs_cache are served from there; the rest are
+        fetched in queries of up to BATCH_SIZE characters, each asking for
+        every encounter still missing, and cached for CACHE_SECONDS.
+        force=True skips the cache lookup. Fields FFLogs answered with an
+        error (a partial response) are neither cached nor returned.
+
+        Args:
+            character_ids: FFLogs character IDs
+            encounter_ids: FFLogs encounter IDs
+
+        Returns:
+            {character_id: {encounter_id: summarize_rankings() or None}}
+            with int keys. Unknown or hidden characters map to None; a
+            character's dict lacks the encounters that failed.
+
+        Raises:
+            FFLogsRateLimited, FFLogsError: As query(); pairs fetched by
+                earlier batches stay cached
+        """
+        character_ids = list(dict.fromkeys(int(c) for c in character_ids))
+        encounter_ids = list(dict.fromkeys(int(e) for e in encounter_ids))
+        results = {c: {} for c in character_ids}
+        cls._count('lookups', len(character_ids) * len(encounter_ids))
+
+        collection = get_db().fflogs_cache
+        now = datetime.utcnow()
+        if not force:
+            keys = [f'{c}:{e}' for c in character_ids for e in encounter_ids]
+            entries = list(collection.find({'_id': {'$in': keys}, 'expires_at': {'$gt': now}}))
+            for entry in entries:
+                if entry.get('missing'):
+                    results[entry['character_id']] = None
+                elif results[entry['character_id']] is not None:
+                    results[entry['character_id']][entry['encounter_id']] = entry['data']
+            cls._count('cache_hits', len(entries))
+
+        missing = [c for c in character_ids if results[c] is not None and len(results[c]) < len(encounter_ids)]
+        for start in range(0, len(missing), cls.BATCH_SIZE):
+            batch = missing[start:start + cls.BATCH_SIZE]
+            wanted = [e for e in encounter_ids if any(e not in results[c] for c in batch)]
+            errors = []
+            data = cls.query(cls.rankings_query(batch, wanted), errors=errors)
+            characters = data.get('characterData') or {}
+            failed = cls.failed_fields(errors)
+            if failed is None:
+                continue
+
+            operations = []
+            expires_at = datetime.utcnow() + timedelta(seconds=cls.CACHE_SECONDS)
+            for i, character_id in enumerate(batch):
+                if (f'c{i}', None) in failed:
+                    continue
+                character = characters.get(f'c{i}')
+                for encounter_id in wanted:
+                    if (f'c{i}', f'e{encounter_id}') in failed:
+                        continue
+                    summary = cls.summarize_rankings(character.get(f'e{encounter_id}')) if character else None
+                    operations.append(UpdateOne({'_id': f'{character_id}:{encounter_id}'}, {'$set': {
+                        'character_id': character_id,
+                        'encounter_id': encounter_id,
+                        'data': summary,
+                        'missing': character is None,
+                        'expires_at': expires_at
+                    }}, upsert=True))
+                    if character is not None and encounter_id not in results[character_id]:
+                        results[character_id][encounter_id] = summary
+                if character is None:
+                    results[character_id] = None
+            if operations:
+                collection.bulk_write(operations, ordered=False)
+
+        return results
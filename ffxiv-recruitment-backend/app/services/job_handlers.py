@@ -0,0 +1,185 @@
+import math
+from bson import ObjectId
+from flask import current_app
+from app import get_db
+from app.services.fflogs_service import FFLogsError, FFLogsRateLimited
+from app.services.job_queue import JobQueue, job_handler, PermanentJobError
+from app.services.lodestone_refresh import refresh_all_characters, schedule_refresh_all
+from app.services.lodestone_service import LodestoneService
+from app.services.lodestone_sync import apply_character
+from app.services.progression_sync import refresh_progression, refresh_user_progression, schedule_progression_refresh
+from app.services.search_fields import refresh_schedule_hours, schedule_hours_refresh
+
+
+@job_handler('listing.cascade_delete')
+def cascade_delete_listing(payload, job):
+    """Delete everything that belonged to a deleted listing"""
+    listing_id = payload.get('listing_id')
+    if not listing_id or not ObjectId.is_valid(listing_id):
+        raise PermanentJobError('Invalid listing ID')
+
+    result = get_db().applications.delete_many({'listing_id': ObjectId(listing_id)})
+
+    return {'applications_deleted': result.deleted_count}
+
+
+@job_handler('listing.repair_application_count')
+def repair_application_count(payload, job):
+    """
+    Recompute application_count from the applications collection
+
+    Repairs a single listing when payload has listing_id, otherwise every
+    listing that has drifted.
+    """
+    db = get_db()
+    listing_id = payload.get('listing_id')
+
+    if listing_id:
+        if not ObjectId.is_valid(listing_id):
+            raise PermanentJobError('Invalid listing ID')
+        listing_id = ObjectId(listing_id)
+        count = db.applications.count_documents({'listing_id': listing_id})
+        result = db.listings.update_one(
+            {'_id': listing_id, 'application_count': {'$ne': count}},
+            {'$set': {'application_count': count}}
+        )
+        return {'repaired': result.modified_count, 'application_count': count}
+
+    counts = {
+        row['_id']: row['count']
+        for row in db.applications.aggregate([
+            {'$group': {'_id': '$listing_id', 'count': {'$sum': 1}}}
+        ])
+    }
+
+    repaired = 0
+    for listing in db.listings.find({}, {'application_count': 1}):
+        count = counts.get(listing['_id'], 0)
+        if listing.get('application_count') != count:
+            db.listings.update_one({'_id': listing['_id']}, {'$set': {'application_count': count}})
+            repaired += 1
+
+    return {'repaired': repaired}
+
+
+@job_handler('lodestone.refresh')
+def refresh_lodestone_character(payload, job):
+    """
+    Fetch a Lodestone character and copy it onto the user's profile
+
+    payload: user_id, lodestone_id, link (set lodestone_id rather than
+    refresh the linked character) and force (bypass the Lodestone cache).
+    Upstream outages are retried with the job's backoff; a page that is
+    missing or cannot be parsed fails the job.
+    """
+    user_id = payload.get('user_id')
+    lodestone_id = payload.get('lodestone_id')
+    if not user_id or not ObjectId.is_valid(user_id):
+        raise PermanentJobError('Invalid user ID')
+    if not lodestone_id or not str(lodestone_id).isdigit():
+        raise PermanentJobError('Invalid Lodestone ID')
+
+    lodestone_data = LodestoneService.get_character(lodestone_id, force=payload.get('force', False))
+    if not lodestone_data['success']:
+        if lodestone_data.get('retryable'):
+            raise RuntimeError(lodestone_data['error'])
+        raise PermanentJobError(lodestone_data['error'])
+
+    user = apply_character(user_id, lodestone_id, lodestone_data, link=payload.get('link', False))
+    if not user:
+        raise PermanentJobError('Lodestone account is no longer linked')
+
+    return {
+        'lodestone_id': lodestone_id,
+        'character_name': user.get('character_name'),
+        'server': user.get('server'),
+        'data_center': user.get('data_center'),
+        'cached': lodestone_data['cached']
+    }
+
+
+@job_handler('lodestone.refresh_all')
+def refresh_all_lodestone_characters(payload, job):
+    """
+    Refresh every linked character, then run again after LODESTONE_REFRESH_INTERVAL_SECONDS
+
+    The next run is queued first, so a run that fails for good does not
+    end the schedule. A retried run resumes from the refresher's checkpoint,
+    and the lease is extended after every batch.
+    """
+    interval = current_app.config['LODESTONE_REFRESH_INTERVAL_SECONDS']
+    if interval:
+        schedule_refresh_all(interval, exclude_job_id=job['_id'])
+
+    totals = refresh_all_characters(
+        get_db(),
+        on_batch=lambda totals: JobQueue.extend_lease(job, job.get('worker_id'))
+    )
+    return dict(totals, resumed_from=str(totals['resumed_from']) if totals['resumed_from'] else None)
+
+
+@job_handler('fflogs.progression')
+def refresh_fflogs_progression(payload, job):
+    """
+    Refresh one user's FFLogs progression summary
+
+    payload: user_id and force (bypass fflogs_cache). Outages and the points
+    budget are retried with the job's backoff; rejected credentials or
+    queries fail the job.
+    """
+    user_id = payload.get('user_id')
+    if not user_id or not ObjectId.is_valid(user_id):
+        raise PermanentJobError('Invalid user ID')
+
+    try:
+        user = refresh_user_progression(get_db(), user_id, force=payload.get('force', False))
+    except FFLogsError as e:
+        if e.retryable:
+            raise RuntimeError(str(e))
+        raise PermanentJobError(str(e))
+    if not user:
+        raise PermanentJobError('FFLogs character is no longer linked')
+
+    return {'fflogs_id': user['fflogs_id'], 'progression_clears': user.get('progression_clears', [])}
+
+
+@job_handler('fflogs.progression_all')
+def refresh_all_fflogs_progression(payload, job):
+    """
+    Refresh every user's progression summary, then run again after FFLOGS_PROGRESSION_INTERVAL_SECONDS
+
+    When the FFLogs points budget runs out, the next run is brought forward
+    to when it resets and continues from the checkpoint.
+    """
+    interval = current_app.config['FFLOGS_PROGRESSION_INTERVAL_SECONDS']
+    if interval:
+        schedule_progression_refresh(interval, exclude_job_id=job['_id'])
+
+    try:
+        totals = refresh_progression(
+            get_db(),
+            on_batch=lambda totals: JobQueue.extend_lease(job, job.get('worker_id'))
+        )
+    except FFLogsRateLimited as e:
+        retry_after = math.ceil(e.retry_after)
+        schedule_progression_refresh(retry_after, exclude_job_id=job['_id'])
+        return {'rate_limited': True, 'retry_after': retry_after}
+    except FFLogsError as e:
+        if e.retryable:
+            raise
+        raise PermanentJobError(str(e))
+    return dict(totals, resumed_from=str(totals['resumed_from']) if totals['resumed_from'] else None)
+
+
+@job_handler('search.refresh_schedule_hours')
+def refresh_all_schedule_hours(payload, job):
+    """
+    Re-parse stored schedule buckets, then run again after SCHEDULE_REFRESH_INTERVAL_SECONDS
+
+    Moves the buckets of schedules in daylight-saving zones when the clocks
+    change.
+    """
+    interval = current_app.config['SCHEDULE_REFRESH_INTERVAL_SECONDS']
+    if interval:
+        schedule_hours_refresh(interval, exclude_job_id=job['_id'])
+    return refresh_schedule_hours(get_db())
@@ -0,0 +1,336 @@
+import random
+import socket
+import threading
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+from app import get_db
+
+# Registered job handlers, keyed by job type
+JOB_HANDLERS = {}
+
+JOB_STATUSES = ['queued', 'running', 'succeeded', 'failed']
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying the job cannot help"""
+
+
+def job_handler(job_type):
+    """
+    Decorator registering a function as the handler for a job type
+
+    Handlers are called as handler(payload, job) inside an app context and
+    return a JSON-serializable result. Raising an exception schedules a retry
+    with backoff; raising PermanentJobError fails the job immediately.
+    """
+    def decorator(f):
+        JOB_HANDLERS[job_type] = f
+        return f
+    return decorator
+
+
+class JobQueue:
+    """Background job queue backed by the Mongo jobs collection"""
+
+    # Defaults, overridden from app config by configure()
+    LEASE_SECONDS = 300
+    MAX_ATTEMPTS = 5
+    RETRY_BACKOFF_SECONDS = 10
+    RETRY_BACKOFF_MAX_SECONDS = 3600
+    RETENTION_SECONDS = 7 * 24 * 3600
+
+    # Run jobs a request queues inside that request (see run_inline())
+    RUN_INLINE = False
+
+    @classmethod
+    def configure(cls, config):
+        """Load queue settings from the Flask config"""
+        cls.LEASE_SECONDS = config.get('JOB_LEASE_SECONDS', cls.LEASE_SECONDS)
+        cls.MAX_ATTEMPTS = config.get('JOB_MAX_ATTEMPTS', cls.MAX_ATTEMPTS)
+        cls.RETRY_BACKOFF_SECONDS = config.get('JOB_RETRY_BACKOFF_SECONDS', cls.RETRY_BACKOFF_SECONDS)
+        cls.RETRY_BACKOFF_MAX_SECONDS = config.get('JOB_RETRY_BACKOFF_MAX_SECONDS', cls.RETRY_BACKOFF_MAX_SECONDS)
+        cls.RETENTION_SECONDS = config.get('JOB_RETENTION_SECONDS', cls.RETENTION_SECONDS)
+        cls.RUN_INLINE = bool(config.get('JOB_RUN_INLINE')) and not config.get('JOB_WORKER_ENABLED')
+
+    @staticmethod
+    def get_jobs_collection():
+        """Helper to get jobs collection"""
+        return get_db().jobs
+
+    @classmethod
+    def enqueue(cls, job_type, payload=None, user_id=None, run_at=None, max_attempts=None):
+        """
+        Add a job to the queue
+
+        Args:
+            job_type: Registered handler name, e.g. 'listing.cascade_delete'
+            payload: JSON-serializable arguments for the handler
+            user_id: Owner of the job; only they can poll its status
+            run_at: Earliest time the job may run (default: now)
+            max_attempts: Attempts before the job is marked failed
+
+        Returns:
+            The inserted job document
+        """
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f'Unknown job type: {job_type}')
+
+        now = datetime.utcnow()
+        job = {
+            'type': job_type,
+            'payload': payload or {},
+            'status': 'queued',
+            'attempts': 0,
+            'max_attempts': max_attempts or cls.MAX_ATTEMPTS,
+            'run_at': run_at or now,
+            'user_id': ObjectId(user_id) if user_id else None,
+            'created_at': now,
+            'updated_at': now
+        }
+
+        result = cls.get_jobs_collection().insert_one(job)
+        job['_id'] = result.inserted_id
+        return job
+
+    @classmethod
+    def get(cls, job_id):
+        """Get a job by ID"""
+        if not ObjectId.is_valid(job_id):
+            return None
+        return cls.get_jobs_collection().find_one({'_id': ObjectId(job_id)})
+
+    @classmethod
+    def claim(cls, worker_id, job_id=None):
+        """
+        Atomically claim the next runnable job (or job_id, if it is runnable)
+
+        A job is runnable when it is queued and due, or when a previous
+        worker's lease on it has expired.
+        """
+        now = datetime.utcnow()
+        query = {
+            '$or': [
+                {'status': 'queued', 'run_at': {'$lte': now}},
+                {'status': 'running', 'lease_expires_at': {'$lt': now}}
+            ],
+            'type': {'$in': list(JOB_HANDLERS)}
+        }
+        if job_id is not None:
+            query['_id'] = job_id
+        job = cls.get_jobs_collection().find_one_and_update(
+            query,
+            {
+                '$set': {
+                    'status': 'running',
+                    'worker_id': worker_id,
+                    'lease_expires_at': now + timedelta(seconds=cls.LEASE_SECONDS),
+                    'started_at': now,
+                    'updated_at': now
+                },
+                '$inc': {'attempts': 1}
+            },
+            sort=[('run_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+        # A job whose leases keep expiring (e.g. it crashes the worker) has
+        # used up its attempts without ever reporting back
+        if job and job['attempts'] > job['max_attempts']:
+            cls._finish(job, worker_id, 'failed', error='Lease expired too many times')
+            return cls.claim(worker_id, job_id)
+
+        return job
+
+    @classmethod
+    def extend_lease(cls, job, worker_id):
+        """Extend the lease on a long-running job; False if it was lost"""
+        now = datetime.utcnow()
+        result = cls.get_jobs_collection().update_one(
+            {'_id': job['_id'], 'worker_id': worker_id, 'status': 'running'},
+            {'$set': {
+                'lease_expires_at': now + timedelta(seconds=cls.LEASE_SECONDS),
+                'updated_at': now
+            }}
+        )
+        return result.modified_count == 1
+
+    @classmethod
+    def retry_delay(cls, attempts):
+        """Exponential backoff, jittered between half and all of the delay"""
+        delay = min(cls.RETRY_BACKOFF_SECONDS * (2 ** (attempts - 1)), cls.RETRY_BACKOFF_MAX_SECONDS)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    @classmethod
+    def run_job(cls, job, worker_id):
+        """Run a claimed job and record its outcome"""
+        handler = JOB_HANDLERS[job['type']]
+
+        try:
+            result = handler(job['payload'], job)
+        except PermanentJobError as e:
+            return cls._finish(job, worker_id, 'failed', error=str(e))
+        except Exception as e:
+            traceback.print_exc()
+            if job['attempts'] >= job['max_attempts']:
+                return cls._finish(job, worker_id, 'failed', error=str(e))
+
+            now = datetime.utcnow()
+            cls.get_jobs_collection().update_one(
+                {'_id': job['_id'], 'worker_id': worker_id},
+                {
+                    '$set': {
+                        'status': 'queued',
+                        'error': str(e),
+                        'run_at': now + timedelta(seconds=cls.retry_delay(job['attempts'])),
+                        'updated_at': now
+                    },
+                    '$unset': {'worker_id': '', 'lease_expires_at': ''}
+                }
+            )
+            return 'queued'
+
+        return cls._finish(job, worker_id, 'succeeded', result=result)
+
+    @classmethod
+    def _finish(cls, job, worker_id, status, result=None, error=None):
+        """Mark a job succeeded/failed, unless another worker took it over"""
+        now = datetime.utcnow()
+        update = {
+            'status': status,
+            'finished_at': now,
+            'updated_at': now,
+            'expires_at': now + timedelta(seconds=cls.RETENTION_SECONDS)
+        }
+        if result is not None:
+            update['result'] = result
+        if error is not None:
+            update['error'] = error
+
+        cls.get_jobs_collection().update_one(
+            {'_id': job['_id'], 'worker_id': worker_id},
+            {'$set': update, '$unset': {'lease_expires_at': ''}}
+        )
+        return status
+
+    @classmethod
+    def run_pending(cls, worker_id=None, max_jobs=None, max_seconds=None):
+        """
+        Synchronously run due jobs until the queue is empty
+
+        Must be called inside an app context. Used by tests, the CLI and
+        GET /api/jobs/run. No new job is started after max_seconds.
+
+        Returns:
+            Number of jobs run
+        """
+        worker_id = worker_id or new_worker_id()
+        deadline = datetime.utcnow() + timedelta(seconds=max_seconds) if max_seconds else None
+        count = 0
+        while max_jobs is None or count < max_jobs:
+            if deadline and datetime.utcnow() >= deadline:
+                break
+            job = cls.claim(worker_id)
+            if not job:
+                break
+            cls.run_job(job, worker_id)
+            count += 1
+        return count
+
+    @classmethod
+    def run_inline(cls, job):
+        """
+        Give a job just queued by this request its first attempt right away
+
+        Only with RUN_INLINE, i.e. JOB_RUN_INLINE set and no in-process
+        workers (serverless deployments). A job that fails with a retryable
+        error is queued again with backoff for the worker or the cron-driven
+        GET /api/jobs/run, like any other job.
+
+        Returns:
+            The job document after the attempt, or job as it was when
+            RUN_INLINE is off or the job was already claimed elsewhere
+        """
+        if not cls.RUN_INLINE:
+            return job
+        worker_id = new_worker_id()
+        claimed = cls.claim(worker_id, job['_id'])
+        if not claimed:
+            return job
+        cls.run_job(claimed, worker_id)
+        return cls.get_jobs_collection().find_one({'_id': job['_id']})
+
+    @staticmethod
+    def to_dict(job):
+        """Convert a job document to its public representation (datetimes are left to the JSON provider)"""
+        job_dict = {
+            'id': str(job['_id']),
+            'type': job['type'],
+            'status': job['status'],
+            'attempts': job.get('attempts', 0),
+            'max_attempts': job.get('max_attempts'),
+            'result': job.get('result'),
+            'error': job.get('error'),
+            'run_at': job.get('run_at'),
+            'created_at': job.get('created_at'),
+            'updated_at': job.get('updated_at'),
+            'finished_at': job.get('finished_at')
+        }
+        return {k: v for k, v in job_dict.items() if v is not None}
+
+
+def new_worker_id():
+    """Unique identifier for a worker thread"""
+    return f'{socket.gethostname()}:{uuid.uuid4().hex[:12]}'
+
+
+class JobWorker:
+    """Pool of threads that claim and run jobs from the queue"""
+
+    def __init__(self, app, threads=None, poll_interval=None):
+        self.app = app
+        self.threads = threads or app.config.get('JOB_WORKER_THREADS', 2)
+        self.poll_interval = poll_interval or app.config.get('JOB_POLL_INTERVAL', 1.0)
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads in the background"""
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._loop, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        """Signal the threads to stop and wait for them"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_forever(self):
+        """Run the pool in the foreground until interrupted"""
+        self.start()
+        try:
+            while not self._stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def _loop(self):
+        worker_id = new_worker_id()
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    job = JobQueue.claim(worker_id)
+                    if job:
+                        JobQueue.run_job(job, worker_id)
+                        continue
+            except Exception:
+                traceback.print_exc()
+            self._stop.wait(self.poll_interval)
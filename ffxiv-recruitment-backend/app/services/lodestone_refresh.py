@@ -0,0 +1,204 @@
+"""
+Bulk refresh of every linked Lodestone character
+
+Users with a lodestone_id are streamed through a cursor in _id order, one
+batch at a time. Each batch's pages are fetched by a thread pool (the
+concurrency cap) under a shared RateLimiter, revalidated against the
+lodestone_cache entry where one exists, parsed in a process pool, and
+written back with one bulk_write per collection. After every batch the
+last _id is saved to a checkpoint document, so an interrupted run resumes
+where it stopped instead of starting over. A run stops with
+CircuitOpenError when the Lodestone circuit breaker opens.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from pymongo import ReplaceOne, UpdateOne
+from app.models.user import SEARCH_FIELD_SOURCES, SEARCH_FIELDS
+from app.services.job_queue import JobQueue
+from app.services.lodestone_service import LodestoneService
+from app.services.lodestone_sync import CHARACTER_FIELDS, character_update
+from app.services.user_summaries import invalidate_user_summary
+from app.utils.circuit_breaker import CircuitOpenError
+from app.utils.rate_limit import RateLimiter
+
+CHECKPOINT_ID = 'lodestone.refresh_all'
+
+# Running totals kept in the checkpoint. not_modified counts pages the
+# Lodestone answered 304 for; their cached data is still compared with the
+# profile. unchanged counts users whose profile already matched (not written)
+COUNTERS = ('users', 'updated', 'unchanged', 'failed', 'fetched', 'not_modified')
+
+# User fields read while refreshing: character_update compares the character
+# and search fields and recomputes the latter from their sources
+USER_PROJECTION = dict.fromkeys(
+    ('lodestone_id', 'job_levels') + CHARACTER_FIELDS + SEARCH_FIELD_SOURCES + SEARCH_FIELDS, 1
+)
+
+
+def _parse(args):
+    """Process pool entry point: (content, character_id) -> parsed data"""
+    return LodestoneService.parse_character_page(*args)
+
+
+def _fetch(limiter, lodestone_id, entry):
+    """
+    Download one page, conditionally when there is a cache entry
+
+    Returns:
+        ('fetched', response), ('not_modified', response) or ('failed', error dict)
+    """
+    limiter.wait()
+    return LodestoneService.fetch_page(lodestone_id, entry)
+
+
+def _batches(cursor, batch_size):
+    batch = []
+    for document in cursor:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def refresh_all_characters(db, batch_size=None, concurrency=None, rate=None, processes=None,
+                           resume=True, on_batch=None):
+    """
+    Refresh the character data of every user with a linked Lodestone account
+
+    Settings default to the LODESTONE_REFRESH_* config values. processes=0
+    parses in this thread instead of a process pool.
+
+    Args:
+        resume: Continue after the saved checkpoint (False starts over)
+        on_batch: Called with the running totals after each batch
+
+    Returns:
+        COUNTERS totals, plus resumed_from (the checkpointed _id, or None)
+    """
+    config = current_app.config
+    batch_size = batch_size or config['LODESTONE_REFRESH_BATCH_SIZE']
+    concurrency = concurrency or config['LODESTONE_REFRESH_CONCURRENCY']
+    rate = rate if rate is not None else config['LODESTONE_REFRESH_RATE']
+    processes = processes if processes is not None else config['LODESTONE_REFRESH_PROCESSES']
+
+    checkpoint = db.checkpoints.find_one({'_id': CHECKPOINT_ID}) if resume else None
+    if checkpoint and checkpoint.get('finished_at'):
+        checkpoint = None
+    totals = dict.fromkeys(COUNTERS, 0)
+    query = {'lodestone_id': {'$nin': [None, '']}}
+    if checkpoint:
+        totals.update({name: checkpoint.get(name, 0) for name in COUNTERS})
+        query['_id'] = {'$gt': checkpoint['last_id']}
+    totals['resumed_from'] = checkpoint['last_id'] if checkpoint else None
+
+    limiter = RateLimiter(rate)
+    cursor = db.users.find(query, USER_PROJECTION).sort('_id', 1).batch_size(batch_size)
+    parse_pool = ProcessPoolExecutor(max_workers=processes) if processes else None
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as fetch_pool:
+            for users in _batches(cursor, batch_size):
+                _refresh_batch(db, users, limiter, fetch_pool, parse_pool, totals)
+                db.checkpoints.update_one({'_id': CHECKPOINT_ID}, {
+                    '$set': dict(
+                        {name: totals[name] for name in COUNTERS},
+                        last_id=users[-1]['_id'],
+                        updated_at=datetime.utcnow()
+                    ),
+                    '$setOnInsert': {'started_at': datetime.utcnow()},
+                    '$unset': {'finished_at': ''}
+                }, upsert=True)
+                if on_batch:
+                    on_batch(totals)
+    finally:
+        if parse_pool:
+            parse_pool.shutdown()
+
+    db.checkpoints.update_one(
+        {'_id': CHECKPOINT_ID},
+        {'$set': {'finished_at': datetime.utcnow()}},
+        upsert=True
+    )
+    return totals
+
+
+def _refresh_batch(db, users, limiter, fetch_pool, parse_pool, totals):
+    """Fetch, parse and write back one batch of users"""
+    ids = list({str(user['lodestone_id']) for user in users})
+    entries = {entry['_id']: entry for entry in db.lodestone_cache.find({'_id': {'$in': ids}})}
+
+    # Users sharing a character fetch it once
+    fetched = dict(zip(ids, fetch_pool.map(lambda i: _fetch(limiter, i, entries.get(i)), ids)))
+
+    # Stop rather than mark everyone failed while the Lodestone is down; the
+    # checkpoint is still before this batch, so the next run redoes it
+    retry_after = [
+        result['retry_after'] for status, result in fetched.values()
+        if status == 'failed' and 'retry_after' in result
+    ]
+    if retry_after:
+        raise CircuitOpenError(LodestoneService.breaker.name, max(retry_after))
+    to_parse = [i for i in ids if fetched[i][0] == 'fetched']
+    parse_map = parse_pool.map if parse_pool else map
+    parsed = dict(zip(to_parse, parse_map(_parse, [(fetched[i][1].content, i) for i in to_parse])))
+
+    now = datetime.utcnow()
+    characters, cache_ops = {}, []
+    for lodestone_id in ids:
+        status, result = fetched[lodestone_id]
+        if status == 'not_modified':
+            totals['not_modified'] += 1
+            characters[lodestone_id] = entries[lodestone_id]['data']
+            cache_ops.append(UpdateOne({'_id': lodestone_id}, {'$set': LodestoneService.revalidated_fields(now)}))
+        elif status == 'fetched':
+            totals['fetched'] += 1
+            if parsed[lodestone_id]['success']:
+                characters[lodestone_id] = parsed[lodestone_id]
+                cache_ops.append(ReplaceOne(
+                    {'_id': lodestone_id},
+                    LodestoneService.cache_entry(parsed[lodestone_id], result, now),
+                    upsert=True
+                ))
+
+    # Only users whose profile differs are written (and their summary
+    # dropped). Users who relinked or unlinked since the batch was read are
+    # not matched
+    refreshed = [user for user in users if str(user['lodestone_id']) in characters]
+    changed, user_ops = [], []
+    for user in refreshed:
+        update = character_update(user, user['lodestone_id'], characters[str(user['lodestone_id'])])
+        if update:
+            changed.append(user)
+            user_ops.append(UpdateOne({'_id': user['_id'], 'lodestone_id': user['lodestone_id']}, {'$set': update}))
+    totals['users'] += len(users)
+    totals['failed'] += len(users) - len(refreshed)
+    totals['unchanged'] += len(refreshed) - len(changed)
+
+    if cache_ops:
+        db.lodestone_cache.bulk_write(cache_ops, ordered=False)
+    if user_ops:
+        totals['updated'] += db.users.bulk_write(user_ops, ordered=False).matched_count
+    for user in changed:
+        invalidate_user_summary(user['_id'])
+    for lodestone_id in characters:
+        LodestoneService.front_cache.delete(lodestone_id)
+
+
+def schedule_refresh_all(delay_seconds=0, exclude_job_id=None):
+    """
+    Queue a lodestone.refresh_all job delay_seconds from now
+
+    Does nothing when one is already queued or running (other than
+    exclude_job_id, the job doing the scheduling).
+
+    Returns:
+        The queued job, or None
+    """
+    pending = {'type': 'lodestone.refresh_all', 'status': {'$in': ['queued', 'running']}}
+    if exclude_job_id:
+        pending['_id'] = {'$ne': exclude_job_id}
+    if JobQueue.get_jobs_collection().find_one(pending, {'_id': 1}):
+        return None
+    return JobQueue.enqueue('lodestone.refresh_all', run_at=datetime.utcnow() + timedelta(seconds=delay_seconds))
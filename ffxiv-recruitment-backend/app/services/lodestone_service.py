@@ -1,14 +1,159 @@
+import copy
+import math
+import threading
+import time
+import uuid
 import requests
 from bs4 import BeautifulSoup
 import re
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from app import get_db
+from app.utils.cache import LRUCache, SingleFlight
+from app.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.utils.constants import JOB_CODES
+from app.utils.html_parser import class_strainer, parse_html, resolve_backend
+from app.utils.http_client import HttpClient
+
+class LodestoneUnavailable(CircuitOpenError, requests.exceptions.RequestException):
+    """The Lodestone circuit breaker is open; handled like any failed request"""
+
 
 class LodestoneService:
     """Service for fetching FFXIV Lodestone character data"""
     
     BASE_URL = "https://na.finalfantasyxiv.com/lodestone/character"
     
-    @staticmethod
-    def fetch_character_data(character_id):
+    # Parsed characters are reused for CACHE_FRESH_SECONDS, then revalidated
+    # with If-None-Match / If-Modified-Since; the lodestone_cache TTL index
+    # drops entries not fetched for CACHE_RETENTION_SECONDS
+    CACHE_FRESH_SECONDS = 3600
+    CACHE_RETENTION_SECONDS = 7 * 24 * 3600
+    
+    # Shared keep-alive session; user agent to avoid blocking
+    http = HttpClient(headers={
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    })
+    
+    # Opens when most recent requests fail (maintenance, outages), so calls
+    # fail fast instead of waiting out timeouts; see CircuitBreaker
+    breaker = CircuitBreaker('The Lodestone', error=LodestoneUnavailable)
+    
+    # Per-process copies in front of lodestone_cache
+    front_cache = LRUCache(max_entries=1024, ttl=60)
+    
+    # Page sections the _extract_* helpers read; the rest of the page is
+    # skipped while parsing
+    CHARACTER_SECTIONS = (
+        'frame__chara__name', 'frame__chara__world', 'character__profile__data',
+        'character__freecompany__name', 'character__profile__detail'
+    )
+    character_strainer = class_strainer(*CHARACTER_SECTIONS)
+    
+    # HTML parser backend; None uses lxml when it is installed
+    html_parser = None
+    
+    # One fetch per character at a time; FETCH_LOCK_SECONDS = 0 skips the
+    # cross-worker lock document
+    flights = SingleFlight()
+    FETCH_LOCK_SECONDS = 10
+    
+    _counts = {'front_hits': 0, 'cache_hits': 0, 'revalidated': 0, 'fetches': 0, 'lock_waits': 0, 'stale_served': 0}
+    _counts_lock = threading.Lock()
+    
+    @classmethod
+    def configure(cls, config):
+        """Load Lodestone settings from the Flask config"""
+        cls.BASE_URL = config.get('LODESTONE_BASE_URL', cls.BASE_URL)
+        cls.http.configure(
+            pool_size=config.get('LODESTONE_POOL_SIZE'),
+            connect_timeout=config.get('LODESTONE_CONNECT_TIMEOUT'),
+            read_timeout=config.get('LODESTONE_READ_TIMEOUT'),
+            retries=config.get('LODESTONE_RETRIES'),
+            backoff=config.get('LODESTONE_RETRY_BACKOFF')
+        )
+        cls.breaker.configure(
+            failure_rate=config.get('LODESTONE_BREAKER_FAILURE_RATE'),
+            min_calls=config.get('LODESTONE_BREAKER_MIN_CALLS'),
+            window_seconds=config.get('LODESTONE_BREAKER_WINDOW_SECONDS'),
+            open_seconds=config.get('LODESTONE_BREAKER_OPEN_SECONDS')
+        )
+        cls.FETCH_LOCK_SECONDS = config.get('LODESTONE_FETCH_LOCK_SECONDS', cls.FETCH_LOCK_SECONDS)
+        cls.html_parser = resolve_backend(config.get('LODESTONE_HTML_PARSER'))
+        cls.CACHE_FRESH_SECONDS = config.get('LODESTONE_CACHE_FRESH_SECONDS', cls.CACHE_FRESH_SECONDS)
+        cls.CACHE_RETENTION_SECONDS = config.get('LODESTONE_CACHE_RETENTION_SECONDS', cls.CACHE_RETENTION_SECONDS)
+        cls.front_cache = LRUCache(
+            max_entries=config.get('LODESTONE_FRONT_CACHE_ENTRIES', cls.front_cache.max_entries),
+            ttl=config.get('LODESTONE_FRONT_CACHE_SECONDS', cls.front_cache.ttl)
+        )
+    
+    @classmethod
+    def _count(cls, name):
+        with cls._counts_lock:
+            cls._counts[name] += 1
+    
+    @classmethod
+    def stats(cls):
+        """HTTP client, circuit breaker and cache counters"""
+        with cls._counts_lock:
+            counts = dict(cls._counts)
+        counts['coalesced'] = cls.flights.coalesced
+        return {
+            'http': cls.http.stats(),
+            'breaker': cls.breaker.stats(),
+            'cache': dict(counts, front=cls.front_cache.stats())
+        }
+    
+    @classmethod
+    def reset(cls):
+        """Forget cached characters in this process and zero the counters"""
+        cls.front_cache.clear()
+        with cls._counts_lock:
+            cls._counts = dict.fromkeys(cls._counts, 0)
+        cls.flights.coalesced = 0
+        cls.breaker.reset()
+    
+    @classmethod
+    def _get_page(cls, character_id, headers=None):
+        """
+        GET a character page; transient failures are retried inside the session
+        
+        Raises:
+            LodestoneUnavailable: Without a request while the breaker is open
+        """
+        cls.breaker.allow()
+        ok = False
+        try:
+            response = cls.http.get(f"{cls.BASE_URL}/{character_id}/", headers=headers)
+            ok = response.status_code not in cls.http.RETRY_STATUSES
+            return response
+        finally:
+            cls.breaker.record(ok)
+    
+    @classmethod
+    def fetch_page(cls, character_id, entry=None):
+        """
+        Download a character page without parsing or caching it
+
+        With entry (its lodestone_cache document) the request is
+        conditional. Used by the bulk refresher, which parses and caches
+        whole batches itself.
+        
+        Returns:
+            ('fetched', response), ('not_modified', response) or
+            ('failed', error dict as _fetch_error())
+        """
+        try:
+            response = cls._get_page(character_id, headers=cls.conditional_headers(entry))
+            if response.status_code == 304 and entry:
+                return 'not_modified', response
+            response.raise_for_status()
+            return 'fetched', response
+        except requests.exceptions.RequestException as e:
+            return 'failed', cls._fetch_error(e)
+    
+    @classmethod
+    def fetch_character_data(cls, character_id):
         """
         Fetch character data from Lodestone
         
@@ -19,18 +164,223 @@ class LodestoneService:
             dict with character data or error message
         """
         try:
-            url = f"{LodestoneService.BASE_URL}/{character_id}/"
-            
-            # Add timeout and user agent to avoid blocking
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            
-            response = requests.get(url, headers=headers, timeout=10)
+            response = cls._get_page(character_id)
             response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
+        except requests.exceptions.RequestException as e:
+            return cls._fetch_error(e)
+        return cls.parse_character_page(response.content, character_id)
+    
+    @classmethod
+    def _fetch_error(cls, e):
+        """
+        Failure result for a request that raised e
+        
+        'retryable' is True for connection errors, timeouts and 429/5xx,
+        which may succeed later, and False for answers such as a 404.
+        While the breaker is open, 'retry_after' says when to try again.
+        """
+        response = getattr(e, 'response', None)
+        error = {
+            'success': False,
+            'error': f'Failed to fetch Lodestone data: {str(e)}',
+            'retryable': response is None or response.status_code in cls.http.RETRY_STATUSES
+        }
+        if isinstance(e, LodestoneUnavailable):
+            error['retry_after'] = math.ceil(e.retry_after)
+        return error
+    
+    @classmethod
+    def _lookup(cls, character_id):
+        """
+        (fresh cached data or None, lodestone_cache entry or None)
+        
+        Never touches the network; the entry is returned even when stale so
+        it can be revalidated.
+        """
+        data = cls.front_cache.get(character_id)
+        if data is not None:
+            cls._count('front_hits')
+            return dict(copy.deepcopy(data), cached=True), None
+        
+        entry = get_db().lodestone_cache.find_one({'_id': character_id})
+        if entry and entry['fetched_at'] + timedelta(seconds=cls.CACHE_FRESH_SECONDS) > datetime.utcnow():
+            cls._count('cache_hits')
+            cls.front_cache.set(character_id, entry['data'])
+            return dict(copy.deepcopy(entry['data']), cached=True), entry
+        return None, entry
+    
+    @classmethod
+    def get_cached_character(cls, character_id):
+        """Fresh cached character data, or None when the page would have to be fetched"""
+        return cls._lookup(str(character_id))[0]
+    
+    @classmethod
+    def get_character(cls, character_id, force=False):
+        """
+        Character data for character_id, served from cache where possible
+        
+        Looks in the per-process front cache, then the lodestone_cache
+        collection. A stale entry is revalidated with the ETag /
+        Last-Modified the Lodestone sent with it, so an unchanged page
+        costs a 304 instead of a download and parse. force=True always
+        downloads the page and replaces the cached copy.
+        
+        While the circuit breaker is open nothing is downloaded: a cached
+        copy of any age is returned with 'stale': True and 'retry_after',
+        and without one the failure carries 'retry_after'.
+        
+        Concurrent calls for the same character share one fetch: threads
+        through flights, other workers through a lock document (see
+        _fetch_once()).
+        
+        Returns:
+            dict like fetch_character_data, plus 'cached' (True when no
+            page was downloaded). Failures are never cached; they carry
+            'retryable' as described in _fetch_error().
+        """
+        character_id = str(character_id)
+        entry = None
+        if not force:
+            data, entry = cls._lookup(character_id)
+            if data is not None:
+                return data
+        
+        # Concurrent callers in this process share one fetch and parse
+        data = cls.flights.do(character_id, lambda: cls._fetch_once(character_id, entry))
+        return copy.deepcopy(data)
+    
+    @classmethod
+    def _fetch_once(cls, character_id, entry):
+        """
+        Fetch a character unless another worker is already doing so
+        
+        Takes a short-lived lock document in the locks collection. When
+        another worker holds it, waits up to FETCH_LOCK_SECONDS for its
+        result to reach lodestone_cache instead of downloading the page
+        again, then fetches anyway if none arrived (e.g. that fetch failed).
+        """
+        if not cls.FETCH_LOCK_SECONDS:
+            return cls._fetch(character_id, entry)
+        
+        locks = get_db().locks
+        lock_id = f'lodestone:{character_id}'
+        owner = uuid.uuid4().hex
+        started = datetime.utcnow().replace(microsecond=0)
+        if not cls._acquire_lock(locks, lock_id, owner, started):
+            cls._count('lock_waits')
+            deadline = time.monotonic() + cls.FETCH_LOCK_SECONDS
+            while time.monotonic() < deadline and locks.find_one({'_id': lock_id, 'expires_at': {'$gt': datetime.utcnow()}}):
+                time.sleep(0.05)
+            entry = get_db().lodestone_cache.find_one({'_id': character_id}) or entry
+            if entry and entry['fetched_at'] >= started:
+                cls._count('cache_hits')
+                cls.front_cache.set(character_id, entry['data'])
+                return dict(copy.deepcopy(entry['data']), cached=True)
+            if not cls._acquire_lock(locks, lock_id, owner, datetime.utcnow()):
+                return cls._fetch(character_id, entry)
+        
+        try:
+            return cls._fetch(character_id, entry)
+        finally:
+            locks.delete_one({'_id': lock_id, 'owner': owner})
+    
+    @classmethod
+    def _acquire_lock(cls, locks, lock_id, owner, now):
+        """Insert the lock document, or take it over once expired; False if held"""
+        expires_at = now + timedelta(seconds=cls.FETCH_LOCK_SECONDS)
+        try:
+            locks.insert_one({'_id': lock_id, 'owner': owner, 'expires_at': expires_at})
+            return True
+        except DuplicateKeyError:
+            # The TTL monitor only runs every minute, so expired locks may linger
+            return locks.update_one(
+                {'_id': lock_id, 'expires_at': {'$lte': now}},
+                {'$set': {'owner': owner, 'expires_at': expires_at}}
+            ).modified_count == 1
+    
+    @classmethod
+    def _fetch(cls, character_id, entry):
+        """Download (or revalidate) and parse a character page, updating both caches"""
+        collection = get_db().lodestone_cache
+        now = datetime.utcnow()
+        try:
+            response = cls._get_page(character_id, headers=cls.conditional_headers(entry))
+            if response.status_code == 304 and entry:
+                cls._count('revalidated')
+                collection.update_one({'_id': character_id}, {'$set': cls.revalidated_fields(now)})
+                cls.front_cache.set(character_id, entry['data'])
+                return dict(copy.deepcopy(entry['data']), cached=True)
+            response.raise_for_status()
+        except LodestoneUnavailable as e:
+            # Better an old copy than nothing while the Lodestone is down
+            entry = entry or collection.find_one({'_id': character_id})
+            if not entry:
+                return cls._fetch_error(e)
+            cls._count('stale_served')
+            return dict(copy.deepcopy(entry['data']), cached=True, stale=True, retry_after=math.ceil(e.retry_after))
+        except requests.exceptions.RequestException as e:
+            return cls._fetch_error(e)
+        
+        cls._count('fetches')
+        data = cls.parse_character_page(response.content, character_id)
+        if data['success']:
+            collection.replace_one({'_id': character_id}, cls.cache_entry(data, response, now), upsert=True)
+            cls.front_cache.set(character_id, copy.deepcopy(data))
+        return dict(data, cached=False)
+    
+    @staticmethod
+    def conditional_headers(entry):
+        """If-None-Match / If-Modified-Since for revalidating a lodestone_cache entry"""
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+    
+    @classmethod
+    def cache_entry(cls, data, response, now):
+        """lodestone_cache document for data parsed from response"""
+        return {
+            'data': data,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': now,
+            'expires_at': now + timedelta(seconds=cls.CACHE_RETENTION_SECONDS)
+        }
+    
+    @classmethod
+    def revalidated_fields(cls, now):
+        """Fields to $set on a lodestone_cache entry the Lodestone answered 304 for"""
+        return {'fetched_at': now, 'expires_at': now + timedelta(seconds=cls.CACHE_RETENTION_SECONDS)}
+    
+    @staticmethod
+    def parse_character_page(content, character_id, backend=None):
+        """
+        Parse a Lodestone character page
+        
+        Only the CHARACTER_SECTIONS subtrees are built, with the configured
+        parser backend unless one is given.
+        
+        Returns:
+            dict with character data or error message
+        """
+        soup = parse_html(
+            content,
+            backend or LodestoneService.html_parser,
+            parse_only=LodestoneService.character_strainer
+        )
+        return LodestoneService.extract_character(soup, character_id)
+    
+    @staticmethod
+    def extract_character(soup, character_id):
+        """
+        Character data from a parsed page, full or limited to CHARACTER_SECTIONS
+        
+        Returns:
+            dict with character data or error message
+        """
+        try:
             # Extract character name
             character_name = LodestoneService._extract_character_name(soup)
             
@@ -41,7 +391,7 @@ class LodestoneService:
             data_center = LodestoneService._extract_data_center(server)
             
             # Extract classes/jobs
-            jobs = LodestoneService._extract_jobs(soup)
+            job_levels = LodestoneService._extract_jobs(soup)
 
             char_deets = LodestoneService._extract_character_details(soup)
             
@@ -64,7 +414,7 @@ class LodestoneService:
                 'character_name': character_name,
                 'server': server,
                 'data_center': data_center,
-                'jobs': jobs,
+                'job_levels': job_levels,
                 'grand_company': grand_company,
                 'grand_company_rank' : grand_company_rank,
                 'free_company': free_company,
@@ -73,11 +423,6 @@ class LodestoneService:
                 'gender' : gender
             }
             
-        except requests.exceptions.RequestException as e:
-            return {
-                'success': False,
-                'error': f'Failed to fetch Lodestone data: {str(e)}'
-            }
         except Exception as e:
             return {
                 'success': False,
@@ -98,17 +443,29 @@ class LodestoneService:
     
     @staticmethod 
     def _extract_character_details(soup : BeautifulSoup):
+        """
+        Race, clan, gender, grand company and free company from the profile
+
+        The grand company block is found by its title, so characters
+        without a grand company or free company get None for those keys.
+        """
         try:
             ret = {}
             character_info = soup.find('div', class_='character__profile__data')
-            character_info = [s.text for s in character_info.find_all('p', class_='character-block__name')]
-            race_gender = re.sub(r'(?<!^)([A-Z])', r' \1', character_info[0]).split("/")
+            blocks = [
+                (block.find('p', class_='character-block__title'), block.find('p', class_='character-block__name'))
+                for block in character_info.find_all('div', class_='character-block')
+            ]
+            blocks = [(title.text.strip() if title else '', name.text) for title, name in blocks if name]
+            race_gender = re.sub(r'(?<!^)([A-Z])', r' \1', blocks[0][1]).split("/")
             ret["race"] = race_gender[0].strip().split(" ")[0]
             ret["sub_race"] = race_gender[0].strip().split(" ")[1]
             ret["gender"] = "Female" if race_gender[1].strip() == "♀" else "Male"
-            ret["grand_company"] = character_info[3].split("/")[0].strip()
-            ret["grand_company_rank"] = character_info[3].split("/")[1].strip()
-            ret["free_company"] = soup.find('div', class_="character__freecompany__name").text.replace("Free Company", "")
+            grand_company = next((name for title, name in blocks if title == 'Grand Company'), None)
+            ret["grand_company"] = grand_company.split("/")[0].strip() if grand_company else None
+            ret["grand_company_rank"] = grand_company.split("/")[1].strip() if grand_company else None
+            free_company = soup.find('div', class_="character__freecompany__name")
+            ret["free_company"] = free_company.text.replace("Free Company", "") if free_company else None
             return ret
         except:
             pass
@@ -171,42 +528,42 @@ class LodestoneService:
     
     @staticmethod
     def _extract_jobs(soup):
-        """Extract unlocked jobs/classes"""
+        """
+        Levels of unlocked jobs/classes as [{'j': 'PLD', 'l': 100}, ...]
+        
+        The page lists a level (or "-" when locked) for every job in
+        JOB_CODES order. This compact list is stored on the user as
+        job_levels, where a multikey index answers job/level searches.
+        """
         try:
-            jobs = dict()
             job_elements = soup.find('div', class_='character__profile__detail')
-            tanks = dict()
-            child_elements = job_elements.findChildren()
             job_level_strings = list(job_elements.find('div', class_= 'js__character_toggle').stripped_strings)
-            tank_job_levels = job_level_strings[:4]
-            healer_job_levels = job_level_strings[4:8]
-            melee_dps_job_levels = job_level_strings[8:14]
-            ranged_dps_job_levels = job_level_strings[14:17]
-            caster_dps_job_levels = job_level_strings[17:22]
-            crafter_job_levels = job_level_strings[22:30]
-            gatherer_job_levels = job_level_strings[30:33]
-            job_list = ["PLD", "WAR", "DRK", "GNB", "WHM", "SCH", "AST", "SGE", "DRG", "MNK", "NIN", "SAM", "RPR", "VPR", "BRD", "MCH", "DNC", "BLM", "SMN", "RDM", "PCT", "BLU", "CRP", "BSM", "ARM", "GSM", "LTW", "WVR", "ALC", "CUL", "MIN", "BTN", "FSH"]
-            ret = {"tanks" : {}, "healers" : {}, "melee_dps" : {}, "ranged_dps" : {}, "magical_dps" : {}, "crafters" : {}, "gatherers": {}}
-            for i in range(len(job_level_strings)):
-                if i < 4:
-                    ret["tanks"][job_list[i]] = job_level_strings[i]
-                elif i < 8:
-                    ret["healers"][job_list[i]] = job_level_strings[i]
-                elif i < 14:
-                    ret["melee_dps"][job_list[i]] = job_level_strings[i]
-                elif i < 17:
-                    ret["ranged_dps"][job_list[i]] = job_level_strings[i]
-                elif i < 22:
-                    ret["magical_dps"][job_list[i]] = job_level_strings[i]
-                elif i < 30:
-                    ret["crafters"][job_list[i]] = job_level_strings[i]
-                elif i < 33:
-                    ret["gatherers"][job_list[i]] = job_level_strings[i]
-            return ret
+            return [
+                {'j': code, 'l': int(level)}
+                for code, level in zip(JOB_CODES, job_level_strings)
+                if level.isdigit()
+            ]
         except:
             pass
         return []
     
+    @staticmethod
+    def job_levels(character_data):
+        """
+        job_levels of parsed character data
+        
+        Copies cached before job_levels existed have 'jobs' instead:
+        {"tanks": {"PLD": "100", ...}, ...}, which is flattened here.
+        """
+        if 'job_levels' in character_data:
+            return character_data['job_levels']
+        return [
+            {'j': code, 'l': int(level)}
+            for group in (character_data.get('jobs') or {}).values()
+            for code, level in group.items()
+            if str(level).isdigit()
+        ]
+    
     @staticmethod
     def _extract_grand_company(soup):
         """Extract Grand Company information"""
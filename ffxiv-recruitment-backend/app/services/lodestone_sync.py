@@ -0,0 +1,86 @@
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from app import get_db
+from app.models.user import User
+from app.services.lodestone_service import LodestoneService
+from app.services.user_summaries import invalidate_user_summary
+
+# Profile fields copied from parsed Lodestone character data
+CHARACTER_FIELDS = (
+    'character_name', 'server', 'data_center', 'free_company', 'gender', 'race', 'sub_race',
+    'grand_company', 'grand_company_rank'
+)
+
+
+def character_update(user, lodestone_id, lodestone_data):
+    """
+    $set document copying lodestone_data onto user, derived search fields included
+
+    Only fields that differ from user are included, plus updated_at when
+    any do; an unchanged character gives {} so nothing needs writing.
+    user must hold CHARACTER_FIELDS, job_levels, lodestone_id and the
+    search fields with their sources.
+    """
+    update_data = {field: lodestone_data.get(field) for field in CHARACTER_FIELDS}
+    update_data['job_levels'] = LodestoneService.job_levels(lodestone_data)
+    update_data['lodestone_id'] = lodestone_id
+    update_data.update(User.search_fields(dict(user, **update_data)))
+    update_data = {field: value for field, value in update_data.items() if user.get(field) != value}
+    if update_data:
+        update_data['updated_at'] = datetime.utcnow()
+    return update_data
+
+
+def apply_character(user_id, lodestone_id, lodestone_data, link=False):
+    """
+    Copy parsed character data onto a user's profile
+
+    With link=False (a refresh) the update only applies while the user is
+    still linked to lodestone_id, so a job finishing after an unlink or a
+    link to another character changes nothing.
+
+    Returns:
+        The updated user document (as it was when nothing changed), or
+        None if it was not updated
+    """
+    users = get_db().users
+    query = {'_id': ObjectId(user_id)}
+    if not link:
+        query['lodestone_id'] = lodestone_id
+
+    user = users.find_one(query)
+    if not user:
+        return None
+
+    update_data = character_update(user, lodestone_id, lodestone_data)
+    if not update_data:
+        return user
+    updated = users.find_one_and_update(query, {'$set': update_data}, return_document=ReturnDocument.AFTER)
+    if updated:
+        invalidate_user_summary(user_id)
+    return updated
+
+
+def migrate_job_levels(db, batch_size=500):
+    """
+    Replace the nested 'jobs' field of users linked before job_levels existed
+
+    Safe to re-run: only users that still have 'jobs' are touched.
+
+    Returns:
+        Number of users migrated
+    """
+    migrated = 0
+    operations = []
+    for user in db.users.find({'jobs': {'$exists': True}}, {'jobs': 1}).batch_size(batch_size):
+        operations.append(UpdateOne(
+            {'_id': user['_id']},
+            {'$set': {'job_levels': LodestoneService.job_levels(user)}, '$unset': {'jobs': ''}}
+        ))
+        if len(operations) >= batch_size:
+            migrated += db.users.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        migrated += db.users.bulk_write(operations, ordered=False).modified_count
+    return migrated
@@ -0,0 +1,74 @@
+import math
+from flask import current_app
+from app import get_db
+from app.utils.trigrams import similarity, trigrams
+
+
+def rank_players_by_name(name, query):
+    """
+    Rank users matching query by how closely username or character_name matches name
+
+    Candidates come from the multikey index on name_trigrams: only users
+    sharing at least enough trigrams with the name to reach
+    NAME_SEARCH_MIN_SIMILARITY are counted, and at most
+    NAME_SEARCH_MAX_CANDIDATES of those with the most shared trigrams are
+    scored, so the work done depends on the matches rather than the number
+    of users.
+
+    A user sharing min_shared of the query's n trigrams holds at least one
+    of any n - min_shared + 1 of them, so candidates are first fetched by
+    the rarest n - min_shared + 1 only; a common trigram such as "  a" then
+    no longer pulls every user holding it into the $unwind / $group.
+
+    Returns:
+        ([(user_id, score)] best first, capped), capped being True when
+        NAME_SEARCH_MAX_CANDIDATES cut the candidates (more users may match)
+    """
+    query_grams = trigrams(name)
+    if not query_grams:
+        return [], False
+
+    config = current_app.config
+    min_similarity = config.get('NAME_SEARCH_MIN_SIMILARITY', 0.25)
+    # A name can only reach min_similarity if it contains that share of the
+    # query's trigrams (the score never exceeds that share)
+    min_shared = max(1, math.ceil(min_similarity * len(query_grams)))
+    gram_list = sorted(query_grams)
+    users = get_db().users
+    max_candidates = config.get('NAME_SEARCH_MAX_CANDIDATES', 500)
+    # Users holding each trigram, counted on the name_trigrams index. Only
+    # the order among rare trigrams matters, so counting stops at
+    # max_candidates and a common trigram costs no more than a rare one
+    frequency = {
+        gram: users.count_documents({'name_trigrams': gram}, limit=max_candidates)
+        for gram in gram_list
+    }
+    rarest = sorted(gram_list, key=lambda gram: (frequency[gram], gram))[:len(gram_list) - min_shared + 1]
+
+    candidates = users.aggregate([
+        {'$match': {'$and': [query, {'name_trigrams': {'$in': rarest}}]}},
+        {'$project': {'name_trigrams': 1}},
+        {'$unwind': '$name_trigrams'},
+        {'$match': {'name_trigrams': {'$in': gram_list}}},
+        {'$group': {'_id': '$_id', 'shared': {'$sum': 1}}},
+        {'$match': {'shared': {'$gte': min_shared}}},
+        {'$sort': {'shared': -1, '_id': 1}},
+        {'$limit': max_candidates}
+    ])
+    candidate_ids = [candidate['_id'] for candidate in candidates]
+    capped = len(candidate_ids) >= max_candidates
+
+    # Score each name on its own, so a long character name does not dilute
+    # a close username match
+    scores = []
+    for user in users.find({'_id': {'$in': candidate_ids}}, {'username': 1, 'character_name': 1}):
+        score = max(
+            similarity(query_grams, trigrams(user.get('username'))),
+            similarity(query_grams, trigrams(user.get('character_name')))
+        )
+        if score >= min_similarity:
+            scores.append((user['_id'], score))
+
+    scores.sort(key=lambda item: (-item[1], str(item[0])))
+    return scores, capped
+
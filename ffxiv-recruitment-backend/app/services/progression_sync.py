@@ -0,0 +1,195 @@
+"""
+FFLogs progression summaries on user profiles
+
+A user's progression maps each PROGRESSION_ENCOUNTERS code they have
+cleared to the summary FFLogsService keeps per encounter (kills,
+best_percent, best_spec, fastest_kill), and progression_clears lists those
+codes. progression_clears is multikey-indexed, so players meeting a
+listing's requirements.progression are found with one indexed query
+instead of FFLogs calls per player.
+
+Users with an fflogs_id are refreshed in _id order, FFLogsService.BATCH_SIZE
+at a time: one get_encounter_rankings() call (one GraphQL query for the
+pairs not cached) and one bulk_write per batch. The last _id is
+checkpointed after every batch, so a run stopped by the FFLogs points
+budget resumes where it stopped.
+"""
+from datetime import datetime, timedelta
+from itertools import islice
+from bson import ObjectId
+from pymongo import UpdateOne
+from app.services.fflogs_service import FFLogsError, FFLogsService
+from app.services.job_queue import JobQueue
+from app.services.user_summaries import invalidate_user_summary
+from app.utils.constants import PROGRESSION_ENCOUNTERS
+
+CHECKPOINT_ID = 'fflogs.progression'
+
+# User fields _refresh_batch reads, to skip writes that change nothing
+USER_PROJECTION = {'fflogs_id': 1, 'progression': 1, 'progression_clears': 1}
+
+# Running totals kept in the checkpoint. not_found counts users whose
+# fflogs_id is not a (public) FFLogs character; their progression is cleared.
+# failed counts users FFLogs answered with errors; they are left as they were
+COUNTERS = ('users', 'updated', 'not_found', 'failed')
+
+
+def empty_progression():
+    """Progression fields of a user without FFLogs data"""
+    return {'progression': {}, 'progression_clears': []}
+
+
+def progression_fields(rankings):
+    """progression / progression_clears from {encounter id: summary or None}"""
+    progression = {
+        code: rankings[encounter_id]
+        for code, encounter_id in PROGRESSION_ENCOUNTERS.items()
+        if (rankings or {}).get(encounter_id)
+    }
+    return {'progression': progression, 'progression_clears': list(progression)}
+
+
+def _refresh_batch(db, users, totals, force=False):
+    """
+    Fetch rankings for one batch of users and write their summaries back
+
+    users carry their stored progression fields (USER_PROJECTION).
+    progression_updated_at is set on every user refreshed; updated_at and
+    the cached user summary only change with the progression itself.
+    """
+    character_ids = [int(user['fflogs_id']) for user in users if str(user['fflogs_id']).isdigit()]
+    rankings = FFLogsService.get_encounter_rankings(
+        character_ids, PROGRESSION_ENCOUNTERS.values(), force=force
+    ) if character_ids else {}
+
+    now = datetime.utcnow()
+    operations = []
+    changed = []
+    for user in users:
+        fflogs_id = str(user['fflogs_id'])
+        character = rankings.get(int(fflogs_id)) if fflogs_id.isdigit() else None
+        if character is None:
+            totals['not_found'] += 1
+        elif any(encounter_id not in character for encounter_id in PROGRESSION_ENCOUNTERS.values()):
+            # Some of their rankings came back as GraphQL errors
+            totals['failed'] += 1
+            continue
+        fields = progression_fields(character)
+        update = {'progression_updated_at': now}
+        if any(user.get(name) != value for name, value in fields.items()):
+            update.update(fields, updated_at=now)
+            changed.append(user['_id'])
+        # Users who changed or removed their fflogs_id since the batch was read are not matched
+        operations.append(UpdateOne({'_id': user['_id'], 'fflogs_id': user['fflogs_id']}, {'$set': update}))
+
+    totals['users'] += len(users)
+    if operations:
+        totals['updated'] += db.users.bulk_write(operations, ordered=False).matched_count
+    for user_id in changed:
+        invalidate_user_summary(user_id)
+
+
+def refresh_progression(db, resume=True, force=False, on_batch=None):
+    """
+    Refresh the progression summary of every user with an fflogs_id
+
+    Args:
+        resume: Continue after the saved checkpoint (False starts over)
+        force: Query FFLogs even for rankings still in fflogs_cache
+        on_batch: Called with the running totals after each batch
+
+    Returns:
+        COUNTERS totals, plus resumed_from (the checkpointed _id, or None)
+
+    Raises:
+        FFLogsRateLimited: The points budget ran out; the checkpoint is
+            before the batch that hit it
+        FFLogsError: As FFLogsService.query()
+    """
+    checkpoint = db.checkpoints.find_one({'_id': CHECKPOINT_ID}) if resume else None
+    if checkpoint and checkpoint.get('finished_at'):
+        checkpoint = None
+    totals = dict.fromkeys(COUNTERS, 0)
+    query = {'fflogs_id': {'$nin': [None, '']}}
+    if checkpoint:
+        totals.update({name: checkpoint.get(name, 0) for name in COUNTERS})
+        query['_id'] = {'$gt': checkpoint['last_id']}
+    totals['resumed_from'] = checkpoint['last_id'] if checkpoint else None
+
+    batch_size = FFLogsService.BATCH_SIZE
+    cursor = db.users.find(query, USER_PROJECTION).sort('_id', 1).batch_size(batch_size)
+    while True:
+        users = list(islice(cursor, batch_size))
+        if not users:
+            break
+        _refresh_batch(db, users, totals, force)
+        db.checkpoints.update_one({'_id': CHECKPOINT_ID}, {
+            '$set': dict(
+                {name: totals[name] for name in COUNTERS},
+                last_id=users[-1]['_id'],
+                updated_at=datetime.utcnow()
+            ),
+            '$setOnInsert': {'started_at': datetime.utcnow()},
+            '$unset': {'finished_at': ''}
+        }, upsert=True)
+        if on_batch:
+            on_batch(totals)
+
+    db.checkpoints.update_one(
+        {'_id': CHECKPOINT_ID},
+        {'$set': {'finished_at': datetime.utcnow()}},
+        upsert=True
+    )
+    return totals
+
+
+def refresh_user_progression(db, user_id, force=False):
+    """
+    Refresh one user's progression summary
+
+    Returns:
+        The updated user document, or None if they have no fflogs_id
+
+    Raises:
+        FFLogsError: As FFLogsService.query(), or (retryable) FFLogs
+            answered some of the user's rankings with errors
+    """
+    user = db.users.find_one({'_id': ObjectId(user_id), 'fflogs_id': {'$nin': [None, '']}}, USER_PROJECTION)
+    if not user:
+        return None
+    totals = dict.fromkeys(COUNTERS, 0)
+    _refresh_batch(db, [user], totals, force)
+    if totals['failed']:
+        raise FFLogsError(f"FFLogs returned errors for character {user['fflogs_id']}")
+    return db.users.find_one({'_id': user['_id']})
+
+
+def schedule_progression_refresh(delay_seconds=0, exclude_job_id=None):
+    """
+    Queue an fflogs.progression_all job delay_seconds from now
+
+    When one is already queued, it is brought forward to delay_seconds from
+    now if it was due later; when one is running (other than exclude_job_id,
+    the job doing the scheduling), nothing changes.
+
+    Returns:
+        The queued job, or None if one was already queued or running
+    """
+    run_at = datetime.utcnow() + timedelta(seconds=delay_seconds)
+    jobs = JobQueue.get_jobs_collection()
+    pending = {'type': 'fflogs.progression_all', 'status': {'$in': ['queued', 'running']}}
+    if exclude_job_id:
+        pending['_id'] = {'$ne': exclude_job_id}
+    existing = jobs.find_one(pending, {'status': 1, 'run_at': 1})
+    if existing:
+        if existing['status'] == 'queued' and existing['run_at'] > run_at:
+            jobs.update_one({'_id': existing['_id'], 'status': 'queued'}, {'$set': {'run_at': run_at}})
+        return None
+    return JobQueue.enqueue('fflogs.progression_all', run_at=run_at)
+
+
+def queue_user_progression(user_id):
+    """Queue an fflogs.progression job for a user who set their fflogs_id (no-op without FFLogs credentials)"""
+    if not FFLogsService.is_configured():
+        return None
+    return JobQueue.enqueue('fflogs.progression', {'user_id': str(user_id)}, user_id=user_id)
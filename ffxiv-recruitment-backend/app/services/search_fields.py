@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from app.models import listing, user
+from app.services.job_queue import JobQueue
+from app.utils.schedule import parse_schedule
+
+# collection -> (search_fields function, document fields it reads)
+SEARCH_FIELD_MODELS = {
+    'users': (user.User.search_fields, user.SEARCH_FIELD_SOURCES),
+    'listings': (listing.Listing.search_fields, listing.SEARCH_FIELD_SOURCES)
+}
+
+# collection -> free-text schedule field that schedule_hours is parsed from
+SCHEDULE_SOURCES = {'users': 'availability', 'listings': 'schedule'}
+
+
+def backfill_search_fields(db, batch_size=500):
+    """
+    Recompute the derived search fields of every user and listing
+
+    Needed once for documents written before a search field existed. Safe
+    to re-run: writes are idempotent and batched into unordered bulk writes.
+
+    Returns:
+        {collection: number of documents updated}
+    """
+    updated = {}
+    for collection, (search_fields, sources) in SEARCH_FIELD_MODELS.items():
+        operations = []
+        updated[collection] = 0
+        for document in db[collection].find({}, dict.fromkeys(sources, 1)).batch_size(batch_size):
+            operations.append(UpdateOne({'_id': document['_id']}, {'$set': search_fields(document)}))
+            if len(operations) >= batch_size:
+                updated[collection] += db[collection].bulk_write(operations, ordered=False).modified_count
+                operations = []
+        if operations:
+            updated[collection] += db[collection].bulk_write(operations, ordered=False).modified_count
+    return updated
+
+
+def refresh_schedule_hours(db, batch_size=500):
+    """
+    Re-parse schedule_hours of every user and listing with a schedule
+
+    Buckets of zones with daylight saving time are computed with the offset
+    of the moment they were parsed; re-parsing moves them when the clocks
+    change. Only documents whose buckets differ are written.
+
+    Returns:
+        {collection: number of documents updated}
+    """
+    updated = {}
+    for collection, source in SCHEDULE_SOURCES.items():
+        operations = []
+        updated[collection] = 0
+        query = {source: {'$nin': [None, '', []]}}
+        for document in db[collection].find(query, {source: 1, 'schedule_hours': 1}).batch_size(batch_size):
+            hours = parse_schedule(document.get(source))
+            if hours != document.get('schedule_hours'):
+                operations.append(UpdateOne({'_id': document['_id']}, {'$set': {'schedule_hours': hours}}))
+            if len(operations) >= batch_size:
+                updated[collection] += db[collection].bulk_write(operations, ordered=False).modified_count
+                operations = []
+        if operations:
+            updated[collection] += db[collection].bulk_write(operations, ordered=False).modified_count
+    return updated
+
+
+def schedule_hours_refresh(delay_seconds=0, exclude_job_id=None):
+    """
+    Queue a search.refresh_schedule_hours job delay_seconds from now
+
+    Does nothing when one is already queued or running (other than
+    exclude_job_id, the job doing the scheduling).
+
+    Returns:
+        The queued job, or None
+    """
+    pending = {'type': 'search.refresh_schedule_hours', 'status': {'$in': ['queued', 'running']}}
+    if exclude_job_id:
+        pending['_id'] = {'$ne': exclude_job_id}
+    if JobQueue.get_jobs_collection().find_one(pending, {'_id': 1}):
+        return None
+    return JobQueue.enqueue(
+        'search.refresh_schedule_hours', run_at=datetime.utcnow() + timedelta(seconds=delay_seconds)
+    )
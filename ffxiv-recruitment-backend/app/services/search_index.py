@@ -0,0 +1,240 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+import traceback
+from datetime import datetime
+from flask import current_app
+from app import get_db
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Listing fields that are searched, and how much a match in each counts
+FIELD_WEIGHTS = {'title': 3.0, 'content_name': 2.0, 'description': 1.0}
+
+# Score multiplier for terms that only match a query token as a prefix
+PREFIX_WEIGHT = 0.5
+
+# Shorter query tokens only match whole terms
+MIN_PREFIX_LENGTH = 2
+
+
+def tokenize(text):
+    """Lowercase word tokens of text"""
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+class ListingSearchIndex:
+    """
+    In-process BM25 inverted index over listing title, content_name and description
+
+    Ranking uses BM25 with per-field weights (a match in the title counts
+    three times one in the description). Each query token also matches
+    longer terms it is a prefix of, at PREFIX_WEIGHT, so "drag" finds
+    "dragonsong".
+
+    The index only ranks listing ids. Callers apply visibility and filters
+    in MongoDB on the ranked ids, so a stale entry (e.g. a listing deleted
+    by another worker) can never leak a listing that should not be shown.
+
+    Writes in this process update the index directly. Writes made by other
+    processes are picked up by sync(), which re-reads listings whose
+    updated_at is past the last one seen, at most every sync_seconds. A
+    full rebuild every rebuild_seconds drops listings deleted elsewhere;
+    only the first build runs inside a request, later ones run on a
+    background thread and are swapped in when done.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self.sync_seconds = 5
+        self.rebuild_seconds = 600
+        self._lock = threading.RLock()
+        self._rebuild_thread = None
+        self.reset()
+
+    def configure(self, config):
+        """Load index settings from the Flask config"""
+        self.sync_seconds = config.get('SEARCH_INDEX_SYNC_SECONDS', self.sync_seconds)
+        self.rebuild_seconds = config.get('SEARCH_INDEX_REBUILD_SECONDS', self.rebuild_seconds)
+
+    def reset(self):
+        """Forget every document; the next sync() rebuilds from MongoDB"""
+        with self._lock:
+            self.postings = {}      # term -> {listing_id: weighted term frequency}
+            self.doc_lengths = {}   # listing_id -> weighted length
+            self.doc_terms = {}     # listing_id -> terms, to remove it again
+            self.total_length = 0.0
+            self._terms = None      # sorted terms for prefix lookups, rebuilt lazily
+            self.watermark = None   # latest updated_at indexed
+            self.built_at = None
+            self.synced_at = None
+
+    def add(self, listing_data):
+        """Index (or re-index) one listing document"""
+        listing_id = listing_data['_id']
+        frequencies = {}
+        length = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            tokens = tokenize(listing_data.get(field))
+            length += weight * len(tokens)
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0.0) + weight
+
+        with self._lock:
+            self._remove(listing_id)
+            for term, frequency in frequencies.items():
+                if term not in self.postings:
+                    self.postings[term] = {}
+                    self._terms = None
+                self.postings[term][listing_id] = frequency
+            self.doc_lengths[listing_id] = length
+            self.doc_terms[listing_id] = list(frequencies)
+            self.total_length += length
+
+            updated_at = listing_data.get('updated_at')
+            if updated_at and (self.watermark is None or updated_at > self.watermark):
+                self.watermark = updated_at
+
+    def remove(self, listing_id):
+        """Drop a listing from the index"""
+        with self._lock:
+            self._remove(listing_id)
+
+    def _remove(self, listing_id):
+        length = self.doc_lengths.pop(listing_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.doc_terms.pop(listing_id):
+            del self.postings[term][listing_id]
+            if not self.postings[term]:
+                del self.postings[term]
+                self._terms = None
+
+    def sync(self):
+        """
+        Bring the index up to date with MongoDB
+
+        The first call builds the index; after that a due rebuild is started
+        in the background and this call only syncs incrementally.
+        """
+        if self.built_at is None:
+            return self.rebuild()
+        now = time.monotonic()
+        if now - self.built_at >= self.rebuild_seconds:
+            self.rebuild_in_background()
+        if self.synced_at is not None and now - self.synced_at < self.sync_seconds:
+            return
+
+        projection = dict.fromkeys(FIELD_WEIGHTS, 1)
+        projection['updated_at'] = 1
+        query = {'updated_at': {'$gte': self.watermark}} if self.watermark else {}
+        for listing_data in get_db().listings.find(query, projection):
+            self.add(listing_data)
+        self.synced_at = now
+
+    def rebuild(self):
+        """
+        Re-index every listing from MongoDB
+
+        The new index is built without holding the lock and swapped in at
+        the end, so searches keep using the old one meanwhile. Its watermark
+        is no later than the start of the scan, so listings written during
+        the rebuild are re-read by the next sync().
+        """
+        started_at = datetime.utcnow()
+        projection = dict.fromkeys(FIELD_WEIGHTS, 1)
+        projection['updated_at'] = 1
+        fresh = ListingSearchIndex()
+        for listing_data in get_db().listings.find({}, projection):
+            fresh.add(listing_data)
+
+        with self._lock:
+            self.postings = fresh.postings
+            self.doc_lengths = fresh.doc_lengths
+            self.doc_terms = fresh.doc_terms
+            self.total_length = fresh.total_length
+            self._terms = None
+            self.watermark = min(fresh.watermark, started_at) if fresh.watermark else started_at
+            self.built_at = time.monotonic()
+            self.synced_at = None
+
+    def rebuild_in_background(self):
+        """
+        Start rebuild() on a daemon thread with the current app context
+
+        Returns:
+            The thread, or None if a rebuild is already running
+        """
+        with self._lock:
+            if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+                return None
+            app = current_app._get_current_object()
+            self._rebuild_thread = threading.Thread(
+                target=self._run_rebuild, args=(app,), name='listing-index-rebuild', daemon=True
+            )
+            self._rebuild_thread.start()
+            return self._rebuild_thread
+
+    def _run_rebuild(self, app):
+        with app.app_context():
+            try:
+                self.rebuild()
+            except Exception:
+                # The old index stays in use; the next sync() tries again
+                traceback.print_exc()
+
+    def _expand(self, token):
+        """Index terms matching a query token: [(term, weight)], exact match first"""
+        if len(token) < MIN_PREFIX_LENGTH:
+            return [(token, 1.0)] if token in self.postings else []
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+        matches = []
+        start = bisect.bisect_left(self._terms, token)
+        for term in self._terms[start:]:
+            if not term.startswith(token):
+                break
+            matches.append((term, 1.0 if term == token else PREFIX_WEIGHT))
+        return matches
+
+    def search(self, text, limit=None):
+        """
+        Rank listings matching text
+
+        Returns:
+            [(listing_id, score)] best first: the top limit matches (taken
+            with a heap, without sorting every match), or all of them
+        """
+        tokens = list(dict.fromkeys(tokenize(text)))
+        if not tokens:
+            return []
+
+        with self._lock:
+            doc_count = len(self.doc_lengths)
+            if not doc_count:
+                return []
+            average_length = self.total_length / doc_count or 1.0
+
+            scores = {}
+            for token in tokens:
+                for term, weight in self._expand(token):
+                    docs = self.postings[term]
+                    idf = math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+                    for listing_id, frequency in docs.items():
+                        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[listing_id] / average_length)
+                        score = weight * idf * frequency * (self.k1 + 1) / (frequency + norm)
+                        scores[listing_id] = scores.get(listing_id, 0.0) + score
+
+        if limit is not None:
+            return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+# Shared per-process index used by search_listings
+listing_index = ListingSearchIndex()
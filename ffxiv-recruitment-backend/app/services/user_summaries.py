@@ -0,0 +1,39 @@
+from app import get_db
+from app.utils.cache import app_cache
+
+# Owner fields embedded in listing, search and recommendation responses
+USER_SUMMARY_PROJECTION = {'username': 1, 'character_name': 1, 'server': 1, 'data_center': 1, 'updated_at': 1}
+
+
+def get_user_summaries(user_ids):
+    """
+    Summaries of users keyed by _id
+
+    Served from the 'users' cache namespace where possible, with one $in
+    query for the rest.
+    """
+    user_ids = list(set(user_ids))
+    cached = app_cache.get_many('users', [str(user_id) for user_id in user_ids])
+
+    summaries = {}
+    missing = []
+    for user_id in user_ids:
+        if str(user_id) in cached:
+            summaries[user_id] = cached[str(user_id)]
+        else:
+            missing.append(user_id)
+
+    if missing:
+        loaded = {
+            user['_id']: user
+            for user in get_db().users.find({'_id': {'$in': missing}}, USER_SUMMARY_PROJECTION)
+        }
+        app_cache.set_many('users', {str(user_id): user for user_id, user in loaded.items()})
+        summaries.update(loaded)
+
+    return summaries
+
+
+def invalidate_user_summary(user_id):
+    """Drop a user's cached summary after their profile changes"""
+    app_cache.delete('users', str(user_id))
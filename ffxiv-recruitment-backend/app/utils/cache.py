@@ -0,0 +1,545 @@
+import base64
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from bson import ObjectId
+
+try:
+    import orjson
+except ImportError:  # optional dependency, fall back to the stdlib json module
+    orjson = None
+
+try:
+    import redis
+except ImportError:  # optional dependency, the cache stays in-process
+    redis = None
+
+
+def _tag(o):
+    """JSON stand-in for the non-JSON types cached values hold (ObjectId, datetime, bytes)"""
+    if isinstance(o, ObjectId):
+        return {'$oid': str(o)}
+    if isinstance(o, datetime):
+        return {'$date': o.isoformat()}
+    if isinstance(o, (bytes, bytearray)):
+        return {'$bytes': base64.b64encode(o).decode('ascii')}
+    raise TypeError(f'Object of type {type(o).__name__} cannot be cached')
+
+
+def _untag(o):
+    if len(o) == 1:
+        if '$oid' in o:
+            return ObjectId(o['$oid'])
+        if '$date' in o:
+            return datetime.fromisoformat(o['$date'])
+        if '$bytes' in o:
+            return base64.b64decode(o['$bytes'])
+    return o
+
+
+def _untag_all(value):
+    if isinstance(value, dict):
+        return _untag({key: _untag_all(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_untag_all(item) for item in value]
+    return value
+
+
+def encode_value(value):
+    """
+    Bytes stored for a cached value
+
+    Values are JSON, with ObjectId, datetime and bytes as one-key tagged
+    objects. Nothing is unpickled, so whoever can write to a shared backend
+    cannot run code in the workers reading it. Tuples come back as lists.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=_tag, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(value, default=_tag, separators=(',', ':')).encode('utf-8')
+
+
+def decode_value(blob):
+    """Value stored by encode_value()"""
+    if orjson is not None:
+        return _untag_all(orjson.loads(blob))
+    return json.loads(blob, object_hook=_untag)
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache bounded by entry count and total size
+
+    Args:
+        max_entries: Entries kept before the least recently used is evicted
+        max_bytes: Total size kept, measured with sizeof (None for no limit)
+        sizeof: Size of a cached value, e.g. len for bytes
+        ttl: Seconds an entry stays fresh (None to keep it until evicted)
+    """
+
+    def __init__(self, max_entries=256, max_bytes=None, sizeof=len, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                del self._entries[key]
+                self._size -= entry[1]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # would evict everything else and still not fit
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._entries[key] = (value, size, expires_at)
+            self._size += size
+
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self._size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted[1]
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= entry[1]
+
+    def clear(self):
+        """Drop every entry and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Size and hit rate counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size if self.max_bytes is not None else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one
+
+    The first caller for a key runs fn; callers arriving while it runs wait
+    for it and get its result (or exception) instead of running fn again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class InMemoryBackend:
+    """Process-local stand-in for Redis, for tests and single-process runs"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def get_many(self, keys):
+        with self._lock:
+            return [entry[0] if entry else None for entry in map(self._live, keys)]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    def set_many(self, mapping, ttl=None):
+        for key, value in mapping.items():
+            self.set(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        """Set key only if it does not exist (SET NX); True if it was set"""
+        with self._lock:
+            if self._live(key):
+                return False
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+            return True
+
+    def incr(self, key):
+        with self._lock:
+            entry = self._live(key)
+            value = int(entry[0]) + 1 if entry else 1
+            self._data[key] = (value, entry[1] if entry else None)
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    """Shared backend on any Redis-protocol server"""
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def get_many(self, keys):
+        return self.client.mget(keys)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, value, ex=math.ceil(ttl) if ttl else None)
+
+    def set_many(self, mapping, ttl=None):
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipeline.set(key, value, ex=math.ceil(ttl) if ttl else None)
+        pipeline.execute()
+
+    def add(self, key, value, ttl=None):
+        return bool(self.client.set(key, value, nx=True, ex=math.ceil(ttl) if ttl else None))
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def clear(self):
+        pass  # never flush a shared server
+
+
+class TwoTierCache:
+    """
+    In-process LRU in front of a shared backend (Redis or InMemoryBackend)
+
+    Values are stored as tagged JSON (see encode_value()), so both tiers
+    hand out fresh copies and callers may mutate what they get. Keys are versioned per namespace: invalidate()
+    bumps the namespace version in the backend, which every worker sees
+    within version_ttl seconds. Entries in the local tier live at most
+    local_ttl seconds, so delete() on one worker reaches the others by then.
+
+    get_or_set() recomputes a missing value once: threads in this process
+    share one computation, and other processes wait on a lock key in the
+    backend for up to lock_seconds before computing it themselves.
+
+    Backend errors are counted and otherwise treated as misses, so a Redis
+    outage degrades to the local tier instead of failing requests.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or InMemoryBackend()
+        self.local = LRUCache(max_entries=2048, max_bytes=64 * 1024 * 1024, sizeof=lambda entry: len(entry[1]))
+        self.enabled = True
+        self.prefix = 'sh'
+        self.ttls = {}
+        self.default_ttl = 60
+        self.local_ttl = 5
+        self.version_ttl = 1
+        self.lock_seconds = 10
+        self._versions = {}
+        self._flights = SingleFlight()
+        self._stats_lock = threading.Lock()
+        self.counters = dict.fromkeys(
+            ['local_hits', 'backend_hits', 'misses', 'computes', 'lock_waits', 'invalidations', 'backend_errors'], 0
+        )
+
+    def configure(self, config):
+        """Load settings from the Flask config and pick the backend"""
+        self.enabled = config.get('CACHE_ENABLED', self.enabled)
+        self.prefix = config.get('CACHE_KEY_PREFIX', self.prefix)
+        self.ttls = dict(config.get('CACHE_TTLS', self.ttls))
+        self.default_ttl = config.get('CACHE_DEFAULT_TTL', self.default_ttl)
+        self.local_ttl = config.get('CACHE_LOCAL_TTL', self.local_ttl)
+        self.version_ttl = config.get('CACHE_VERSION_TTL', self.version_ttl)
+        self.lock_seconds = config.get('CACHE_LOCK_SECONDS', self.lock_seconds)
+        self.local.max_entries = config.get('CACHE_LOCAL_ENTRIES', self.local.max_entries)
+        self.local.max_bytes = config.get('CACHE_LOCAL_BYTES', self.local.max_bytes)
+
+        url = config.get('CACHE_REDIS_URL')
+        if url and redis is None:
+            print("⚠️ CACHE_REDIS_URL is set but redis is not installed; caching in-process only")
+        elif url:
+            self.backend = RedisBackend(url)
+        return self
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self.counters[name] += n
+
+    def _backend(self, method, *args):
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception:
+            self._count('backend_errors')
+            return None
+
+    def ttl(self, namespace):
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def version(self, namespace):
+        """Current version of namespace, re-read from the backend every version_ttl seconds"""
+        now = time.monotonic()
+        cached = self._versions.get(namespace)
+        if cached and cached[1] > now:
+            return cached[0]
+        try:
+            value = self.backend.get(f'{self.prefix}:version:{namespace}')
+            version = int(value) if value is not None else 0
+        except Exception:
+            # Keep the last known version (including local invalidations)
+            self._count('backend_errors')
+            version = cached[0] if cached else 0
+        self._versions[namespace] = (version, now + self.version_ttl)
+        return version
+
+    def full_key(self, namespace, key, version=None):
+        if version is None:
+            version = self.version(namespace)
+        # 'j': values are encode_value() JSON, so blobs pickled by older
+        # releases are never read back
+        return f'{self.prefix}:{namespace}:v{version}:j:{key}'
+
+    def _local_get(self, full_key):
+        entry = self.local.get(full_key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def _local_set(self, namespace, full_key, blob):
+        self.local.set(full_key, (time.monotonic() + min(self.local_ttl, self.ttl(namespace)), blob))
+
+    def get(self, namespace, key, default=None):
+        if not self.enabled:
+            return default
+        full_key = self.full_key(namespace, key)
+        blob = self._local_get(full_key)
+        if blob is not None:
+            self._count('local_hits')
+            return decode_value(blob)
+        blob = self._backend('get', full_key)
+        if blob is not None:
+            self._count('backend_hits')
+            self._local_set(namespace, full_key, blob)
+            return decode_value(blob)
+        self._count('misses')
+        return default
+
+    def get_many(self, namespace, keys):
+        """Cached values for keys, as a dict without the misses"""
+        if not self.enabled or not keys:
+            return {}
+        version = self.version(namespace)
+        found, remote = {}, []
+        for key in keys:
+            blob = self._local_get(self.full_key(namespace, key, version))
+            if blob is not None:
+                found[key] = decode_value(blob)
+            else:
+                remote.append(key)
+        self._count('local_hits', len(found))
+
+        if remote:
+            full_keys = [self.full_key(namespace, key, version) for key in remote]
+            blobs = self._backend('get_many', full_keys) or [None] * len(remote)
+            for key, full_key, blob in zip(remote, full_keys, blobs):
+                if blob is not None:
+                    self._local_set(namespace, full_key, blob)
+                    found[key] = decode_value(blob)
+            self._count('backend_hits', len(found) - (len(keys) - len(remote)))
+            self._count('misses', len(keys) - len(found))
+        return found
+
+    def set(self, namespace, key, value, version=None):
+        if not self.enabled:
+            return
+        full_key = self.full_key(namespace, key, version)
+        blob = encode_value(value)
+        self._local_set(namespace, full_key, blob)
+        self._backend('set', full_key, blob, self.ttl(namespace))
+
+    def set_many(self, namespace, mapping):
+        if not self.enabled or not mapping:
+            return
+        version = self.version(namespace)
+        blobs = {}
+        for key, value in mapping.items():
+            full_key = self.full_key(namespace, key, version)
+            blobs[full_key] = encode_value(value)
+            self._local_set(namespace, full_key, blobs[full_key])
+        self._backend('set_many', blobs, self.ttl(namespace))
+
+    def delete(self, namespace, key):
+        """Drop one key; other workers' local copies expire within local_ttl"""
+        full_key = self.full_key(namespace, key)
+        self.local.delete(full_key)
+        self._backend('delete', full_key)
+
+    def invalidate(self, namespace):
+        """Drop every key in namespace by moving it to a new version"""
+        version = self._backend('incr', f'{self.prefix}:version:{namespace}')
+        if version is None:  # backend down: at least stop serving this worker's copies
+            version = self.version(namespace) + 1
+        self._versions[namespace] = (int(version), time.monotonic() + self.version_ttl)
+        self._count('invalidations')
+
+    def get_or_set(self, namespace, key, compute):
+        """
+        Cached value for key, computing and storing it on a miss
+
+        The version is read before compute() runs, so a value computed while
+        the namespace is invalidated is stored under the old version and
+        never served.
+        """
+        if not self.enabled:
+            return compute()
+
+        version = self.version(namespace)
+        full_key = self.full_key(namespace, key, version)
+
+        def load():
+            blob = self._local_get(full_key)
+            if blob is not None:
+                self._count('local_hits')
+                return decode_value(blob)
+            blob = self._backend('get', full_key)
+            if blob is None:
+                self._count('misses')
+                blob = self._compute_once(namespace, full_key, compute)
+            else:
+                self._count('backend_hits')
+            self._local_set(namespace, full_key, blob)
+            return decode_value(blob)
+
+        return self._flights.do(full_key, load)
+
+    def _compute_once(self, namespace, full_key, compute):
+        """Compute a value, or wait for another process that holds the lock to do it"""
+        lock_key = f'{full_key}:lock'
+        # None means the backend is unreachable: compute without the lock
+        if self._backend('add', lock_key, b'1', self.lock_seconds) is False:
+            self._count('lock_waits')
+            deadline = time.monotonic() + self.lock_seconds
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                blob = self._backend('get', full_key)
+                if blob is not None:
+                    return blob
+
+        try:
+            self._count('computes')
+            blob = encode_value(compute())
+            self._backend('set', full_key, blob, self.ttl(namespace))
+            return blob
+        finally:
+            self._backend('delete', lock_key)
+
+    def clear(self):
+        """Drop the local tier, version cache and counters (and an in-memory backend)"""
+        self.local.clear()
+        self._versions.clear()
+        self.backend.clear()
+        with self._stats_lock:
+            for name in self.counters:
+                self.counters[name] = 0
+        self._flights.coalesced = 0
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self.counters)
+        lookups = stats['local_hits'] + stats['backend_hits'] + stats['misses']
+        stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 4) if lookups else 0.0
+        stats['coalesced'] = self._flights.coalesced
+        stats['backend'] = type(self.backend).__name__
+        stats['local'] = self.local.stats()
+        return stats
+
+
+# Shared application cache (listing pages, user summaries, recommendations)
+app_cache = TwoTierCache()
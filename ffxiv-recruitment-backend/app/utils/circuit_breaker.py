@@ -0,0 +1,137 @@
+import math
+import threading
+import time
+from collections import deque
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open"""
+
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f'{name} is unavailable; retry in {math.ceil(retry_after)}s')
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker for calls to one dependency
+
+    closed: calls go through. Outcomes from the last window_seconds are
+    kept, and once at least min_calls of them have a failure rate of
+    failure_rate or more, the breaker opens.
+
+    open: calls are refused for open_seconds (allow() raises with the time
+    left as a retry hint), so callers fail immediately instead of waiting
+    out timeouts against a dependency that is down.
+
+    half_open: after open_seconds one probe call is let through. Success
+    closes the breaker with a clean window, failure opens it again.
+
+    Refusals raise error (CircuitOpenError or a subclass), so callers can
+    make them look like the dependency's own failures.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name, failure_rate=0.5, min_calls=5, window_seconds=60, open_seconds=30,
+                 error=CircuitOpenError, clock=time.monotonic):
+        self.name = name
+        self.error = error
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def configure(self, **settings):
+        """Apply settings (failure_rate, min_calls, window_seconds, open_seconds)"""
+        for name, value in settings.items():
+            if value is not None:
+                setattr(self, name, value)
+        return self
+
+    def reset(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._outcomes = deque()
+            self._opened_at = None
+            self._probing = False
+            self.counters = {'opened': 0, 'rejected': 0, 'probes': 0}
+
+    def _trim(self, now):
+        while self._outcomes and self._outcomes[0][0] <= now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self._opened_at = now
+        self._probing = False
+        self.counters['opened'] += 1
+
+    def retry_after(self):
+        """Seconds until calls may be attempted again (0 when they may now)"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0
+            if self.state == self.HALF_OPEN:
+                return 1 if self._probing else 0
+            return max(0, self._opened_at + self.open_seconds - self._clock())
+
+    def allow(self):
+        """
+        Return if a call may go ahead, otherwise count the refusal and raise
+
+        Raises:
+            CircuitOpenError: With the retry hint, while open or probing
+        """
+        with self._lock:
+            now = self._clock()
+            if self.state == self.OPEN and now >= self._opened_at + self.open_seconds:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                self.counters['probes'] += 1
+                return
+            if self.state == self.CLOSED:
+                return
+            self.counters['rejected'] += 1
+            retry_after = 1 if self.state == self.HALF_OPEN else self._opened_at + self.open_seconds - now
+        raise self.error(self.name, retry_after)
+
+    def record(self, ok):
+        """Record the outcome of a call that allow() let through"""
+        with self._lock:
+            now = self._clock()
+            if self.state == self.HALF_OPEN:
+                if ok:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                    self._probing = False
+                else:
+                    self._open(now)
+                return
+            if self.state == self.OPEN:
+                return  # a call that started before the breaker opened
+
+            self._outcomes.append((now, ok))
+            self._trim(now)
+            failures = sum(1 for _, outcome in self._outcomes if not outcome)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open(now)
+
+    def stats(self):
+        with self._lock:
+            self._trim(self._clock())
+            calls = len(self._outcomes)
+            failures = sum(1 for _, outcome in self._outcomes if not outcome)
+            counters = dict(self.counters)
+        return dict(
+            counters,
+            state=self.state,
+            calls=calls,
+            failure_rate=round(failures / calls, 4) if calls else 0.0,
+            retry_after=round(self.retry_after(), 1)
+        )
@@ -11,6 +11,9 @@ SERVERS = {
     'Dynamis': ['Halicarnassus', 'Maduin', 'Marilith', 'Seraph']
 }
 
+# Every server, across data centers
+ALL_SERVERS = [server for servers in SERVERS.values() for server in servers]
+
 # Content Types
 CONTENT_TYPES = [
     'savage',
@@ -37,8 +40,38 @@ JOBS = {
     ]
 }
 
+# Job codes in the order the Lodestone lists levels: tanks, healers, melee,
+# physical ranged and magical ranged DPS, Blue Mage, crafters, gatherers
+JOB_CODES = [
+    'PLD', 'WAR', 'DRK', 'GNB',
+    'WHM', 'SCH', 'AST', 'SGE',
+    'DRG', 'MNK', 'NIN', 'SAM', 'RPR', 'VPR',
+    'BRD', 'MCH', 'DNC',
+    'BLM', 'SMN', 'RDM', 'PCT', 'BLU',
+    'CRP', 'BSM', 'ARM', 'GSM', 'LTW', 'WVR', 'ALC', 'CUL',
+    'MIN', 'BTN', 'FSH'
+]
+MAX_JOB_LEVEL = 100
+
+# Encounters tracked in progression summaries: code (as used in listing
+# requirements.progression) -> FFLogs encounter ID. The final phase is
+# tracked for fights split into door boss and final phase.
+PROGRESSION_ENCOUNTERS = {
+    'P5S': 83, 'P6S': 84, 'P7S': 85, 'P8S': 87,
+    'P9S': 88, 'P10S': 89, 'P11S': 90, 'P12S': 92,
+    'M1S': 93, 'M2S': 94, 'M3S': 95, 'M4S': 96,
+    'M5S': 97, 'M6S': 98, 'M7S': 99, 'M8S': 100,
+    'FRU': 1079
+}
+
 # Voice Chat Platforms
 VOICE_CHAT_PLATFORMS = ['Discord', 'Teamspeak', 'Mumble', 'In-game', 'Other']
 
 # Listing States
-LISTING_STATES = ['private', 'recruiting', 'filled']
\ No newline at end of file
+LISTING_STATES = ['private', 'recruiting', 'filled']
+
+# Application Statuses
+APPLICATION_STATUSES = ['pending', 'accepted', 'rejected']
+
+# Maximum number of applications in one bulk status update
+MAX_BULK_STATUS_UPDATES = 100
@@ -0,0 +1,141 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+from bson import ObjectId
+from flask import current_app, jsonify, request
+from app.middleware.compression import CONTENT_CODINGS
+from app.utils.cache import app_cache
+
+
+def job_accepted(job, message):
+    """202 response for work handed off to the background job queue"""
+    job_id = str(job['_id'])
+    return jsonify({
+        'message': message,
+        'job_id': job_id,
+        'status': job['status'],
+        'status_url': f'/api/jobs/{job_id}'
+    }), 202
+
+
+def make_etag(*parts):
+    """
+    Strong ETag for a response built from parts
+
+    parts are the values the body depends on (ids, updated_at, the viewer,
+    query parameters); changing any of them changes the tag.
+    """
+    raw = json.dumps(parts, default=str, separators=(',', ':'))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def with_etag(response, etag):
+    """Tag a response and make clients revalidate it before reuse"""
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    # Bodies differ per viewer (is_owner, private listings)
+    response.vary.add('Authorization')
+    return response
+
+
+def not_modified(etag):
+    """
+    304 response if If-None-Match already holds etag, otherwise None
+
+    Compressed responses carry the tag with a -gzip/-br suffix, which
+    matches too.
+    """
+    for tag in (etag, *(f'{etag}-{coding}' for coding in CONTENT_CODINGS)):
+        if request.if_none_match.contains_weak(tag):
+            return with_etag(current_app.response_class(status=304), tag)
+    return None
+
+
+def page_cache_key(current_user, params):
+    """
+    app_cache key for the current anonymous request, or None if it must not be cached
+
+    params must be the normalized values the response depends on.
+    """
+    if current_user is not None or not app_cache.enabled:
+        return None
+    return f'{request.endpoint}:{make_etag(*params)}'
+
+
+def json_response(body, etag=None):
+    """Response for an already serialized JSON body, honoring If-None-Match"""
+    if etag:
+        cached = not_modified(etag)
+        if cached:
+            return cached
+    response = current_app.response_class(body, mimetype=current_app.json.mimetype)
+    return with_etag(response, etag) if etag else response
+
+
+def parse_limit(value, default=20, maximum=100):
+    """Parse a page size query parameter, clamped to [1, maximum]"""
+    if value in (None, ''):
+        return default
+    limit = int(value)  # ValueError for non-numeric input
+    return max(1, min(limit, maximum))
+
+
+def encode_cursor(doc):
+    """Opaque cursor pointing just past doc in (created_at, _id) descending order"""
+    created_at = doc.get('created_at')
+    raw = f"{created_at.isoformat() if created_at else ''}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor from encode_cursor
+
+    Returns:
+        (created_at or None, ObjectId)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, object_id = raw.split('|')
+        return (datetime.fromisoformat(created_at) if created_at else None), ObjectId(object_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def apply_cursor(query, cursor):
+    """
+    Restrict query to documents after cursor in (created_at, _id) descending order
+
+    Documents without created_at sort after every dated document.
+    """
+    if not cursor:
+        return query
+    
+    created_at, object_id = decode_cursor(cursor)
+    if created_at is None:
+        after = [{'created_at': None, '_id': {'$lt': object_id}}]
+    else:
+        after = [
+            {'created_at': {'$lt': created_at}},
+            {'created_at': created_at, '_id': {'$lt': object_id}},
+            {'created_at': None}
+        ]
+    
+    return {'$and': [query, {'$or': after}]}
+
+
+def cursor_page(cursor, limit):
+    """
+    Read up to limit documents from a (created_at, _id) descending cursor
+
+    Returns:
+        (documents, next_cursor) where next_cursor is None on the last page
+    """
+    docs = list(cursor.sort([('created_at', -1), ('_id', -1)]).limit(limit + 1))
+    if len(docs) > limit:
+        return docs[:limit], encode_cursor(docs[limit - 1])
+    return docs, None
@@ -0,0 +1,68 @@
+"""
+HTML parser backends for scraped pages
+
+BeautifulSoup can build its tree with the stdlib html.parser or, when it is
+installed, lxml's C parser, which is several times faster. Scrapers that
+only read a few sections of a page pass a SoupStrainer built by
+class_strainer(), so only those subtrees are turned into Python objects and
+the rest of the page is skipped while parsing.
+"""
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml
+except ImportError:  # optional dependency, fall back to html.parser
+    lxml = None
+
+# BeautifulSoup tree builders in order of preference
+BACKENDS = ('lxml', 'html.parser')
+
+
+def available_backends():
+    """Backends that can be used in this environment, fastest first"""
+    return tuple(backend for backend in BACKENDS if backend != 'lxml' or lxml is not None)
+
+
+def resolve_backend(name=None):
+    """
+    Backend to parse with: name if given, otherwise the fastest available
+
+    Raises:
+        ValueError: If name is unknown or not installed
+    """
+    if not name:
+        return available_backends()[0]
+    if name not in available_backends():
+        raise ValueError(f'HTML parser backend not available: {name}')
+    return name
+
+
+def class_strainer(*class_names):
+    """
+    SoupStrainer keeping elements that have any of class_names, with all
+    of their descendants
+
+    While parsing, the class attribute is still the raw string
+    ("frame__chara__name js__toggle"), so it is split here rather than
+    matched with class_=list.
+    """
+    wanted = frozenset(class_names)
+
+    def match(value):
+        if not value:
+            return False
+        return not wanted.isdisjoint(value.split() if isinstance(value, str) else value)
+
+    return SoupStrainer(class_=match)
+
+
+def parse_html(content, backend=None, parse_only=None):
+    """
+    Parse markup into a BeautifulSoup tree
+
+    Args:
+        content: HTML as bytes or str
+        backend: Parser backend name, defaults to the fastest available
+        parse_only: Optional SoupStrainer limiting the tree to matching subtrees
+    """
+    return BeautifulSoup(content, resolve_backend(backend), parse_only=parse_only)
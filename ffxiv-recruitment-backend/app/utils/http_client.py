@@ -0,0 +1,145 @@
+import random
+import threading
+import time
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class JitteredRetry(Retry):
+    """Retry whose backoff is drawn uniformly from [0, exponential backoff] ("full jitter")"""
+
+    def get_backoff_time(self):
+        return random.uniform(0, super().get_backoff_time())
+
+
+class HttpClient:
+    """
+    Shared requests.Session for one upstream service
+
+    Connections are kept alive in a pool of pool_size per host, so repeated
+    calls skip the TCP and TLS handshakes. Connect and read timeouts are
+    separate: a host that does not answer fails fast, while a slow page
+    still has read_timeout to arrive.
+
+    Idempotent requests (retry_methods, GET and HEAD by default) are retried
+    up to `retries` times on connection errors, read timeouts and
+    retry_statuses (429/5xx by default) responses, waiting a random
+    time up to backoff * 2**attempt (capped at backoff_max) between tries
+    and honouring Retry-After. The last response is returned as is once
+    retries run out, so callers still see the status code.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    LATENCY_SAMPLES = 512
+
+    def __init__(self, headers=None, **settings):
+        self.headers = dict(headers or {})
+        self.pool_size = 10
+        self.connect_timeout = 3.05
+        self.read_timeout = 10
+        self.retries = 3
+        self.backoff = 0.5
+        self.backoff_max = 8
+        self.retry_methods = ('GET', 'HEAD')
+        self.retry_statuses = self.RETRY_STATUSES
+        self._lock = threading.Lock()
+        self.configure(**settings)
+
+    def configure(self, **settings):
+        """
+        Apply settings (pool_size, connect_timeout, read_timeout, retries,
+        backoff, backoff_max, retry_methods, retry_statuses)
+        """
+        for name, value in settings.items():
+            if value is not None:
+                setattr(self, name, value)
+
+        retry = JitteredRetry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            other=0,
+            allowed_methods=frozenset(self.retry_methods),
+            status_forcelist=self.retry_statuses,
+            backoff_factor=self.backoff,
+            backoff_max=self.backoff_max,
+            raise_on_status=False,
+            respect_retry_after_header=True
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.headers.update(self.headers)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        with self._lock:
+            old = getattr(self, 'session', None)
+            self.session, self.adapter = session, adapter
+            self.reset_stats()
+        if old is not None:
+            old.close()
+        return self
+
+    def reset_stats(self):
+        self.requests = 0
+        self.failures = 0
+        self.retried = 0
+        self.latencies = deque(maxlen=self.LATENCY_SAMPLES)
+
+    def request(self, method, url, **kwargs):
+        """Send a request through the pool; kwargs are passed to requests"""
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self.requests += 1
+                self.failures += 1
+            raise
+
+        retries = getattr(response.raw, 'retries', None)
+        with self._lock:
+            self.requests += 1
+            self.retried += len(retries.history) if retries is not None else 0
+            self.latencies.append(time.perf_counter() - started)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """Request, retry and latency counters plus connection pool usage"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            requests_sent, failures, retried = self.requests, self.failures, self.retried
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1) if latencies else None
+
+        pool_manager = self.adapter.poolmanager
+        pools = [pool_manager.pools[key] for key in pool_manager.pools.keys()]
+        return {
+            'requests': requests_sent,
+            'failures': failures,
+            'retries': retried,
+            'latency_ms': {
+                'avg': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+                'p50': percentile(0.5),
+                'p95': percentile(0.95),
+                'max': round(latencies[-1] * 1000, 1) if latencies else None
+            },
+            'pool': {
+                'size': self.pool_size,
+                'hosts': len(pools),
+                'connections_opened': sum(pool.num_connections for pool in pools),
+                'idle': sum(sum(1 for conn in list(pool.pool.queue) if conn) for pool in pools if pool.pool is not None)
+            }
+        }
@@ -0,0 +1,63 @@
+from datetime import date, datetime
+from uuid import UUID
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency, fall back to the stdlib encoder
+    orjson = None
+
+
+def bson_default(o):
+    """Serialize the BSON and date types that come straight out of MongoDB"""
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if isinstance(o, UUID):
+        return str(o)
+    # Decimal, dataclasses and __html__ keep Flask's encoding
+    return DefaultJSONProvider.default(o)
+
+
+class MongoJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider that encodes ObjectId and datetime natively
+
+    Uses orjson when it is installed and the stdlib json module otherwise;
+    both produce the same output for the types the API returns. Datetimes
+    are ISO 8601, matching the isoformat() strings handlers used to build.
+    """
+
+    default = staticmethod(bson_default)
+    sort_keys = False  # keys keep the order handlers built them in
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return self._orjson_dumps(obj).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        """Like DefaultJSONProvider.response, but skips the str round trip with orjson"""
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+
+        if orjson is not None:
+            body = self._orjson_dumps(obj, orjson.OPT_INDENT_2 if pretty else 0) + b'\n'
+        else:
+            dump_args = {'indent': 2} if pretty else {'separators': (',', ':')}
+            body = f'{super().dumps(obj, **dump_args)}\n'
+
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+    def _orjson_dumps(self, obj, option=0):
+        option |= orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option)
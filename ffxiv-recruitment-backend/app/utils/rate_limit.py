@@ -0,0 +1,32 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Spaces calls from any number of threads at least 1 / rate seconds apart
+
+    wait() reserves the next free slot under a lock and sleeps outside it,
+    so callers queue up in order without holding each other back longer
+    than the limit requires. rate=None disables the limit.
+    """
+
+    def __init__(self, rate=None, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1 / rate if rate else 0
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        """Block until the caller may proceed; returns the time waited in seconds"""
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            self._sleep(delay)
+        return delay
@@ -0,0 +1,218 @@
+"""
+Parse free-text schedules into UTC hour-of-week buckets
+
+Listing schedules and player availability are stored as strings such as
+"Tue/Thu 7-11 PM EST" or "Weekends 20:00-23:00 UTC". parse_schedule() turns
+them into the sorted set of hours of the week they cover, in UTC, where 0 is
+Monday 00:00-01:00 UTC and 167 is Sunday 23:00-24:00 UTC. Stored as an
+array, two schedules overlap when they share a bucket, which a multikey
+index answers with $in.
+
+Zones with daylight saving time ("ET", "Europe/London") are converted with
+the offset in effect when the schedule is parsed, so stored buckets are a
+snapshot. The search.refresh_schedule_hours job re-derives them (see
+app.services.search_fields.refresh_schedule_hours) so they follow the
+clocks after a change.
+"""
+import math
+import re
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+HOURS_PER_WEEK = 7 * 24
+
+# Length assumed for an entry with only a start time ("Tuesday 8PM EST")
+DEFAULT_DURATION_HOURS = 3
+
+DAYS = {
+    'mon': 0, 'monday': 0,
+    'tue': 1, 'tues': 1, 'tuesday': 1,
+    'wed': 2, 'weds': 2, 'wednesday': 2,
+    'thu': 3, 'thur': 3, 'thurs': 3, 'thursday': 3,
+    'fri': 4, 'friday': 4,
+    'sat': 5, 'saturday': 5,
+    'sun': 6, 'sunday': 6
+}
+DAY_GROUPS = {
+    'weekdays': range(0, 5), 'weeknights': range(0, 5),
+    'weekends': range(5, 7), 'weekend': range(5, 7),
+    'daily': range(7), 'everyday': range(7), 'nightly': range(7)
+}
+
+# Fixed UTC offsets in hours. ST is FFXIV server time (UTC)
+TZ_OFFSETS = {
+    'utc': 0, 'gmt': 0, 'st': 0,
+    'est': -5, 'edt': -4, 'cst': -6, 'cdt': -5, 'mst': -7, 'mdt': -6,
+    'pst': -8, 'pdt': -7, 'akst': -9, 'akdt': -8, 'hst': -10,
+    'bst': 1, 'cet': 1, 'cest': 2, 'eet': 2, 'eest': 3,
+    'jst': 9, 'aest': 10, 'aedt': 11
+}
+# Zones whose offset depends on daylight saving time
+TZ_ZONES = {
+    'et': 'America/New_York', 'ct': 'America/Chicago',
+    'mt': 'America/Denver', 'pt': 'America/Los_Angeles'
+}
+
+_DAY_NAMES = '|'.join(sorted(DAYS, key=len, reverse=True))
+# Day names may be plural ("Tuesdays")
+DAY_RANGE_RE = re.compile(rf'\b({_DAY_NAMES})s?\s*(?:-|–|to|through|thru)\s*({_DAY_NAMES})s?\b')
+DAY_RE = re.compile(rf'\b({_DAY_NAMES}|{"|".join(DAY_GROUPS)})s?\b')
+# Minutes may follow the hour without a colon, as in military time ("2300")
+_TIME = r'\b(\d{1,2})(?::?(\d{2}))?\s*(am|pm|a|p)?\b'
+TIME_RANGE_RE = re.compile(rf'{_TIME}\s*(?:-|–|to|until|till)\s*{_TIME}')
+TIME_RE = re.compile(r'\b(\d{1,2})(?::(\d{2}))?\s*(am|pm|a|p)\b|\b(\d{1,2}):(\d{2})\b')
+ZONE_NAME_RE = re.compile(r'\b([A-Z][A-Za-z]+/[A-Z][A-Za-z_]+)\b')
+WORD_RE = re.compile(r'[a-z]+')
+
+
+def resolve_timezone(name):
+    """
+    tzinfo for an abbreviation ("EST", "PT") or IANA name ("Europe/London")
+
+    Returns:
+        tzinfo, or None if the name is not recognised
+    """
+    if not name:
+        return None
+    key = name.strip().lower()
+    if key in TZ_OFFSETS:
+        return timezone(timedelta(hours=TZ_OFFSETS[key]))
+    try:
+        return ZoneInfo(TZ_ZONES.get(key, name.strip()))
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def _offset_minutes(tz, now=None):
+    """UTC offset of tz in minutes, as of now (a snapshot for zones with daylight saving)"""
+    now = now or datetime.now(timezone.utc)
+    return int(now.astimezone(tz).utcoffset().total_seconds() // 60)
+
+
+def _minutes(hour, minute, meridiem):
+    """Minutes past midnight for a clock time, or None if it is not one"""
+    hour, minute = int(hour), int(minute or 0)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem.startswith('p') else 0)
+    if hour > 24 or minute > 59:
+        return None
+    return hour * 60 + minute
+
+
+def _days(text):
+    """Days of the week (0 = Monday) named in text"""
+    days = set()
+    for first, last in DAY_RANGE_RE.findall(text):
+        start, end = DAYS[first], DAYS[last]
+        days.update((start + i) % 7 for i in range((end - start) % 7 + 1))
+    for name in DAY_RE.findall(DAY_RANGE_RE.sub(' ', text)):
+        days.update(DAY_GROUPS.get(name, (DAYS.get(name),)))
+    return days
+
+
+def _times(text):
+    """(start, end) in minutes past midnight for the time range in text, or None"""
+    match = TIME_RANGE_RE.search(text)
+    if match:
+        h1, m1, p1, h2, m2, p2 = match.groups()
+        if p1 or p2 or m1 or m2:
+            end = _minutes(h2, m2, p2 or p1)
+            # "7-11 PM": the start takes the end's am/pm unless that puts it after the end
+            start = _minutes(h1, m1, p1 or p2)
+            if not p1 and p2 and start is not None and end is not None and start >= end:
+                start = _minutes(h1, m1, 'am' if p2.startswith('p') else 'pm')
+        else:
+            # Bare "20-23" is a 24-hour range, and bare "9-5" means 9 to 17
+            start, end = _minutes(h1, None, None), _minutes(h2, None, None)
+            if start is not None and end is not None and end <= start and end <= 12 * 60:
+                end += 12 * 60
+        if start is not None and end is not None:
+            return start, end
+
+    match = TIME_RE.search(text)
+    if match:
+        hour, minute, meridiem, hour24, minute24 = match.groups()
+        start = _minutes(hour, minute, meridiem) if hour else _minutes(hour24, minute24, None)
+        if start is not None:
+            return start, start + DEFAULT_DURATION_HOURS * 60
+    return None
+
+
+def _zone_name(entry):
+    """IANA zone name in an entry ("Europe/London"), or None ("Tue/Thu" is not one)"""
+    for name in ZONE_NAME_RE.findall(entry):
+        if resolve_timezone(name):
+            return name
+    return None
+
+
+def _timezone(entry, default_tz):
+    """
+    Timezone named in an entry, falling back to default_tz
+
+    An abbreviation only counts right after the time ("8-10pm PT weekly")
+    or as the last word of the entry ("Weekends ST"), so words elsewhere
+    such as the "st" of "1st" are not read as zones.
+    """
+    zone_name = _zone_name(entry)
+    if zone_name:
+        return resolve_timezone(zone_name)
+    text = entry.lower()
+    candidates = WORD_RE.findall(text)[-1:]
+    match = TIME_RANGE_RE.search(text) or TIME_RE.search(text)
+    if match:
+        candidates = WORD_RE.findall(text[match.end():])[:1] + candidates
+    for word in candidates:
+        if word in TZ_OFFSETS or word in TZ_ZONES:
+            return resolve_timezone(word)
+    return default_tz
+
+
+def parse_entry(entry, default_tz=timezone.utc, now=None):
+    """
+    UTC hour-of-week buckets covered by one schedule entry
+
+    Times default to the whole day, so "Weekends" parses. An entry naming
+    no day ("8-11 PM EST", "Whenever") yields nothing rather than every
+    day of the week.
+
+    Returns:
+        Set of ints in range(HOURS_PER_WEEK)
+    """
+    if not isinstance(entry, str):
+        return set()
+    zone_name = _zone_name(entry)
+    text = (entry.replace(zone_name, ' ') if zone_name else entry).lower()
+    days = _days(text)
+    if not days:
+        return set()
+    times = _times(text)
+
+    start, end = times or (0, 24 * 60)
+    if end <= start:
+        end += 24 * 60  # runs past midnight
+    offset = _offset_minutes(_timezone(entry, default_tz), now)
+
+    hours = set()
+    for day in days:
+        first = day * 24 * 60 + start - offset
+        last = day * 24 * 60 + end - offset
+        hours.update(hour % HOURS_PER_WEEK for hour in range(first // 60, math.ceil(last / 60)))
+    return hours
+
+
+def parse_schedule(entries, default_tz=timezone.utc, now=None):
+    """
+    Sorted UTC hour-of-week buckets covered by any of entries
+
+    Entries that cannot be parsed are skipped; the free text is still
+    stored and shown as written.
+    """
+    if isinstance(entries, str):
+        entries = [entries]
+    hours = set()
+    for entry in entries or []:
+        hours |= parse_entry(entry, default_tz, now)
+    return sorted(hours)
@@ -0,0 +1,48 @@
+"""Trigram helpers for fuzzy name matching"""
+import re
+import unicodedata
+
+WORD_RE = re.compile(r'[^\W_]+', re.UNICODE)
+
+
+def normalize(text):
+    """Lowercase text with accents removed ("Y'shtola Rhul" -> "y'shtola rhul")"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def trigrams(text):
+    """
+    Set of trigrams of text
+
+    Each word is padded with two spaces in front and one behind (as in
+    PostgreSQL's pg_trgm), so word starts weigh more than word middles and
+    "Ab" still yields trigrams.
+    """
+    grams = set()
+    for word in WORD_RE.findall(normalize(text)):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def name_trigrams(*names):
+    """Sorted union of the trigrams of every name, as stored on a document"""
+    grams = set()
+    for name in names:
+        grams |= trigrams(name)
+    return sorted(grams)
+
+
+def similarity(query_grams, grams):
+    """
+    How well a name matches a query, from 0 to 1
+
+    The average of the share of query trigrams found in the name (so a
+    partial name like "cloud" fully matches "Cloud Strife") and the Jaccard
+    similarity (so among those, the closer name ranks first).
+    """
+    if not query_grams or not grams:
+        return 0.0
+    shared = len(query_grams & grams)
+    return (shared / len(query_grams) + shared / len(query_grams | grams)) / 2
@@ -0,0 +1,129 @@
+from app.utils.constants import ALL_SERVERS, DATA_CENTERS, SERVERS
+
+
+def _fields(*names, **derived):
+    """Field map where each plain name is read from the document field of the same name"""
+    field_map = {name: (name,) for name in names}
+    field_map.update(derived)
+    return field_map
+
+
+# Response fields clients may select with ?fields=, mapped to the document
+# fields needed to build them
+LISTING_FIELDS = _fields(
+    'title', 'description', 'owner_id', 'content_type', 'content_name',
+    'data_center', 'server', 'roles_needed', 'schedule', 'requirements',
+    'voice_chat', 'additional_info', 'state', 'application_count',
+    'created_at', 'updated_at',
+    id=('_id',),
+    can_apply=('state',),
+    can_edit=('state',),
+    owner=('owner_id',),
+    is_owner=('owner_id',)
+)
+
+USER_FIELDS = _fields(
+    'username', 'character_name', 'server', 'data_center', 'lodestone_id',
+    'fflogs_id', 'bio', 'availability', 'roles', 'job_levels', 'progression',
+    'created_at', 'updated_at',
+    id=('_id',)
+)
+
+
+def parse_fields(raw, allowed, default=None):
+    """
+    Parse a comma-separated ?fields= parameter into a Mongo projection
+
+    Args:
+        raw: The query parameter value (None or empty for the default)
+        allowed: Field map for the resource, e.g. LISTING_FIELDS
+        default: Fields returned when none are requested (default: all)
+
+    Returns:
+        (fields, projection) where fields is the set of response fields to
+        keep (None for every field) and projection only loads what they need
+
+    Raises:
+        ValueError: If a requested field is not allowed for the resource
+    """
+    if raw:
+        fields = {field.strip() for field in raw.split(',') if field.strip()}
+        unknown = fields - allowed.keys()
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    else:
+        fields = set(default) if default is not None else None
+
+    projection = {'_id': 1}
+    for field in (fields if fields is not None else allowed):
+        for source in allowed[field]:
+            projection[source] = 1
+
+    return fields, projection
+
+
+def wants(fields, field):
+    """Whether field should be included in a response limited to fields"""
+    return fields is None or field in fields
+
+
+def normalize_key(value):
+    """Lowercase key a server, data center or role is stored and filtered under"""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    return value.strip().lower()
+
+
+def canonical_choice(value, choices, name):
+    """
+    Canonical spelling of value among choices, compared case-insensitively
+
+    Raises:
+        ValueError: If value is not one of the choices
+    """
+    for choice in choices:
+        if normalize_key(choice) == normalize_key(value):
+            return choice
+    raise ValueError(f'Unknown {name}: {value}')
+
+
+def parse_choices(raw, choices, name):
+    """
+    Parse a comma-separated multi-value filter such as ?server=Gilgamesh,Jenova
+
+    Returns:
+        Canonical spelling of each requested value, for an $in filter
+        (empty when the parameter is absent)
+
+    Raises:
+        ValueError: If a value is not one of the choices
+    """
+    if not raw:
+        return []
+    values = [value for value in raw.split(',') if value.strip()]
+    return list(dict.fromkeys(canonical_choice(value, choices, name) for value in values))
+
+
+def validate_location(data):
+    """
+    Canonical server and data_center from a profile payload
+
+    Values are matched case-insensitively against the constants, and a
+    server must belong to the data center given with it. Absent or empty
+    values are left as they are.
+
+    Returns:
+        Dict with the canonical spelling of each value given
+
+    Raises:
+        ValueError: If a value is unknown or they do not belong together
+    """
+    location = {}
+    if data.get('data_center'):
+        location['data_center'] = canonical_choice(data['data_center'], DATA_CENTERS, 'data center')
+    if data.get('server'):
+        location['server'] = canonical_choice(data['server'], ALL_SERVERS, 'server')
+        data_center = location.get('data_center')
+        if data_center and location['server'] not in SERVERS[data_center]:
+            raise ValueError(f"{location['server']} is not on the {data_center} data center")
+    return location
@@ -0,0 +1,96 @@
+"""
+Microbenchmark: encoding a 100-row listing page
+
+Compares the pre-provider path (Listing.from_dict(...).to_dict() then
+Flask's stdlib JSON encoder) with returning projected documents straight to
+MongoJSONProvider, with and without orjson.
+
+Run from the backend directory:
+    python benchmarks/bench_json_provider.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.listing import Listing
+from app.utils import json_provider
+from app.utils.json_provider import MongoJSONProvider
+
+ROWS = 100
+NUMBER = 200
+
+
+def make_page():
+    now = datetime.utcnow()
+    return [{
+        '_id': ObjectId(),
+        'title': f'M{i % 4 + 1}S Static - {i}',
+        'description': 'Midcore static looking for a co-healer. ' * 10,
+        'owner_id': ObjectId(),
+        'content_type': 'savage',
+        'content_name': 'AAC Light-heavyweight (Savage)',
+        'data_center': 'Aether',
+        'server': 'Gilgamesh',
+        'roles_needed': {'tank': 0, 'healer': 1, 'dps': 2},
+        'schedule': ['Tuesday 8PM EST', 'Thursday 8PM EST'],
+        'requirements': {'min_ilvl': 710, 'progression': ['M1S', 'M2S']},
+        'voice_chat': 'Discord',
+        'additional_info': 'Be nice.',
+        'state': 'recruiting',
+        'application_count': i % 7,
+        'created_at': now - timedelta(hours=i),
+        'updated_at': now - timedelta(minutes=i)
+    } for i in range(ROWS)]
+
+
+def old_path(app, page):
+    listings = []
+    for listing_data in page:
+        listing = Listing.from_dict(listing_data)
+        listing._id = listing_data['_id']
+        listings.append(listing.to_dict())
+    return app.json.response({'listings': listings}).get_data()
+
+
+def new_path(app, page):
+    return app.json.response({'listings': page}).get_data()
+
+
+def main():
+    page = make_page()
+    orjson = json_provider.orjson
+
+    stdlib_app = Flask('stdlib')
+    stdlib_app.json = DefaultJSONProvider(stdlib_app)
+    fast_app = Flask('fast')
+    fast_app.json = MongoJSONProvider(fast_app)
+
+    # (name, encoder module used by MongoJSONProvider, fn)
+    cases = [
+        ('model to_dict + stdlib json', None, lambda: old_path(stdlib_app, page)),
+        ('projected docs + MongoJSONProvider (stdlib)', None, lambda: new_path(fast_app, page))
+    ]
+    if orjson is not None:
+        cases.append(('projected docs + MongoJSONProvider (orjson)', orjson, lambda: new_path(fast_app, page)))
+
+    print(f'{ROWS}-row listing page, best of 5 x {NUMBER} runs')
+    baseline = None
+    try:
+        for name, encoder, fn in cases:
+            json_provider.orjson = encoder
+            with stdlib_app.app_context(), fast_app.app_context():
+                best = min(timeit.repeat(fn, number=NUMBER, repeat=5)) / NUMBER
+            baseline = baseline or best
+            print(f'  {name:<48} {best * 1e6:8.1f} us/page  ({baseline / best:.1f}x)')
+    finally:
+        json_provider.orjson = orjson
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Microbenchmark: parsing saved Lodestone character pages
+
+Compares the old path, a full html.parser tree walked by the _extract_*
+helpers, with LodestoneService.parse_character_page(), which builds only
+the CHARACTER_SECTIONS subtrees, for every installed parser backend and
+every page in tests/fixtures/lodestone.
+
+Run from the backend directory:
+    python benchmarks/bench_lodestone_parse.py
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from app.services.lodestone_service import LodestoneService
+from app.utils.html_parser import available_backends
+
+FIXTURE_DIR = Path(__file__).parent.parent / 'tests' / 'fixtures' / 'lodestone'
+NUMBER = 20
+
+
+def full_tree(content):
+    return LodestoneService.extract_character(BeautifulSoup(content, 'html.parser'), '1')
+
+
+def targeted(content, backend):
+    return LodestoneService.parse_character_page(content, '1', backend=backend)
+
+
+def peak_kib(fn):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    print(f'Best of 5 x {NUMBER} runs')
+    for path in sorted(FIXTURE_DIR.glob('*.html')):
+        content = path.read_bytes()
+        cases = [('html.parser, full tree', lambda: full_tree(content))] + [
+            (f'{backend}, sections only', lambda backend=backend: targeted(content, backend))
+            for backend in available_backends()
+        ]
+
+        print(f'{path.name} ({len(content) / 1024:.0f} KiB)')
+        for name, fn in cases:
+            best = min(timeit.repeat(fn, number=NUMBER, repeat=5)) / NUMBER
+            print(f'  {name:<28} {best * 1e3:8.2f} ms/page  {peak_kib(fn):8.1f} KiB peak')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Microbenchmark: converting a 100-row listing page to response dicts
+
+Compares building a Listing per document (Listing.from_dict(...).to_dict())
+with the compiled Listing.serialize() that reads the document directly,
+for every field and for the ?view=summary field set.
+
+Run from the backend directory:
+    python benchmarks/bench_models.py
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_json_provider import make_page
+from app.models.listing import Listing
+
+NUMBER = 500
+
+
+def model_path(page, fields=None):
+    listings = []
+    for listing_data in page:
+        listing = Listing.from_dict(listing_data)
+        listing._id = listing_data['_id']
+        listings.append(listing.to_dict(fields=fields))
+    return listings
+
+
+def serialize_path(page, fields=None):
+    return [Listing.serialize(listing_data, fields) for listing_data in page]
+
+
+def peak_kib(fn):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    page = make_page()
+    summary = set(Listing.SUMMARY_FIELDS)
+
+    cases = [
+        ('from_dict + to_dict, all fields', lambda: model_path(page)),
+        ('serialize, all fields', lambda: serialize_path(page)),
+        ('from_dict + to_dict, summary', lambda: model_path(page, summary)),
+        ('serialize, summary', lambda: serialize_path(page, summary))
+    ]
+
+    print(f'{len(page)}-row listing page, best of 5 x {NUMBER} runs')
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=NUMBER, repeat=5)) / NUMBER
+        print(f'  {name:<36} {best * 1e6:8.1f} us/page  {peak_kib(fn):8.1f} KiB peak')
+
+
+if __name__ == '__main__':
+    main()
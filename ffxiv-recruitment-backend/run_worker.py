@@ -0,0 +1,17 @@
+import os
+
+# This process is the worker pool; don't also start one inside create_app
+os.environ['JOB_WORKER_ENABLED'] = 'false'
+
+from app import create_app
+from app.models.indexes import ensure_indexes
+from app.services.job_queue import JobWorker
+
+app = create_app()
+
+if __name__ == '__main__':
+    ensure_indexes(app.db)
+    
+    worker = JobWorker(app)
+    print(f"✅ Job worker running with {worker.threads} thread(s), press Ctrl+C to stop")
+    worker.run_forever()
@@ -2,9 +2,16 @@
 Pytest configuration and fixtures for Flask backend testing (using mongomock)
 """
 
+import base64
+import json
 import os
+import re
+import threading
+import time
 import pytest
 import mongomock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
 from app import create_app
 import bcrypt
 import pytest
@@ -49,9 +56,20 @@ def runner(app):
 
 @pytest.fixture(autouse=True)
 def clean_db(app):
-    """Automatically clear MongoDB collections before each test."""
+    """Automatically clear MongoDB collections and in-process caches before each test."""
+    from app.middleware.compression import compressed_cache
+    from app.services.fflogs_service import FFLogsService
+    from app.services.lodestone_service import LodestoneService
+    from app.services.search_index import listing_index
+    from app.utils.cache import app_cache
+
     for name in app.db.list_collection_names():
         app.db.drop_collection(name)
+    compressed_cache.clear()
+    app_cache.clear()
+    listing_index.reset()
+    LodestoneService.reset()
+    FFLogsService.reset()
     yield
     
 
@@ -130,4 +148,201 @@ def db_session(app):
 
     # Clean up after each test
     for name in db.list_collection_names():
-        db.drop_collection(name)
\ No newline at end of file
+        db.drop_collection(name)
+
+class LodestoneStub:
+    """
+    Local HTTP server standing in for the Lodestone
+
+    Serves tests/fixtures/lodestone/character.html for every character,
+    unless responses queued with queue() come first. With etag set, the page
+    carries that ETag and a matching If-None-Match gets a 304. Records each
+    request path, its headers and the client ports seen (one per TCP
+    connection).
+    """
+
+    PAGE = (Path(__file__).parent / 'fixtures' / 'lodestone' / 'character.html').read_bytes()
+
+    def __init__(self):
+        stub = self
+        self.responses = []
+        self.paths = []
+        self.request_headers = []
+        self.client_ports = set()
+        self.delay = 0
+        self.etag = None
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def do_GET(self):
+                stub.paths.append(self.path)
+                stub.client_ports.add(self.client_address[1])
+                if stub.delay:
+                    time.sleep(stub.delay)
+                stub.request_headers.append(dict(self.headers))
+                if stub.responses:
+                    status, body, headers = stub.responses.pop(0)
+                elif stub.etag and self.headers.get('If-None-Match') == stub.etag:
+                    status, body, headers = 304, b'', {'ETag': stub.etag}
+                else:
+                    status, body, headers = 200, stub.PAGE, {'ETag': stub.etag} if stub.etag else {}
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/lodestone/character'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def queue(self, status, body=b'', headers=None):
+        self.responses.append((status, body, headers or {}))
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def lodestone_stub(app):
+    """Point LodestoneService at a local stub server with fast retries"""
+    from app.services.lodestone_service import LodestoneService
+
+    stub = LodestoneStub()
+    base_url = LodestoneService.BASE_URL
+    LodestoneService.BASE_URL = stub.url
+    LodestoneService.http.configure(retries=2, backoff=0.01, read_timeout=0.5)
+    yield stub
+    stub.close()
+    LodestoneService.BASE_URL = base_url
+    LodestoneService.configure(app.config)
+
+
+class FFLogsStub:
+    """
+    Local HTTP server standing in for the FFLogs OAuth and GraphQL endpoints
+
+    Tokens are issued for client id/secret 'client'/'secret' and last
+    expires_in seconds. Queries are answered from characters,
+    {character id: {encounter id: encounterRankings JSON}}; characters not
+    in it come back null. errors, {(character id, encounter id or None)},
+    null those fields (or whole characters) with a GraphQL error at their
+    path, next to the rest of the data. rateLimitData reports points_spent (raised by
+    points_per_query each query) out of limit. Responses queued with queue()
+    answer the next GraphQL requests instead. Records each query and the
+    number of tokens issued.
+    """
+
+    CHARACTER = re.compile(r'(c\d+): character\(id: (\d+)\) \{([^}]*)\}')
+    ENCOUNTER = re.compile(r'(e\d+): encounterRankings\(encounterID: (\d+)\)')
+
+    def __init__(self):
+        stub = self
+        self.characters = {}
+        self.errors = set()
+        self.responses = []
+        self.queries = []
+        self.tokens = []
+        self.expires_in = 3600
+        self.limit = 3600
+        self.points_spent = 0
+        self.points_per_query = 1
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send(self, status, body, headers=None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path == '/oauth/token':
+                    if self.headers.get('Authorization') != 'Basic ' + base64.b64encode(b'client:secret').decode():
+                        return self._send(401, {'error': 'invalid_client'})
+                    stub.tokens.append(f'token{len(stub.tokens) + 1}')
+                    return self._send(200, {
+                        'token_type': 'Bearer', 'access_token': stub.tokens[-1], 'expires_in': stub.expires_in
+                    })
+
+                if not stub.tokens or self.headers.get('Authorization') != f'Bearer {stub.tokens[-1]}':
+                    return self._send(401, {'error': 'Unauthenticated.'})
+                query = json.loads(body)['query']
+                stub.queries.append(query)
+                if stub.responses:
+                    status, response, headers = stub.responses.pop(0)
+                    return self._send(status, response, headers)
+
+                stub.points_spent += stub.points_per_query
+                characters = {}
+                errors = []
+                for alias, character_id, fields in stub.CHARACTER.findall(query):
+                    rankings = stub.characters.get(int(character_id))
+                    characters[alias] = None if rankings is None else {
+                        field: rankings.get(int(encounter_id), {'totalKills': 0, 'ranks': []})
+                        for field, encounter_id in stub.ENCOUNTER.findall(fields)
+                    }
+                    if (int(character_id), None) in stub.errors:
+                        characters[alias] = None
+                        errors.append({'message': 'Internal error', 'path': ['characterData', alias]})
+                    for field, encounter_id in stub.ENCOUNTER.findall(fields):
+                        if characters[alias] and (int(character_id), int(encounter_id)) in stub.errors:
+                            characters[alias][field] = None
+                            errors.append({'message': 'Internal error', 'path': ['characterData', alias, field]})
+                body = {'data': {
+                    'rateLimitData': {
+                        'limitPerHour': stub.limit, 'pointsSpentThisHour': stub.points_spent, 'pointsResetIn': 1800
+                    },
+                    'characterData': characters
+                }}
+                if errors:
+                    body['errors'] = errors
+                self._send(200, body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def queue(self, status, body, headers=None):
+        self.responses.append((status, body, headers or {}))
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fflogs_stub(app):
+    """Point FFLogsService at a local stub server with test credentials"""
+    from app.services.fflogs_service import FFLogsService
+
+    stub = FFLogsStub()
+    FFLogsService.configure(dict(
+        app.config,
+        FFLOGS_CLIENT_ID='client',
+        FFLOGS_CLIENT_SECRET='secret',
+        FFLOGS_TOKEN_URL=f'{stub.url}/oauth/token',
+        FFLOGS_API_URL=f'{stub.url}/api/v2/client',
+        FFLOGS_RETRIES=0
+    ))
+    yield stub
+    stub.close()
+    FFLogsService.configure(app.config)
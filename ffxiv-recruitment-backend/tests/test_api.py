@@ -4,9 +4,22 @@ Place this in: ffxiv-recruitment-backend/tests/test_api.py
 """
 
 import pytest
+import gzip
 import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
 from bson import ObjectId
 
+# TestingConfig.METRICS_TOKEN
+METRICS_HEADERS = {'Authorization': 'Bearer test-metrics-token'}
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
 
 class TestHealthCheck:
     """Test health check and basic endpoints"""
@@ -20,6 +33,24 @@ class TestHealthCheck:
         """Test API root endpoint"""
         response = client.get('/api/')
         assert response.status_code in [200, 404]
+    
+    def test_metrics_require_token(self, client, app, monkeypatch):
+        """Test that /metrics needs the bearer token and is off without one"""
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        assert client.get('/metrics', headers=METRICS_HEADERS).status_code == 200
+        
+        monkeypatch.setitem(app.config, 'METRICS_TOKEN', None)
+        assert client.get('/metrics', headers=METRICS_HEADERS).status_code == 404
+
+    def test_json_provider_falls_back_to_flask_types(self, app):
+        """Test that types Flask encodes itself still serialize alongside BSON types"""
+        oid = ObjectId()
+        body = app.json.dumps({'id': oid, 'price': Decimal('1.50'), 'point': Point(1, 2)})
+        assert json.loads(body) == {'id': str(oid), 'price': '1.50', 'point': {'x': 1, 'y': 2}}
+        
+        with pytest.raises(TypeError):
+            app.json.dumps({'bad': object()})
 
 
 class TestAuthentication:
@@ -419,6 +450,170 @@ class TestFilters:
         assert data['page'] == 2
 
 
+class TestCursorPagination:
+    """Test cursor pagination of my-listings and my-applications"""
+    
+    def test_my_listings_cursor_pages(self, client, auth_headers, app, sample_user):
+        """Test walking my-listings page by page"""
+        base = datetime(2024, 1, 1)
+        for i in range(5):
+            app.db.listings.insert_one({
+                '_id': ObjectId(),
+                'title': f'Listing {i}',
+                'description': 'A very long description',
+                'owner_id': sample_user['_id'],
+                'content_type': 'savage',
+                'data_center': 'Primal',
+                'state': 'recruiting' if i % 2 else 'private',
+                'application_count': 0,
+                # Two listings share a timestamp to exercise the _id tie-break
+                'created_at': base + timedelta(days=min(i, 3))
+            })
+        
+        titles = []
+        cursor = None
+        while True:
+            url = '/api/listings/my-listings?limit=2'
+            if cursor:
+                url += f'&cursor={cursor}'
+            data = client.get(url, headers=auth_headers).get_json()
+            assert len(data['listings']) <= 2
+            titles.extend(listing['title'] for listing in data['listings'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        
+        assert sorted(titles) == [f'Listing {i}' for i in range(5)]
+        assert len(set(titles)) == 5
+        assert titles[-1] == 'Listing 0'
+    
+    def test_my_listings_state_filter_and_summary(self, client, auth_headers, app, sample_user):
+        """Test state filtering and the summary projection"""
+        for state in ['private', 'recruiting', 'recruiting']:
+            app.db.listings.insert_one({
+                '_id': ObjectId(),
+                'title': 'Summary',
+                'description': 'A very long description',
+                'additional_info': 'More long text',
+                'owner_id': sample_user['_id'],
+                'content_type': 'savage',
+                'data_center': 'Primal',
+                'state': state,
+                'application_count': 0
+            })
+        
+        response = client.get('/api/listings/my-listings?state=recruiting&view=summary',
+                              headers=auth_headers)
+        assert response.status_code == 200
+        listings = response.get_json()['listings']
+        assert len(listings) == 2
+        assert 'description' not in listings[0]
+        assert 'additional_info' not in listings[0]
+        assert listings[0]['can_apply'] is True
+    
+    def test_my_listings_invalid_cursor(self, client, auth_headers):
+        """Test that a malformed cursor is rejected"""
+        response = client.get('/api/listings/my-listings?cursor=garbage', headers=auth_headers)
+        assert response.status_code == 400
+    
+    def test_my_applications_pagination(self, client, auth_headers, app, sample_user):
+        """Test my-applications paging, status filter and listing info"""
+        listing_id = ObjectId()
+        app.db.listings.insert_one({
+            '_id': listing_id,
+            'title': 'Applied Listing',
+            'description': 'Test',
+            'owner_id': ObjectId(),
+            'content_type': 'savage',
+            'data_center': 'Primal',
+            'state': 'recruiting'
+        })
+        for i, status in enumerate(['pending', 'accepted', 'pending']):
+            app.db.applications.insert_one({
+                'listing_id': listing_id,
+                'applicant_id': sample_user['_id'],
+                'status': status,
+                'message': 'Please pick me',
+                'created_at': datetime(2024, 1, 1 + i)
+            })
+        
+        data = client.get('/api/applications/?status=pending&limit=1&view=summary',
+                          headers=auth_headers).get_json()
+        assert len(data['applications']) == 1
+        assert data['next_cursor']
+        assert 'message' not in data['applications'][0]
+        assert data['applications'][0]['listing']['title'] == 'Applied Listing'
+        
+        data = client.get(f"/api/applications/?status=pending&limit=1&cursor={data['next_cursor']}",
+                          headers=auth_headers).get_json()
+        assert len(data['applications']) == 1
+        assert data['applications'][0]['message'] == 'Please pick me'
+        assert data['next_cursor'] is None
+
+
+class TestSparseFieldsets:
+    """Test ?fields= selection on listing, user and search endpoints"""
+    
+    def _insert_listing(self, app, owner_id):
+        listing_id = ObjectId()
+        app.db.listings.insert_one({
+            '_id': listing_id,
+            'title': 'Fields Listing',
+            'description': 'A very long description',
+            'requirements': {'min_ilvl': 700},
+            'owner_id': owner_id,
+            'content_type': 'savage',
+            'data_center': 'Primal',
+            'state': 'recruiting',
+            'application_count': 0
+        })
+        return listing_id
+    
+    def test_listings_fields(self, client, app, sample_user):
+        """Test that only the requested listing fields are returned"""
+        self._insert_listing(app, sample_user['_id'])
+        
+        response = client.get('/api/listings/?fields=id,title,state')
+        assert response.status_code == 200
+        listing = response.get_json()['listings'][0]
+        assert set(listing) == {'id', 'title', 'state'}
+    
+    def test_single_listing_fields_with_owner(self, client, app, sample_user):
+        """Test derived fields on a single listing"""
+        listing_id = self._insert_listing(app, sample_user['_id'])
+        
+        response = client.get(f'/api/listings/{listing_id}?fields=title,can_apply,owner')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert set(data) == {'title', 'can_apply', 'owner'}
+        assert data['owner']['username'] == 'testuser'
+    
+    def test_unknown_field_rejected(self, client):
+        """Test that fields outside the resource's field set are rejected"""
+        response = client.get('/api/listings/?fields=title,password_hash')
+        assert response.status_code == 400
+        assert 'password_hash' in response.get_json()['message']
+    
+    def test_user_fields(self, client, sample_user):
+        """Test field selection on public profiles"""
+        response = client.get(f"/api/users/{sample_user['_id']}?fields=id,username")
+        assert response.status_code == 200
+        assert response.get_json() == {'id': str(sample_user['_id']), 'username': 'testuser'}
+        
+        response = client.get(f"/api/users/{sample_user['_id']}?fields=email")
+        assert response.status_code == 400
+    
+    def test_search_fields(self, client, app, sample_user):
+        """Test field selection on search endpoints"""
+        self._insert_listing(app, sample_user['_id'])
+        
+        listing = client.get('/api/search/listings?fields=id,title').get_json()['listings'][0]
+        assert set(listing) == {'id', 'title'}
+        
+        player = client.get('/api/search/players?fields=username').get_json()['players'][0]
+        assert player == {'username': 'testuser'}
+
+
 class TestPrivateListings:
     """Test private listing visibility"""
     
@@ -461,6 +656,367 @@ class TestPrivateListings:
         assert data['total'] == 1
 
 
+class TestBulkApplicationStatus:
+    """Test bulk application triage"""
+    
+    def _create_listing_with_applications(self, app, owner_id, count):
+        listing_id = ObjectId()
+        app.db.listings.insert_one({
+            '_id': listing_id,
+            'title': 'Triage Listing',
+            'description': 'Test',
+            'owner_id': owner_id,
+            'content_type': 'savage',
+            'data_center': 'Primal',
+            'state': 'recruiting',
+            'application_count': count
+        })
+        app_ids = []
+        for _ in range(count):
+            result = app.db.applications.insert_one({
+                'listing_id': listing_id,
+                'applicant_id': ObjectId(),
+                'status': 'pending'
+            })
+            app_ids.append(result.inserted_id)
+        return listing_id, app_ids
+    
+    def test_bulk_update_statuses(self, client, auth_headers, app, sample_user):
+        """Test accepting and rejecting several applications in one call"""
+        _, app_ids = self._create_listing_with_applications(app, sample_user['_id'], 3)
+        
+        response = client.patch('/api/applications/bulk-status',
+            headers=auth_headers,
+            json={'updates': [
+                {'id': str(app_ids[0]), 'status': 'accepted'},
+                {'id': str(app_ids[1]), 'status': 'rejected'},
+                {'id': str(app_ids[2]), 'status': 'accepted'}
+            ]}
+        )
+        
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['updated'] == 3
+        assert data['failed'] == 0
+        statuses = [app.db.applications.find_one({'_id': app_id})['status'] for app_id in app_ids]
+        assert statuses == ['accepted', 'rejected', 'accepted']
+    
+    def test_bulk_update_reports_per_item_errors(self, client, auth_headers, app, sample_user):
+        """Test that invalid or foreign applications fail individually"""
+        _, own_ids = self._create_listing_with_applications(app, sample_user['_id'], 1)
+        _, other_ids = self._create_listing_with_applications(app, ObjectId(), 1)
+        
+        response = client.patch('/api/applications/bulk-status',
+            headers=auth_headers,
+            json={'updates': [
+                {'id': str(own_ids[0]), 'status': 'accepted'},
+                {'id': str(other_ids[0]), 'status': 'accepted'},
+                {'id': str(ObjectId()), 'status': 'accepted'},
+                {'id': 'not-an-id', 'status': 'accepted'},
+                {'id': str(own_ids[0]), 'status': 'bogus'}
+            ]}
+        )
+        
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['updated'] == 1
+        messages = [result.get('message') for result in data['results']]
+        assert messages == [None, 'Unauthorized', 'Application not found',
+                            'Invalid application ID', 'Invalid status. Must be pending, accepted, or rejected']
+        assert app.db.applications.find_one({'_id': other_ids[0]})['status'] == 'pending'
+    
+    def test_bulk_update_requires_updates(self, client, auth_headers):
+        """Test that an empty batch is rejected"""
+        response = client.patch('/api/applications/bulk-status',
+            headers=auth_headers,
+            json={'updates': []}
+        )
+        
+        assert response.status_code == 400
+
+
+class TestConditionalRequests:
+    """Test ETag / If-None-Match handling on listing and profile reads"""
+    
+    def _insert_listing(self, app, owner_id, state='recruiting'):
+        listing_id = ObjectId()
+        app.db.listings.insert_one({
+            '_id': listing_id,
+            'title': 'ETag Listing',
+            'description': 'Cached listing',
+            'owner_id': owner_id,
+            'content_type': 'savage',
+            'data_center': 'Primal',
+            'state': state,
+            'application_count': 0,
+            'created_at': datetime(2024, 1, 1),
+            'updated_at': datetime(2024, 1, 1)
+        })
+        return listing_id
+    
+    def test_listing_not_modified(self, client, app, sample_user):
+        """Test that a matching If-None-Match gets an empty 304"""
+        listing_id = self._insert_listing(app, sample_user['_id'])
+        
+        response = client.get(f'/api/listings/{listing_id}')
+        etag = response.headers['ETag']
+        assert response.status_code == 200
+        assert 'Authorization' in response.headers['Vary']
+        
+        response = client.get(f'/api/listings/{listing_id}', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+        assert response.get_data() == b''
+    
+    def test_listing_etag_changes(self, client, app, sample_user, auth_headers):
+        """Test that edits, application counts, fields and viewers change the tag"""
+        listing_id = self._insert_listing(app, sample_user['_id'])
+        url = f'/api/listings/{listing_id}'
+        etag = client.get(url).headers['ETag']
+        
+        assert client.get(f'{url}?fields=title').headers['ETag'] != etag
+        assert client.get(url, headers=auth_headers).headers['ETag'] != etag
+        
+        app.db.listings.update_one({'_id': listing_id}, {'$inc': {'application_count': 1}})
+        response = client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.get_json()['application_count'] == 1
+        
+        etag = response.headers['ETag']
+        app.db.listings.update_one({'_id': listing_id}, {'$set': {'updated_at': datetime.utcnow()}})
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
+    
+    def test_private_listing_not_revealed(self, client, app, sample_user):
+        """Test that a conditional request cannot probe a private listing"""
+        listing_id = self._insert_listing(app, sample_user['_id'], state='private')
+        
+        response = client.get(f'/api/listings/{listing_id}', headers={'If-None-Match': '*'})
+        assert response.status_code == 404
+    
+    def test_listing_pages_not_modified(self, client, app, sample_user, auth_headers):
+        """Test 304s on the listing and my-listings pages"""
+        self._insert_listing(app, sample_user['_id'])
+        
+        for url, headers in [('/api/listings/', {}), ('/api/listings/my-listings', auth_headers)]:
+            response = client.get(url, headers=headers)
+            etag = response.headers['ETag']
+            
+            response = client.get(url, headers={**headers, 'If-None-Match': etag})
+            assert response.status_code == 304
+        
+        etag = client.get('/api/listings/').headers['ETag']
+        assert client.get('/api/listings/?content_type=savage').headers['ETag'] != etag
+        
+        self._insert_listing(app, sample_user['_id'])
+        assert client.get('/api/listings/', headers={'If-None-Match': etag}).status_code == 200
+    
+    def test_user_not_modified(self, client, app, sample_user):
+        """Test 304s on public profiles and that unlinking changes the tag"""
+        url = f"/api/users/{sample_user['_id']}"
+        etag = client.get(url).headers['ETag']
+        
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+        
+        app.db.users.update_one({'_id': sample_user['_id']}, {'$set': {'updated_at': datetime.utcnow()}})
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
+
+
+class TestCompression:
+    """Test gzip negotiation and the compressed response cache"""
+    
+    def _insert_listings(self, app, owner_id, count=20):
+        app.db.listings.insert_many([{
+            '_id': ObjectId(),
+            'title': f'Compressed Listing {i}',
+            'description': 'Looking for a co-healer for savage prog. ' * 5,
+            'owner_id': owner_id,
+            'content_type': 'savage',
+            'data_center': 'Primal',
+            'state': 'recruiting',
+            'application_count': 0,
+            'created_at': datetime(2024, 1, 1) + timedelta(hours=i),
+            'updated_at': datetime(2024, 1, 1)
+        } for i in range(count)])
+    
+    def test_large_response_gzipped(self, client, app, sample_user):
+        """Test that a large listing page is gzipped and decodes to the same JSON"""
+        self._insert_listings(app, sample_user['_id'])
+        plain = client.get('/api/listings/')
+        
+        response = client.get('/api/listings/', headers={'Accept-Encoding': 'gzip'})
+        
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert len(response.get_data()) < len(plain.get_data())
+        assert json.loads(gzip.decompress(response.get_data())) == plain.get_json()
+        assert response.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+    
+    def test_small_or_unaccepted_response_not_compressed(self, client, app, sample_user):
+        """Test the size threshold and clients that don't accept gzip"""
+        response = client.get('/health', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
+        
+        self._insert_listings(app, sample_user['_id'])
+        for accept in ['identity', 'gzip;q=0']:
+            response = client.get('/api/listings/', headers={'Accept-Encoding': accept})
+            assert 'Content-Encoding' not in response.headers
+    
+    def test_anonymous_responses_cached(self, client, app, sample_user):
+        """Test that repeated anonymous pages are compressed once"""
+        from app.middleware.compression import compressed_cache
+        self._insert_listings(app, sample_user['_id'])
+        
+        first = client.get('/api/listings/', headers={'Accept-Encoding': 'gzip'})
+        second = client.get('/api/listings/', headers={'Accept-Encoding': 'gzip'})
+        
+        assert first.get_data() == second.get_data()
+        assert compressed_cache.stats()['hits'] == 1
+    
+    def test_compressed_etag_not_modified(self, client, app, sample_user):
+        """Test that the -gzip ETag is accepted in If-None-Match"""
+        self._insert_listings(app, sample_user['_id'])
+        etag = client.get('/api/listings/', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+        
+        response = client.get('/api/listings/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+
+
+class TestListingPageCache:
+    """Test the anonymous listing page cache"""
+    
+    @pytest.fixture(autouse=True)
+    def enable_cache(self, monkeypatch):
+        from app.utils.cache import app_cache
+        monkeypatch.setattr(app_cache, 'enabled', True)
+    
+    def _insert_listing(self, app, owner_id, title):
+        app.db.listings.insert_one({
+            '_id': ObjectId(),
+            'title': title,
+            'description': 'Cached page',
+            'owner_id': owner_id,
+            'content_type': 'savage',
+            'data_center': 'Primal',
+            'state': 'recruiting',
+            'application_count': 0,
+            'created_at': datetime.utcnow(),
+            'updated_at': datetime.utcnow()
+        })
+    
+    def test_anonymous_pages_cached(self, client, app, sample_user):
+        """Test that repeated anonymous pages skip the database"""
+        self._insert_listing(app, sample_user['_id'], 'First')
+        
+        for url in ['/api/listings/?data_center=Primal', '/api/search/listings?data_center=Primal']:
+            first = client.get(url)
+            # Written behind the API's back, so only visible once invalidated
+            self._insert_listing(app, sample_user['_id'], f'Hidden {url}')
+            second = client.get(url)
+            
+            assert second.get_data() == first.get_data()
+            assert second.headers.get('ETag') == first.headers.get('ETag')
+        
+        stats = client.get('/metrics', headers=METRICS_HEADERS).get_json()['cache']
+        assert stats['computes'] == 2  # one per endpoint; the repeats were hits
+    
+    def test_authenticated_requests_bypass_cache(self, client, app, sample_user, auth_headers):
+        """Test that signed-in users always see fresh pages"""
+        self._insert_listing(app, sample_user['_id'], 'First')
+        client.get('/api/listings/')
+        self._insert_listing(app, sample_user['_id'], 'Second')
+        
+        response = client.get('/api/listings/', headers=auth_headers)
+        
+        assert response.get_json()['total'] == 2
+    
+    def test_writes_invalidate(self, client, app, sample_user, auth_headers):
+        """Test that creating and changing listings through the API invalidates pages"""
+        assert client.get('/api/listings/').get_json()['total'] == 0
+        
+        response = client.post('/api/listings/', headers=auth_headers, json={
+            'title': 'New Static',
+            'description': 'Fresh',
+            'content_type': 'savage',
+            'data_center': 'Primal',
+            'state': 'recruiting'
+        })
+        listing_id = response.get_json()['id']
+        assert client.get('/api/listings/').get_json()['total'] == 1
+        
+        client.patch(f'/api/listings/{listing_id}/state', headers=auth_headers, json={'state': 'private'})
+        assert client.get('/api/listings/').get_json()['total'] == 0
+        
+        stats = client.get('/metrics', headers=METRICS_HEADERS).get_json()['cache']
+        assert stats['invalidations'] == 6  # listings, facets and recommendations, twice
+        assert stats['local_hits'] == 0
+
+
+class TestJSONProvider:
+    """Test native ObjectId/datetime encoding"""
+    
+    def test_encodes_bson_types(self, app):
+        """Test that ObjectId and datetime serialize like str()/isoformat()"""
+        object_id = ObjectId()
+        created_at = datetime(2024, 5, 1, 20, 30, 15, 123456)
+        
+        with app.app_context():
+            response = app.json.response({'_id': object_id, 'created_at': created_at, 'roles': {1: 'Tank'}})
+        
+        assert json.loads(response.get_data()) == {
+            '_id': str(object_id),
+            'created_at': created_at.isoformat(),
+            'roles': {'1': 'Tank'}
+        }
+    
+    def test_stdlib_fallback_matches(self, app, monkeypatch):
+        """Test that the stdlib fallback produces the same document"""
+        from app.utils import json_provider
+        doc = {'_id': ObjectId(), 'created_at': datetime(2024, 5, 1), 'name': 'Tëst'}
+        
+        with app.app_context():
+            fast = json.loads(app.json.response(doc).get_data())
+            monkeypatch.setattr(json_provider, 'orjson', None)
+            slow = json.loads(app.json.response(doc).get_data())
+        
+        assert fast == slow
+
+
+class TestModelSerializers:
+    """Test that compiled serializers match the model to_dict() output"""
+    
+    def test_listing_serialize_matches_to_dict(self, app):
+        """Test Listing.serialize against from_dict().to_dict()"""
+        from app.models.listing import Listing
+        doc = {
+            '_id': ObjectId(),
+            'title': 'Serializer Static',
+            'owner_id': ObjectId(),
+            'state': 'filled',
+            'created_at': datetime(2024, 5, 1, 20, 30),
+            'updated_at': datetime(2024, 5, 2, 9, 0)
+        }
+        listing = Listing.from_dict(doc)
+        listing._id = doc['_id']
+        
+        with app.app_context():
+            serialized = json.loads(app.json.response(Listing.serialize(doc)).get_data())
+        
+        assert serialized == listing.to_dict()
+        assert serialized['can_apply'] is False
+        assert Listing.serialize(doc, {'id', 'title'}) == {'id': str(doc['_id']), 'title': 'Serializer Static'}
+    
+    def test_user_serialize_sensitive(self):
+        """Test that email is only included when asked for"""
+        from app.models.user import User
+        doc = {'_id': ObjectId(), 'username': 'serial', 'email': 'serial@example.com', 'password_hash': 'x'}
+        
+        assert 'email' not in User.serialize(doc)
+        assert User.serialize(doc, sensitive=True)['email'] == 'serial@example.com'
+        assert 'password_hash' not in User.serialize(doc, sensitive=True)
+
+
 class TestValidation:
     """Test input validation"""
     
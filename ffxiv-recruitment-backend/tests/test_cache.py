@@ -0,0 +1,239 @@
+"""
+Tests for the two-tier cache
+"""
+
+import threading
+import time
+import pytest
+from datetime import datetime
+from bson import ObjectId
+import pickle
+from app.utils.cache import InMemoryBackend, SingleFlight, TwoTierCache, decode_value, encode_value
+
+
+def make_cache(backend, **settings):
+    config = {'CACHE_ENABLED': True, 'CACHE_TTLS': {'listings': 30}, 'CACHE_VERSION_TTL': 0}
+    config.update(settings)
+    return TwoTierCache(backend).configure(config)
+
+
+class FailingBackend(InMemoryBackend):
+    def __getattribute__(self, name):
+        if name in ('get', 'get_many', 'set', 'set_many', 'add', 'incr', 'delete'):
+            raise ConnectionError('backend down')
+        return super().__getattribute__(name)
+
+
+class TestTwoTierCache:
+    """Test tiers, versioning and recomputation"""
+
+    def test_values_round_trip_through_backend(self):
+        backend = InMemoryBackend()
+        worker_a, worker_b = make_cache(backend), make_cache(backend)
+        value = {'_id': ObjectId(), 'created_at': datetime(2024, 1, 1), 'roles': ['Tank']}
+
+        worker_a.set('listings', 'page:1', value)
+
+        assert worker_b.get('listings', 'page:1') == value
+        assert worker_b.stats()['backend_hits'] == 1
+        assert worker_b.get('listings', 'page:1') == value
+        assert worker_b.stats()['local_hits'] == 1
+
+    def test_values_are_json_not_pickle(self):
+        value = [b'{"listings":[]}', {'_id': ObjectId(), 'at': datetime(2024, 1, 1, 20, 30)}]
+
+        assert decode_value(encode_value(value)) == value
+        assert encode_value({'a': 1}).startswith(b'{')
+        with pytest.raises(ValueError):
+            decode_value(pickle.dumps({'a': 1}))
+
+    def test_returned_values_are_copies(self):
+        cache = make_cache(InMemoryBackend())
+        cache.set('listings', 'page:1', {'listings': []})
+
+        cache.get('listings', 'page:1')['listings'].append('mutated')
+
+        assert cache.get('listings', 'page:1') == {'listings': []}
+
+    def test_invalidate_reaches_other_workers(self):
+        backend = InMemoryBackend()
+        worker_a, worker_b = make_cache(backend), make_cache(backend)
+        worker_b.set('listings', 'page:1', 'old')
+
+        worker_a.invalidate('listings')
+
+        assert worker_b.get('listings', 'page:1') is None
+        assert worker_b.version('listings') == 1
+
+    def test_get_or_set_computes_once(self):
+        cache = make_cache(InMemoryBackend())
+        computed = []
+
+        for _ in range(3):
+            assert cache.get_or_set('listings', 'page:1', lambda: computed.append(1) or 'page') == 'page'
+
+        assert len(computed) == 1
+
+    def test_concurrent_misses_share_one_computation(self):
+        cache = make_cache(InMemoryBackend())
+        computed = []
+        release = threading.Event()
+
+        def compute():
+            computed.append(1)
+            release.wait(1)
+            return 'page'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get_or_set('listings', 'page:1', compute)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert results == ['page'] * 5
+        assert len(computed) == 1
+        assert cache.stats()['coalesced'] == 4
+
+    def test_waits_for_other_process_holding_lock(self):
+        backend = InMemoryBackend()
+        worker_a, worker_b = make_cache(backend), make_cache(backend)
+        full_key = worker_a.full_key('listings', 'page:1')
+        backend.add(f'{full_key}:lock', b'1', 10)
+
+        threading.Timer(0.1, lambda: worker_a.set('listings', 'page:1', 'from a')).start()
+
+        assert worker_b.get_or_set('listings', 'page:1', lambda: 'from b') == 'from a'
+        assert worker_b.stats()['lock_waits'] == 1
+        assert worker_b.stats()['computes'] == 0
+
+    def test_value_computed_during_invalidation_is_not_served(self):
+        cache = make_cache(InMemoryBackend())
+
+        def compute():
+            cache.invalidate('listings')  # a write lands mid-computation
+            return 'stale'
+
+        assert cache.get_or_set('listings', 'page:1', compute) == 'stale'
+        assert cache.get_or_set('listings', 'page:1', lambda: 'fresh') == 'fresh'
+
+    def test_backend_outage_degrades_to_local(self):
+        cache = make_cache(FailingBackend())
+
+        assert cache.get_or_set('listings', 'page:1', lambda: 'page') == 'page'
+        assert cache.get('listings', 'page:1') == 'page'
+        assert cache.stats()['backend_errors'] > 0
+
+        cache.invalidate('listings')
+        assert cache.get('listings', 'page:1') is None
+
+    def test_local_copies_expire(self):
+        backend = InMemoryBackend()
+        worker_a = make_cache(backend)
+        worker_b = make_cache(backend, CACHE_LOCAL_TTL=0.05)
+        worker_a.set('users', 'user:1', 'old')
+        assert worker_b.get('users', 'user:1') == 'old'
+
+        worker_a.delete('users', 'user:1')
+
+        assert worker_b.get('users', 'user:1') == 'old'  # local copy
+        time.sleep(0.06)
+        assert worker_b.get('users', 'user:1') is None
+
+    def test_disabled_cache_always_computes(self):
+        cache = make_cache(InMemoryBackend(), CACHE_ENABLED=False)
+
+        assert cache.get_or_set('listings', 'page:1', lambda: 'a') == 'a'
+        assert cache.get_or_set('listings', 'page:1', lambda: 'b') == 'b'
+
+
+class TestSingleFlight:
+    """Test that errors reach every waiting caller"""
+
+    def test_error_is_shared(self):
+        flights = SingleFlight()
+
+        def fail():
+            raise RuntimeError('boom')
+
+        with pytest.raises(RuntimeError):
+            flights.do('key', fail)
+        assert flights.do('key', lambda: 'ok') == 'ok'
+
+
+class TestCachedRoutes:
+    """Test owner summaries and recommendations through the cache"""
+
+    @pytest.fixture(autouse=True)
+    def enable_cache(self, monkeypatch):
+        from app.utils.cache import app_cache
+        monkeypatch.setattr(app_cache, 'enabled', True)
+
+    def _insert_listing(self, app, owner_id, **overrides):
+        listing = {
+            '_id': ObjectId(),
+            'title': 'Recommended Static',
+            'description': 'Needs a healer',
+            'owner_id': owner_id,
+            'content_type': 'savage',
+            'data_center': 'Primal',
+            'roles_needed': {'healer': 1},
+            'state': 'recruiting',
+            'application_count': 0,
+            'created_at': datetime.utcnow()
+        }
+        listing.update(overrides)
+        app.db.listings.insert_one(listing)
+        return listing
+
+    def test_recommended_route(self, client, app, sample_user, auth_headers):
+        """Test that /api/search/recommended is registered and scores listings"""
+        owner_id = ObjectId()
+        app.db.users.insert_one({'_id': owner_id, 'username': 'owner', 'character_name': 'Owner Char'})
+        app.db.users.update_one(
+            {'_id': sample_user['_id']},
+            {'$set': {'data_center': 'Primal', 'roles': ['healer'], 'updated_at': datetime.utcnow()}}
+        )
+        self._insert_listing(app, owner_id)
+        self._insert_listing(app, owner_id, data_center='Aether')
+        self._insert_listing(app, sample_user['_id'])
+
+        response = client.get('/api/search/recommended', headers=auth_headers)
+
+        assert response.status_code == 200
+        recommendations = response.get_json()['recommendations']
+        assert len(recommendations) == 1
+        assert recommendations[0]['matchScore'] == 60
+        assert recommendations[0]['listing']['owner']['character_name'] == 'Owner Char'
+
+    def test_recommendations_invalidated_by_listing_writes(self, client, app, sample_user, auth_headers):
+        """Test that listing writes through the API invalidate cached recommendations"""
+        app.db.users.update_one({'_id': sample_user['_id']}, {'$set': {'data_center': 'Primal'}})
+        owner_id = ObjectId()
+        app.db.users.insert_one({'_id': owner_id, 'username': 'owner'})
+        self._insert_listing(app, owner_id)
+
+        assert len(client.get('/api/search/recommended', headers=auth_headers).get_json()['recommendations']) == 1
+        # Written behind the API's back: still served from the cache
+        self._insert_listing(app, owner_id)
+        assert len(client.get('/api/search/recommended', headers=auth_headers).get_json()['recommendations']) == 1
+
+        client.post('/api/listings/', headers=auth_headers, json={
+            'title': 'Own listing', 'description': 'x', 'content_type': 'savage', 'data_center': 'Primal'
+        })
+        assert len(client.get('/api/search/recommended', headers=auth_headers).get_json()['recommendations']) == 2
+
+    def test_owner_summary_invalidated_by_profile_update(self, client, app, sample_user, auth_headers):
+        """Test that listing owners reflect a profile change"""
+        listing = self._insert_listing(app, sample_user['_id'])
+        url = f"/api/listings/{listing['_id']}"
+        assert client.get(url).get_json()['owner']['character_name'] is None
+
+        client.put('/api/users/profile', headers=auth_headers, json={'character_name': 'New Name'})
+
+        assert client.get(url).get_json()['owner']['character_name'] == 'New Name'
@@ -0,0 +1,82 @@
+"""
+Tests for the circuit breaker
+"""
+
+import pytest
+from app.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker('Upstream', failure_rate=0.5, min_calls=4, window_seconds=60, open_seconds=30, clock=clock)
+
+
+def call(breaker, ok):
+    breaker.allow()
+    breaker.record(ok)
+
+
+class TestCircuitBreaker:
+    """Test opening, fast-failing and half-open probing"""
+
+    def test_opens_at_failure_rate(self, breaker):
+        for ok in (True, False, True):
+            call(breaker, ok)
+        assert breaker.state == 'closed'  # below min_calls
+
+        call(breaker, False)
+
+        assert breaker.state == 'open'
+        with pytest.raises(CircuitOpenError) as error:
+            breaker.allow()
+        assert error.value.retry_after == 30
+        assert breaker.stats()['rejected'] == 1
+
+    def test_old_outcomes_leave_the_window(self, breaker, clock):
+        for _ in range(3):
+            call(breaker, False)
+        clock.now += 61
+
+        call(breaker, True)
+
+        assert breaker.state == 'closed'
+        assert breaker.stats()['calls'] == 1
+
+    def test_half_open_probe(self, breaker, clock):
+        for _ in range(4):
+            call(breaker, False)
+        clock.now += 29
+        assert breaker.retry_after() == pytest.approx(1)
+        clock.now += 1
+
+        breaker.allow()  # the probe
+        with pytest.raises(CircuitOpenError):
+            breaker.allow()  # only one at a time
+        breaker.record(True)
+
+        assert breaker.state == 'closed'
+        assert breaker.retry_after() == 0
+
+    def test_failed_probe_reopens(self, breaker, clock):
+        for _ in range(4):
+            call(breaker, False)
+        clock.now += 30
+
+        call(breaker, False)
+
+        assert breaker.state == 'open'
+        assert breaker.retry_after() == 30
+        assert breaker.stats()['opened'] == 2
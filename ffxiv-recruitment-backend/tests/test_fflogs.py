@@ -0,0 +1,148 @@
+"""
+Tests for the FFLogs GraphQL client
+"""
+
+import pytest
+from app.services.fflogs_service import FFLogsError, FFLogsRateLimited, FFLogsService
+
+# encounterRankings for two characters on two encounters
+RANKINGS = {
+    101: {
+        93: {'totalKills': 4, 'fastestKill': 512000, 'ranks': [
+            {'rankPercent': 71.25, 'spec': 'Paladin'},
+            {'rankPercent': 88.04, 'spec': 'Warrior'}
+        ]},
+        94: {'totalKills': 0, 'ranks': []}
+    },
+    102: {
+        93: {'totalKills': 1, 'fastestKill': 600000, 'ranks': [{'rankPercent': 40, 'spec': 'Sage'}]}
+    }
+}
+
+
+class TestFFLogsService:
+    """Test the client against the local stub"""
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        with app.app_context():
+            yield
+
+    def test_batched_lookup(self, fflogs_stub):
+        fflogs_stub.characters = RANKINGS
+
+        results = FFLogsService.get_encounter_rankings([101, '102', 999], [93, 94])
+
+        assert len(fflogs_stub.queries) == 1
+        assert results[101][93] == {'kills': 4, 'best_percent': 88.0, 'best_spec': 'Warrior', 'fastest_kill': 512000}
+        assert results[101][94] is None
+        assert results[102][93]['kills'] == 1
+        assert results[999] is None
+
+    def test_batches_split_by_size(self, fflogs_stub):
+        FFLogsService.BATCH_SIZE = 2
+        fflogs_stub.characters = RANKINGS
+
+        results = FFLogsService.get_encounter_rankings([101, 102, 103], [93])
+
+        assert len(fflogs_stub.queries) == 2
+        assert 'c1: character(id: 102)' in fflogs_stub.queries[0]
+        assert 'c0: character(id: 103)' in fflogs_stub.queries[1]
+        assert results[103] is None
+
+    def test_results_cached(self, app, fflogs_stub):
+        fflogs_stub.characters = RANKINGS
+        FFLogsService.get_encounter_rankings([101, 999], [93])
+
+        # 94 is the only pair left to fetch
+        results = FFLogsService.get_encounter_rankings([101, 999], [93, 94])
+
+        assert len(fflogs_stub.queries) == 2
+        assert 'c0: character(id: 101) { e94: encounterRankings(encounterID: 94) }' in fflogs_stub.queries[1]
+        assert 'character(id: 999)' not in fflogs_stub.queries[1]
+        assert results == {101: {93: results[101][93], 94: None}, 999: None}
+        assert app.db.fflogs_cache.count_documents({}) == 3
+        assert FFLogsService.stats()['counts']['cache_hits'] == 2
+
+        FFLogsService.get_encounter_rankings([101], [93], force=True)
+        assert len(fflogs_stub.queries) == 3
+
+    def test_token_reused_until_expiry(self, fflogs_stub):
+        FFLogsService.get_encounter_rankings([1], [93])
+        FFLogsService.get_encounter_rankings([2], [93])
+        assert fflogs_stub.tokens == ['token1']
+
+        fflogs_stub.expires_in = 0  # already inside the renewal margin
+        FFLogsService.reset()
+        FFLogsService.get_encounter_rankings([3], [93])
+        FFLogsService.get_encounter_rankings([4], [93])
+        assert fflogs_stub.tokens == ['token1', 'token2', 'token3']
+
+    def test_revoked_token_renewed(self, fflogs_stub):
+        FFLogsService.get_encounter_rankings([1], [93])
+        fflogs_stub.tokens.append('rotated')
+
+        FFLogsService.get_encounter_rankings([2], [93])
+
+        assert fflogs_stub.tokens[-1] == 'token3'
+        assert len(fflogs_stub.queries) == 2
+
+    def test_bad_credentials(self, fflogs_stub):
+        FFLogsService.CLIENT_SECRET = 'wrong'
+
+        with pytest.raises(FFLogsError) as error:
+            FFLogsService.get_encounter_rankings([1], [93])
+
+        assert error.value.retryable is False
+
+    def test_points_budget(self, fflogs_stub):
+        fflogs_stub.points_spent = 3600 - 100 - 2
+        FFLogsService.get_encounter_rankings([1], [93])
+        FFLogsService.get_encounter_rankings([2], [93])
+
+        with pytest.raises(FFLogsRateLimited) as error:
+            FFLogsService.get_encounter_rankings([3], [93])
+
+        assert len(fflogs_stub.queries) == 2
+        assert 1790 < error.value.retry_after <= 1800
+        assert FFLogsService.budget() == {'limit_per_hour': 3600, 'points_spent': 3500, 'reset_in': 1800}
+
+    def test_429_stops_queries(self, fflogs_stub):
+        fflogs_stub.queue(429, {'error': 'Too Many Requests'}, {'Retry-After': '120'})
+
+        with pytest.raises(FFLogsRateLimited):
+            FFLogsService.get_encounter_rankings([1], [93])
+        with pytest.raises(FFLogsRateLimited) as error:
+            FFLogsService.get_encounter_rankings([1], [93])
+
+        assert len(fflogs_stub.queries) == 1
+        assert 110 < error.value.retry_after <= 120
+
+    def test_graphql_errors(self, fflogs_stub):
+        fflogs_stub.queue(200, {'errors': [{'message': 'Unknown argument'}]})
+
+        with pytest.raises(FFLogsError, match='Unknown argument') as error:
+            FFLogsService.get_encounter_rankings([1], [93])
+
+        assert error.value.retryable is False
+
+    def test_partial_errors_not_cached(self, app, fflogs_stub):
+        fflogs_stub.characters = RANKINGS
+        fflogs_stub.errors = {(101, 94), (102, None)}
+
+        results = FFLogsService.get_encounter_rankings([101, 102], [93, 94])
+
+        assert results == {101: {93: results[101][93]}, 102: {}}
+        assert [entry['_id'] for entry in app.db.fflogs_cache.find()] == ['101:93']
+
+        fflogs_stub.errors = set()
+        results = FFLogsService.get_encounter_rankings([101, 102], [93, 94])
+
+        assert results[101][94] is None
+        assert results[102][93]['kills'] == 1
+
+    def test_errors_outside_characters_fail_the_batch(self, app, fflogs_stub):
+        fflogs_stub.queue(200, {'data': {'characterData': {'c0': None}}, 'errors': [{'message': 'Timeout'}]})
+
+        assert FFLogsService.get_encounter_rankings([101], [93]) == {101: {}}
+        assert app.db.fflogs_cache.count_documents({}) == 0
@@ -0,0 +1,203 @@
+"""
+Tests for the background job queue
+"""
+
+from datetime import datetime, timedelta
+from bson import ObjectId
+from app.services.job_queue import JobQueue, job_handler, PermanentJobError
+
+
+calls = []
+
+
+@job_handler('test.flaky')
+def flaky_handler(payload, job):
+    calls.append(job['attempts'])
+    if job['attempts'] < payload.get('succeed_on', 1):
+        raise RuntimeError('temporary failure')
+    return {'attempts': job['attempts']}
+
+
+@job_handler('test.permanent')
+def permanent_handler(payload, job):
+    raise PermanentJobError('cannot be done')
+
+
+class TestJobQueue:
+    """Test claiming, running and retrying jobs"""
+    
+    def setup_method(self):
+        calls.clear()
+    
+    def test_run_job_success(self, app):
+        with app.app_context():
+            job = JobQueue.enqueue('test.flaky', {'succeed_on': 1})
+            assert JobQueue.run_pending() == 1
+            
+            job = JobQueue.get(job['_id'])
+            assert job['status'] == 'succeeded'
+            assert job['result'] == {'attempts': 1}
+            assert 'expires_at' in job
+    
+    def test_failed_job_is_retried_with_backoff(self, app):
+        with app.app_context():
+            job = JobQueue.enqueue('test.flaky', {'succeed_on': 2})
+            JobQueue.run_pending()
+            
+            job = JobQueue.get(job['_id'])
+            assert job['status'] == 'queued'
+            assert job['error'] == 'temporary failure'
+            assert job['run_at'] > datetime.utcnow()
+            
+            # Not due yet, so nothing runs
+            assert JobQueue.run_pending() == 0
+            
+            app.db.jobs.update_one({'_id': job['_id']}, {'$set': {'run_at': datetime.utcnow()}})
+            JobQueue.run_pending()
+            assert JobQueue.get(job['_id'])['status'] == 'succeeded'
+            assert calls == [1, 2]
+    
+    def test_job_fails_after_max_attempts(self, app):
+        with app.app_context():
+            job = JobQueue.enqueue('test.flaky', {'succeed_on': 5}, max_attempts=1)
+            JobQueue.run_pending()
+            
+            job = JobQueue.get(job['_id'])
+            assert job['status'] == 'failed'
+            assert job['attempts'] == 1
+    
+    def test_permanent_error_is_not_retried(self, app):
+        with app.app_context():
+            job = JobQueue.enqueue('test.permanent')
+            JobQueue.run_pending()
+            
+            job = JobQueue.get(job['_id'])
+            assert job['status'] == 'failed'
+            assert job['error'] == 'cannot be done'
+    
+    def test_expired_lease_is_reclaimed(self, app):
+        with app.app_context():
+            job = JobQueue.enqueue('test.flaky')
+            claimed = JobQueue.claim('dead-worker')
+            assert claimed['_id'] == job['_id']
+            assert JobQueue.claim('other-worker') is None
+            
+            app.db.jobs.update_one(
+                {'_id': job['_id']},
+                {'$set': {'lease_expires_at': datetime.utcnow() - timedelta(seconds=1)}}
+            )
+            reclaimed = JobQueue.claim('other-worker')
+            assert reclaimed['_id'] == job['_id']
+            assert reclaimed['attempts'] == 2
+            
+            # The dead worker can no longer report back
+            JobQueue.run_job(claimed, 'dead-worker')
+            assert JobQueue.get(job['_id'])['status'] == 'running'
+
+
+class TestJobRoutes:
+    """Test job status polling and job-backed endpoints"""
+    
+    def test_get_job_status(self, client, auth_headers, app, sample_user):
+        with app.app_context():
+            job = JobQueue.enqueue('test.flaky', user_id=sample_user['_id'])
+        
+        response = client.get(f"/api/jobs/{job['_id']}", headers=auth_headers)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['status'] == 'queued'
+        assert data['type'] == 'test.flaky'
+    
+    def test_get_other_users_job(self, client, auth_headers, app):
+        with app.app_context():
+            job = JobQueue.enqueue('test.flaky', user_id=ObjectId())
+        
+        response = client.get(f"/api/jobs/{job['_id']}", headers=auth_headers)
+        assert response.status_code == 404
+    
+    def test_delete_listing_cascades_applications(self, client, auth_headers, app, sample_user):
+        listing_id = ObjectId()
+        app.db.listings.insert_one({
+            '_id': listing_id,
+            'title': 'Cascade',
+            'description': 'Test',
+            'owner_id': sample_user['_id'],
+            'content_type': 'savage',
+            'data_center': 'Primal',
+            'state': 'recruiting',
+            'application_count': 2
+        })
+        app.db.applications.insert_many([
+            {'listing_id': listing_id, 'applicant_id': ObjectId(), 'status': 'pending'}
+            for _ in range(2)
+        ])
+        
+        response = client.delete(f'/api/listings/{listing_id}', headers=auth_headers)
+        assert response.status_code == 200
+        job_id = response.get_json()['job_id']
+        
+        with app.app_context():
+            JobQueue.run_pending()
+        
+        assert app.db.applications.count_documents({'listing_id': listing_id}) == 0
+        data = client.get(f'/api/jobs/{job_id}', headers=auth_headers).get_json()
+        assert data['result'] == {'applications_deleted': 2}
+    
+    def test_repair_application_count(self, client, auth_headers, app, sample_user):
+        listing_id = ObjectId()
+        app.db.listings.insert_one({
+            '_id': listing_id,
+            'title': 'Drifted',
+            'description': 'Test',
+            'owner_id': sample_user['_id'],
+            'content_type': 'savage',
+            'data_center': 'Primal',
+            'state': 'recruiting',
+            'application_count': 7
+        })
+        app.db.applications.insert_one({'listing_id': listing_id, 'applicant_id': ObjectId()})
+        
+        response = client.post(f'/api/listings/{listing_id}/repair-count', headers=auth_headers)
+        assert response.status_code == 202
+        assert response.get_json()['status_url'].startswith('/api/jobs/')
+        
+        with app.app_context():
+            JobQueue.run_pending()
+        
+        assert app.db.listings.find_one({'_id': listing_id})['application_count'] == 1
+    
+    def test_delete_listing_runs_cascade_inline(self, client, auth_headers, app, sample_user, monkeypatch):
+        """Test that without a worker the cascade runs in the delete request"""
+        monkeypatch.setattr(JobQueue, 'RUN_INLINE', True)
+        listing_id = ObjectId()
+        app.db.listings.insert_one({
+            '_id': listing_id,
+            'title': 'Inline',
+            'description': 'Test',
+            'owner_id': sample_user['_id'],
+            'content_type': 'savage',
+            'data_center': 'Primal',
+            'state': 'recruiting'
+        })
+        app.db.applications.insert_one({'listing_id': listing_id, 'applicant_id': ObjectId()})
+        
+        response = client.delete(f'/api/listings/{listing_id}', headers=auth_headers)
+        
+        assert response.status_code == 200
+        assert app.db.applications.count_documents({'listing_id': listing_id}) == 0
+        data = client.get(f"/api/jobs/{response.get_json()['job_id']}", headers=auth_headers).get_json()
+        assert data['status'] == 'succeeded'
+    
+    def test_run_endpoint(self, client, app):
+        """Test the cron endpoint runs due jobs and requires CRON_SECRET"""
+        with app.app_context():
+            JobQueue.enqueue('test.flaky')
+            JobQueue.enqueue('test.flaky', run_at=datetime.utcnow() + timedelta(hours=1))
+        
+        assert client.get('/api/jobs/run').status_code == 401
+        
+        response = client.get('/api/jobs/run', headers={'Authorization': 'Bearer test-cron-secret'})
+        
+        assert response.status_code == 200
+        assert response.get_json() == {'jobs_run': 1}
+        assert app.db.jobs.count_documents({'status': 'queued'}) == 1
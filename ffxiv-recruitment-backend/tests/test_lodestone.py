@@ -0,0 +1,442 @@
+"""
+Tests for the Lodestone client, against a local stub server
+"""
+
+import threading
+import time
+import pytest
+from datetime import datetime, timedelta
+from pathlib import Path
+from bs4 import BeautifulSoup
+from bson import ObjectId
+from app.services.job_queue import JobQueue
+from app.services.lodestone_refresh import refresh_all_characters
+from app.services.lodestone_service import LodestoneService
+from app.utils.circuit_breaker import CircuitOpenError
+from app.utils.html_parser import available_backends, resolve_backend
+
+# TestingConfig.METRICS_TOKEN
+METRICS_HEADERS = {'Authorization': 'Bearer test-metrics-token'}
+
+FIXTURE_DIR = Path(__file__).parent / 'fixtures' / 'lodestone'
+FIXTURES = sorted(FIXTURE_DIR.glob('*.html'))
+
+
+class TestLodestoneHttp:
+    """Test pooling, retries and timeouts"""
+
+    def test_parses_character_page(self, lodestone_stub):
+        data = LodestoneService.fetch_character_data('123')
+
+        assert data['success'] is True
+        assert data['character_name'] == 'Alphinaud Leveilleur'
+        assert (data['server'], data['data_center']) == ('Excalibur', 'Primal')
+        assert (data['race'], data['sub_race'], data['gender']) == ('Elezen', 'Wildwood', 'Male')
+        assert lodestone_stub.paths == ['/lodestone/character/123/']
+
+    def test_connections_are_reused(self, lodestone_stub):
+        for character_id in ('1', '2', '3'):
+            assert LodestoneService.fetch_character_data(character_id)['success']
+
+        stats = LodestoneService.http.stats()
+        assert len(lodestone_stub.client_ports) == 1
+        assert stats['pool']['connections_opened'] == 1
+        assert stats['requests'] == 3
+        assert stats['latency_ms']['p50'] is not None
+
+    def test_transient_errors_are_retried(self, lodestone_stub):
+        lodestone_stub.queue(503)
+        lodestone_stub.queue(502)
+
+        data = LodestoneService.fetch_character_data('123')
+
+        assert data['success'] is True
+        assert len(lodestone_stub.paths) == 3
+        assert LodestoneService.http.stats()['retries'] == 2
+
+    def test_gives_up_after_retries(self, lodestone_stub):
+        for _ in range(3):
+            lodestone_stub.queue(500)
+
+        data = LodestoneService.fetch_character_data('123')
+
+        assert data['success'] is False
+        assert '500' in data['error']
+        assert len(lodestone_stub.paths) == 3
+
+    def test_not_found_is_not_retried(self, lodestone_stub):
+        lodestone_stub.queue(404)
+
+        assert LodestoneService.fetch_character_data('999')['success'] is False
+        assert len(lodestone_stub.paths) == 1
+
+    def test_read_timeout(self, lodestone_stub):
+        lodestone_stub.delay = 1
+
+        data = LodestoneService.fetch_character_data('123')
+
+        assert data['success'] is False
+        assert LodestoneService.http.stats()['failures'] == 1
+
+
+class TestLodestoneParsing:
+    """Test the targeted parse against a full html.parser tree"""
+
+    @pytest.mark.parametrize('backend', available_backends())
+    @pytest.mark.parametrize('fixture', FIXTURES, ids=lambda path: path.stem)
+    def test_matches_full_tree(self, fixture, backend):
+        content = fixture.read_bytes()
+
+        expected = LodestoneService.extract_character(BeautifulSoup(content, 'html.parser'), '1')
+
+        assert expected['success'], expected.get('error')
+        assert LodestoneService.parse_character_page(content, '1', backend=backend) == expected
+
+    def test_missing_companies(self):
+        content = (FIXTURE_DIR / 'character_no_free_company.html').read_bytes()
+
+        data = LodestoneService.parse_character_page(content, '1')
+
+        assert (data['free_company'], data['grand_company']) == (None, 'Immortal Flames')
+        assert (data['race'], data['sub_race'], data['gender']) == ('Elezen', 'Duskwight', 'Male')
+
+    def test_only_needed_sections_are_built(self):
+        content = (FIXTURE_DIR / 'character_full.html').read_bytes()
+
+        soup = BeautifulSoup(content, 'html.parser', parse_only=LodestoneService.character_strainer)
+
+        assert soup.find('ul', class_='character__mounts__list') is None
+        assert soup.find('div', class_='js__character_toggle') is not None
+        assert len(soup.find_all(True)) < len(BeautifulSoup(content, 'html.parser').find_all(True)) / 10
+
+    def test_full_job_list(self):
+        content = (FIXTURE_DIR / 'character_full.html').read_bytes()
+
+        data = LodestoneService.parse_character_page(content, '1')
+
+        assert data['character_name'] == 'Thancred Waters'
+        assert len(data['job_levels']) == 33
+        assert data['job_levels'][1] == {'j': 'WAR', 'l': 100}
+        assert data['job_levels'][-1] == {'j': 'FSH', 'l': 100}
+
+    def test_locked_jobs_are_left_out(self):
+        content = (FIXTURE_DIR / 'character_partial_jobs.html').read_bytes()
+
+        data = LodestoneService.parse_character_page(content, '1')
+
+        assert [level['j'] for level in data['job_levels']] == ['PLD', 'WHM', 'SCH', 'AST', 'NIN', 'BLM', 'SMN', 'RDM']
+        assert data['job_levels'][0] == {'j': 'PLD', 'l': 30}
+
+    def test_legacy_cached_jobs_are_flattened(self):
+        legacy = {'jobs': {'tanks': {'PLD': '100', 'WAR': '-'}, 'healers': {'WHM': '90'}}}
+
+        assert LodestoneService.job_levels(legacy) == [{'j': 'PLD', 'l': 100}, {'j': 'WHM', 'l': 90}]
+
+    def test_unknown_backend(self):
+        assert resolve_backend() == available_backends()[0]
+        with pytest.raises(ValueError):
+            resolve_backend('html5lib')
+
+
+class TestLodestoneCache:
+    """Test the front cache, lodestone_cache collection and revalidation"""
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        with app.app_context():
+            yield
+
+    def _expire(self, app, character_id):
+        stale = datetime.utcnow() - timedelta(seconds=LodestoneService.CACHE_FRESH_SECONDS + 1)
+        app.db.lodestone_cache.update_one({'_id': character_id}, {'$set': {'fetched_at': stale}})
+        LodestoneService.front_cache.clear()
+
+    def test_repeat_lookups_hit_cache(self, app, lodestone_stub):
+        first = LodestoneService.get_character('123')
+        second = LodestoneService.get_character('123')
+        LodestoneService.front_cache.clear()  # as seen from another worker
+        third = LodestoneService.get_character('123')
+
+        assert (first['cached'], second['cached'], third['cached']) == (False, True, True)
+        assert second['character_name'] == first['character_name']
+        assert len(lodestone_stub.paths) == 1
+        counts = LodestoneService.stats()['cache']
+        assert (counts['front_hits'], counts['cache_hits'], counts['fetches']) == (1, 1, 1)
+        assert app.db.lodestone_cache.find_one({'_id': '123'})['expires_at'] > datetime.utcnow()
+
+    def test_stale_entry_revalidated_with_etag(self, app, lodestone_stub):
+        lodestone_stub.etag = '"v1"'
+        LodestoneService.get_character('123')
+        self._expire(app, '123')
+
+        data = LodestoneService.get_character('123')
+
+        assert data['cached'] is True
+        assert lodestone_stub.request_headers[-1]['If-None-Match'] == '"v1"'
+        assert LodestoneService.stats()['cache']['revalidated'] == 1
+        assert app.db.lodestone_cache.find_one({'_id': '123'})['fetched_at'] > datetime.utcnow() - timedelta(seconds=5)
+
+    def test_changed_page_is_downloaded(self, app, lodestone_stub):
+        lodestone_stub.etag = '"v1"'
+        LodestoneService.get_character('123')
+        self._expire(app, '123')
+        lodestone_stub.etag = '"v2"'
+
+        assert LodestoneService.get_character('123')['cached'] is False
+        assert app.db.lodestone_cache.find_one({'_id': '123'})['etag'] == '"v2"'
+
+    def test_force_bypasses_cache(self, lodestone_stub):
+        LodestoneService.get_character('123')
+
+        assert LodestoneService.get_character('123', force=True)['cached'] is False
+        assert len(lodestone_stub.paths) == 2
+        assert 'If-None-Match' not in lodestone_stub.request_headers[-1]
+
+    def test_failures_are_not_cached(self, app, lodestone_stub):
+        lodestone_stub.queue(404)
+
+        assert LodestoneService.get_character('123')['success'] is False
+        assert app.db.lodestone_cache.count_documents({}) == 0
+        assert LodestoneService.get_character('123')['success'] is True
+
+
+class TestLodestoneSingleFlight:
+    """Test that concurrent fetches of one character are shared"""
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        with app.app_context():
+            yield
+
+    def test_threads_share_one_fetch(self, app, lodestone_stub):
+        lodestone_stub.delay = 0.2
+        results = []
+
+        def link():
+            with app.app_context():
+                results.append(LodestoneService.get_character('123'))
+
+        threads = [threading.Thread(target=link) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(lodestone_stub.paths) == 1
+        assert [data['character_name'] for data in results] == ['Alphinaud Leveilleur'] * 5
+        assert LodestoneService.stats()['cache']['coalesced'] == 4
+        results[0]['job_levels'].clear()  # callers get their own copies
+        assert results[1]['job_levels']
+
+    def test_waits_for_other_worker(self, app, lodestone_stub):
+        app.db.locks.insert_one({
+            '_id': 'lodestone:123', 'owner': 'other', 'expires_at': datetime.utcnow() + timedelta(seconds=5)
+        })
+        data = LodestoneService.parse_character_page((FIXTURE_DIR / 'character.html').read_bytes(), '123')
+
+        def other_worker_finishes():
+            time.sleep(0.2)
+            now = datetime.utcnow()
+            app.db.lodestone_cache.insert_one({'_id': '123', 'data': data, 'fetched_at': now, 'expires_at': now})
+            app.db.locks.delete_one({'_id': 'lodestone:123'})
+
+        threading.Thread(target=other_worker_finishes).start()
+
+        result = LodestoneService.get_character('123', force=True)
+
+        assert result['cached'] is True
+        assert result['character_name'] == 'Alphinaud Leveilleur'
+        assert lodestone_stub.paths == []
+        assert LodestoneService.stats()['cache']['lock_waits'] == 1
+
+    def test_expired_lock_is_taken_over(self, app, lodestone_stub):
+        app.db.locks.insert_one({
+            '_id': 'lodestone:123', 'owner': 'crashed', 'expires_at': datetime.utcnow() - timedelta(seconds=1)
+        })
+
+        assert LodestoneService.get_character('123')['cached'] is False
+        assert len(lodestone_stub.paths) == 1
+        assert app.db.locks.count_documents({}) == 0
+
+
+class TestLodestoneCircuitBreaker:
+    """Test fast failure and stale copies while the Lodestone is down"""
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        with app.app_context():
+            yield
+
+    def _trip(self):
+        for _ in range(LodestoneService.breaker.min_calls):
+            LodestoneService.breaker.record(False)
+
+    def test_opens_after_failures_and_fails_fast(self, lodestone_stub):
+        LodestoneService.breaker.min_calls = 2
+        try:
+            for _ in range(6):
+                lodestone_stub.queue(503)
+            LodestoneService.fetch_character_data('1')
+            LodestoneService.fetch_character_data('2')
+            requests_sent = len(lodestone_stub.paths)
+
+            data = LodestoneService.fetch_character_data('3')
+        finally:
+            LodestoneService.breaker.min_calls = 5
+
+        assert data['success'] is False
+        assert data['retryable'] is True
+        assert 0 < data['retry_after'] <= LodestoneService.breaker.open_seconds
+        assert len(lodestone_stub.paths) == requests_sent
+        assert LodestoneService.stats()['breaker']['state'] == 'open'
+
+    def test_stale_copy_served_while_open(self, app, lodestone_stub):
+        LodestoneService.get_character('123')
+        stale = datetime.utcnow() - timedelta(days=1)
+        app.db.lodestone_cache.update_one({'_id': '123'}, {'$set': {'fetched_at': stale}})
+        LodestoneService.front_cache.clear()
+        self._trip()
+
+        data = LodestoneService.get_character('123', force=True)
+
+        assert (data['success'], data['cached'], data['stale']) == (True, True, True)
+        assert data['retry_after'] > 0
+        assert len(lodestone_stub.paths) == 1
+        assert LodestoneService.stats()['cache']['stale_served'] == 1
+
+    def test_half_open_probe_closes(self, lodestone_stub):
+        self._trip()
+        LodestoneService.breaker._opened_at -= LodestoneService.breaker.open_seconds
+
+        assert LodestoneService.fetch_character_data('123')['success'] is True
+        assert LodestoneService.breaker.state == 'closed'
+
+    def test_routes_answer_immediately(self, client, app, sample_user, auth_headers, lodestone_stub):
+        self._trip()
+
+        response = client.post('/api/users/lodestone/link', headers=auth_headers, json={'lodestone_id': '123'})
+
+        assert response.status_code == 503
+        assert int(response.headers['Retry-After']) > 0
+        assert app.db.jobs.count_documents({}) == 0
+
+        now = datetime.utcnow() - timedelta(days=1)
+        data = LodestoneService.parse_character_page((FIXTURE_DIR / 'character.html').read_bytes(), '123')
+        app.db.lodestone_cache.insert_one({'_id': '123', 'data': data, 'fetched_at': now, 'expires_at': now})
+
+        response = client.post('/api/users/lodestone/link', headers=auth_headers, json={'lodestone_id': '123'})
+
+        assert response.status_code == 200
+        assert response.get_json()['character_data']['stale'] is True
+        assert lodestone_stub.paths == []
+
+    def test_bulk_refresh_stops(self, app, lodestone_stub):
+        app.db.users.insert_one({'_id': ObjectId(), 'username': 'linked', 'lodestone_id': '123'})
+        self._trip()
+
+        with pytest.raises(CircuitOpenError):
+            refresh_all_characters(app.db, rate=0, processes=0)
+
+        assert app.db.checkpoints.count_documents({}) == 0
+        assert 'character_name' not in app.db.users.find_one({'username': 'linked'})
+
+
+class TestLodestoneRoutes:
+    """Test linking and verifying through the stub and the job queue"""
+
+    def _run_jobs(self, app):
+        with app.app_context():
+            JobQueue.run_pending()
+
+    def test_link_is_queued(self, client, app, sample_user, auth_headers, lodestone_stub):
+        response = client.post('/api/users/lodestone/link', headers=auth_headers, json={'lodestone_id': '123'})
+
+        assert response.status_code == 202
+        assert lodestone_stub.paths == []
+        status_url = response.get_json()['status_url']
+        assert client.get(status_url, headers=auth_headers).get_json()['status'] == 'queued'
+
+        self._run_jobs(app)
+
+        job = client.get(status_url, headers=auth_headers).get_json()
+        assert job['status'] == 'succeeded'
+        assert job['result']['character_name'] == 'Alphinaud Leveilleur'
+        user = app.db.users.find_one({'_id': sample_user['_id']})
+        assert (user['lodestone_id'], user['server_key']) == ('123', 'excalibur')
+        assert user['job_levels'][:2] == [{'j': 'PLD', 'l': 100}, {'j': 'WAR', 'l': 100}]
+
+    def test_link_runs_inline_without_worker(self, client, app, sample_user, auth_headers, lodestone_stub, monkeypatch):
+        monkeypatch.setattr(JobQueue, 'RUN_INLINE', True)
+
+        response = client.post('/api/users/lodestone/link', headers=auth_headers, json={'lodestone_id': '123'})
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['user']['character_name'] == 'Alphinaud Leveilleur'
+        assert data['character_data']['success'] is True
+        assert app.db.jobs.find_one()['status'] == 'succeeded'
+
+    def test_failed_inline_link_answers_400(self, client, app, sample_user, auth_headers, lodestone_stub, monkeypatch):
+        monkeypatch.setattr(JobQueue, 'RUN_INLINE', True)
+        lodestone_stub.queue(404)
+
+        response = client.post('/api/users/lodestone/link', headers=auth_headers, json={'lodestone_id': '999'})
+
+        assert response.status_code == 400
+        assert '404' in response.get_json()['error']
+        assert app.db.jobs.find_one()['status'] == 'failed'
+        assert 'lodestone_id' not in app.db.users.find_one({'_id': sample_user['_id']})
+
+    def test_cached_character_is_applied_immediately(self, client, app, sample_user, auth_headers, lodestone_stub):
+        client.post('/api/users/lodestone/link', headers=auth_headers, json={'lodestone_id': '123'})
+        self._run_jobs(app)
+
+        cached = client.post('/api/users/lodestone/verify', headers=auth_headers)
+        forced = client.post('/api/users/lodestone/verify?force=true', headers=auth_headers)
+
+        assert cached.status_code == 200
+        assert cached.get_json()['character_data']['cached'] is True
+        assert cached.get_json()['user']['character_name'] == 'Alphinaud Leveilleur'
+        assert forced.status_code == 202
+        self._run_jobs(app)
+        assert len(lodestone_stub.paths) == 2
+
+    def test_missing_character_fails_job(self, client, app, sample_user, auth_headers, lodestone_stub):
+        lodestone_stub.queue(404)
+
+        job_id = client.post('/api/users/lodestone/link', headers=auth_headers, json={'lodestone_id': '999'}).get_json()['job_id']
+        self._run_jobs(app)
+
+        job = client.get(f'/api/jobs/{job_id}', headers=auth_headers).get_json()
+        assert job['status'] == 'failed'
+        assert '404' in job['error']
+        assert 'lodestone_id' not in app.db.users.find_one({'_id': sample_user['_id']})
+
+    def test_outage_is_retried(self, client, app, sample_user, auth_headers, lodestone_stub):
+        for _ in range(3):
+            lodestone_stub.queue(503)
+
+        job_id = client.post('/api/users/lodestone/link', headers=auth_headers, json={'lodestone_id': '123'}).get_json()['job_id']
+        self._run_jobs(app)
+
+        assert app.db.jobs.find_one({'_id': ObjectId(job_id)})['status'] == 'queued'
+
+    def test_refresh_after_unlink_is_dropped(self, client, app, sample_user, auth_headers, lodestone_stub):
+        app.db.users.update_one({'_id': sample_user['_id']}, {'$set': {'lodestone_id': '123'}})
+        client.post('/api/users/lodestone/verify', headers=auth_headers)
+        client.post('/api/users/lodestone/unlink', headers=auth_headers)
+
+        self._run_jobs(app)
+
+        user = app.db.users.find_one({'_id': sample_user['_id']})
+        assert 'lodestone_id' not in user
+        assert user.get('character_name') != 'Alphinaud Leveilleur'
+
+    def test_metrics(self, client, app, lodestone_stub):
+        with app.app_context():
+            LodestoneService.get_character('123')
+            LodestoneService.get_character('123')
+
+        metrics = client.get('/metrics', headers=METRICS_HEADERS).get_json()['lodestone']
+        assert metrics['http']['requests'] == 1
+        assert metrics['cache']['front_hits'] == 1
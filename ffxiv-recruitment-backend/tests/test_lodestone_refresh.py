@@ -0,0 +1,135 @@
+"""
+Tests for the bulk Lodestone refresher
+"""
+
+import pytest
+from datetime import datetime
+from bson import ObjectId
+from app.services.job_queue import JobQueue
+from app.services.lodestone_refresh import CHECKPOINT_ID, refresh_all_characters, schedule_refresh_all
+from app.utils.rate_limit import RateLimiter
+
+
+class Interrupted(Exception):
+    pass
+
+
+class TestRateLimiter:
+    """Test call spacing"""
+
+    def test_calls_are_spaced(self):
+        now = [0.0]
+        slept = []
+
+        def sleep(seconds):
+            slept.append(seconds)
+
+        limiter = RateLimiter(rate=4, clock=lambda: now[0], sleep=sleep)
+
+        assert [limiter.wait() for _ in range(3)] == [0.0, 0.25, 0.5]
+        assert slept == [0.25, 0.5]
+
+    def test_disabled(self):
+        assert RateLimiter(None).wait() == 0.0
+
+
+class TestBulkRefresh:
+    """Test refreshing every linked character through the stub"""
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        with app.app_context():
+            yield
+
+    def _link(self, app, count, **fields):
+        users = [
+            dict({'_id': ObjectId(), 'username': f'player{i}', 'lodestone_id': str(1000 + i)}, **fields)
+            for i in range(count)
+        ]
+        app.db.users.insert_many(users)
+        return users
+
+    def test_refreshes_linked_users(self, app, lodestone_stub):
+        self._link(app, 5)
+        app.db.users.insert_one({'_id': ObjectId(), 'username': 'unlinked'})
+
+        totals = refresh_all_characters(app.db, batch_size=2, concurrency=3, rate=0, processes=0)
+
+        assert (totals['users'], totals['updated'], totals['failed']) == (5, 5, 0)
+        assert len(lodestone_stub.paths) == 5
+        refreshed = app.db.users.find_one({'username': 'player0'})
+        assert (refreshed['character_name'], refreshed['server_key']) == ('Alphinaud Leveilleur', 'excalibur')
+        assert 'character_name' not in app.db.users.find_one({'username': 'unlinked'})
+        assert app.db.lodestone_cache.count_documents({}) == 5
+
+    def test_unchanged_pages_are_revalidated(self, app, lodestone_stub):
+        lodestone_stub.etag = '"v1"'
+        self._link(app, 3)
+        refresh_all_characters(app.db, rate=0, processes=0)
+
+        totals = refresh_all_characters(app.db, rate=0, processes=0)
+
+        assert (totals['not_modified'], totals['fetched'], totals['updated'], totals['unchanged']) == (3, 0, 0, 3)
+        assert all(headers['If-None-Match'] == '"v1"' for headers in lodestone_stub.request_headers[3:])
+
+    def test_unchanged_profiles_are_not_written(self, app, lodestone_stub, monkeypatch):
+        self._link(app, 2)
+        refresh_all_characters(app.db, rate=0, processes=0)
+        before = {user['_id']: user for user in app.db.users.find()}
+        app.db.users.update_one({'username': 'player1'}, {'$set': {'character_name': 'Renamed'}})
+        invalidated = []
+        monkeypatch.setattr('app.services.lodestone_refresh.invalidate_user_summary', invalidated.append)
+
+        totals = refresh_all_characters(app.db, rate=0, processes=0)
+
+        assert (totals['updated'], totals['unchanged']) == (1, 1)
+        after = {user['username']: user for user in app.db.users.find()}
+        assert after['player0']['updated_at'] == before[after['player0']['_id']]['updated_at']
+        assert after['player1']['character_name'] == 'Alphinaud Leveilleur'
+        assert invalidated == [after['player1']['_id']]
+
+    def test_resumes_after_interruption(self, app, lodestone_stub):
+        users = self._link(app, 4)
+
+        def interrupt(totals):
+            raise Interrupted()
+
+        with pytest.raises(Interrupted):
+            refresh_all_characters(app.db, batch_size=2, rate=0, processes=0, on_batch=interrupt)
+        assert app.db.checkpoints.find_one({'_id': CHECKPOINT_ID})['last_id'] == users[1]['_id']
+
+        totals = refresh_all_characters(app.db, batch_size=2, rate=0, processes=0)
+
+        assert totals['resumed_from'] == users[1]['_id']
+        assert totals['users'] == 4
+        assert sorted(lodestone_stub.paths) == sorted(f'/lodestone/character/{u["lodestone_id"]}/' for u in users)
+        assert app.db.checkpoints.find_one({'_id': CHECKPOINT_ID})['finished_at'] <= datetime.utcnow()
+
+        # A finished run is not resumed
+        assert refresh_all_characters(app.db, rate=0, processes=0)['resumed_from'] is None
+
+    def test_failures_are_counted(self, app, lodestone_stub):
+        self._link(app, 2)
+        lodestone_stub.queue(404)
+
+        totals = refresh_all_characters(app.db, concurrency=1, rate=0, processes=0)
+
+        assert (totals['updated'], totals['failed']) == (1, 1)
+
+    def test_process_pool(self, app, lodestone_stub):
+        self._link(app, 3)
+
+        totals = refresh_all_characters(app.db, rate=0, processes=1)
+
+        assert totals['updated'] == 3
+
+    def test_scheduled_job(self, app, lodestone_stub):
+        self._link(app, 2)
+        job = schedule_refresh_all()
+        assert schedule_refresh_all() is None
+
+        JobQueue.run_pending()
+
+        assert JobQueue.get(job['_id'])['result']['updated'] == 2
+        next_run = app.db.jobs.find_one({'type': 'lodestone.refresh_all', 'status': 'queued'})
+        assert next_run['run_at'] > datetime.utcnow()
@@ -0,0 +1,214 @@
+"""
+Tests for player search
+"""
+
+from bson import ObjectId
+from app.models.user import User
+from app.services.lodestone_sync import migrate_job_levels
+from app.services.search_fields import backfill_search_fields
+from app.utils.trigrams import similarity, trigrams
+
+
+def player(username, character_name=None, **fields):
+    doc = {'_id': ObjectId(), 'username': username, 'character_name': character_name}
+    doc.update(fields)
+    doc.update(User.search_fields(doc))
+    return doc
+
+
+class TestTrigrams:
+    """Test trigram extraction and scoring"""
+
+    def test_trigrams_are_padded_and_normalized(self):
+        assert trigrams('Ab') == {'  a', ' ab', 'ab '}
+        assert trigrams('Éa') == trigrams('ea')
+        assert trigrams(None) == set()
+
+    def test_partial_name_scores_above_unrelated(self):
+        query = trigrams('cloud')
+
+        exact = similarity(query, trigrams('Cloud'))
+        partial = similarity(query, trigrams('Cloud Strife'))
+        unrelated = similarity(query, trigrams('Tifa Lockhart'))
+
+        assert exact == 1.0
+        assert exact > partial > 0.5 > unrelated
+
+
+class TestPlayerNameSearch:
+    """Test name= on /api/search/players"""
+
+    def test_ranked_by_similarity(self, client, app):
+        app.db.users.insert_many([
+            player('strifey', 'Cloud Strife'),
+            player('cloud', 'Someone Else'),
+            player('tifa', 'Tifa Lockhart')
+        ])
+
+        data = client.get('/api/search/players?name=cloud').get_json()
+
+        assert [p['username'] for p in data['players']] == ['cloud', 'strifey']
+        assert data['total'] == 2
+        assert data['total_capped'] is False
+
+    def test_total_capped_by_candidates(self, client, app, monkeypatch):
+        monkeypatch.setitem(app.config, 'NAME_SEARCH_MAX_CANDIDATES', 2)
+        app.db.users.insert_many([player(f'cloud{i}') for i in range(3)] + [player('tifa')])
+
+        data = client.get('/api/search/players?name=cloud').get_json()
+
+        assert (data['total'], data['total_capped']) == (2, True)
+
+    def test_tolerates_typos(self, client, app):
+        app.db.users.insert_one(player('someone', "Y'shtola Rhul"))
+
+        data = client.get('/api/search/players?name=yshtola').get_json()
+
+        assert data['total'] == 1
+
+    def test_combines_with_filters_and_pagination(self, client, app):
+        app.db.users.insert_many(
+            [player(f'cloud{i}', data_center='Aether') for i in range(3)]
+            + [player('cloud', data_center='Primal')]
+        )
+
+        first = client.get('/api/search/players?name=cloud&data_center=Aether&per_page=2').get_json()
+        second = client.get('/api/search/players?name=cloud&data_center=Aether&per_page=2&page=2').get_json()
+
+        assert first['total'] == 3
+        assert len(first['players']) == 2
+        assert len(second['players']) == 1
+
+    def test_excludes_current_user(self, client, app, sample_user, auth_headers):
+        app.db.users.update_one({'_id': sample_user['_id']}, {'$set': User.search_fields(sample_user)})
+        app.db.users.insert_one(player('testuser2'))
+
+        data = client.get('/api/search/players?name=testuser', headers=auth_headers).get_json()
+
+        assert [p['username'] for p in data['players']] == ['testuser2']
+
+    def test_profile_update_maintains_trigrams(self, client, app, sample_user, auth_headers):
+        client.put('/api/users/profile', headers=auth_headers, json={'character_name': 'Alphinaud Leveilleur'})
+
+        data = client.get('/api/search/players?name=alphinaud').get_json()
+
+        assert [p['username'] for p in data['players']] == ['testuser']
+
+
+class TestPlayerFilters:
+    """Test normalized, multi-value server / data center / role filters"""
+
+    def test_server_filter_is_exact_and_case_insensitive(self, client, app):
+        app.db.users.insert_many([
+            player('a', server='Gilgamesh'),
+            player('b', server='Jenova'),
+            player('c', server='Siren')
+        ])
+
+        data = client.get('/api/search/players?server=gilgamesh').get_json()
+
+        assert [p['username'] for p in data['players']] == ['a']
+
+    def test_multi_value_filters(self, client, app):
+        app.db.users.insert_many([
+            player('a', server='Gilgamesh', roles=['Tank']),
+            player('b', server='Jenova', roles=['healer']),
+            player('c', server='Jenova', roles=['DPS']),
+            player('d', server='Siren', roles=['Healer'])
+        ])
+
+        data = client.get('/api/search/players?server=Gilgamesh,Jenova&role=Tank,Healer').get_json()
+
+        assert sorted(p['username'] for p in data['players']) == ['a', 'b']
+
+    def test_unknown_values_rejected(self, client):
+        assert client.get('/api/search/players?server=a').status_code == 400
+        assert client.get('/api/search/players?data_center=Chaos,Nowhere').status_code == 400
+        assert client.get('/api/search/players?role=Support').status_code == 400
+
+    def test_profile_update_validates_and_normalizes(self, client, app, sample_user, auth_headers):
+        response = client.put('/api/users/profile', headers=auth_headers, json={
+            'server': 'gilgamesh', 'data_center': 'aether', 'roles': ['Tank']
+        })
+        assert response.status_code == 200
+        assert response.get_json()['server'] == 'Gilgamesh'
+
+        stored = app.db.users.find_one({'_id': sample_user['_id']})
+        assert (stored['server_key'], stored['data_center_key'], stored['role_keys']) == ('gilgamesh', 'aether', ['tank'])
+
+        mismatched = client.put('/api/users/profile', headers=auth_headers, json={
+            'server': 'Excalibur', 'data_center': 'Aether'
+        })
+        assert mismatched.status_code == 400
+
+
+def levels(**job_levels):
+    return [{'j': job, 'l': level} for job, level in job_levels.items()]
+
+
+class TestJobLevelFilters:
+    """Test job= and min_level= on /api/search/players"""
+
+    def test_min_level_on_the_same_job(self, client, app):
+        app.db.users.insert_many([
+            player('capped', job_levels=levels(WAR=100, PLD=90)),
+            player('leveling', job_levels=levels(WAR=90, PLD=100)),
+            player('locked', job_levels=levels(WHM=100))
+        ])
+
+        data = client.get('/api/search/players?job=war&min_level=100&fields=username,job_levels').get_json()
+
+        assert [p['username'] for p in data['players']] == ['capped']
+        assert data['players'][0]['job_levels'] == [{'j': 'WAR', 'l': 100}, {'j': 'PLD', 'l': 90}]
+
+    def test_any_of_several_jobs(self, client, app):
+        app.db.users.insert_many([
+            player('a', job_levels=levels(WAR=100)),
+            player('b', job_levels=levels(PLD=95)),
+            player('c', job_levels=levels(DRK=100)),
+            player('d', job_levels=levels(GNB=80))
+        ])
+
+        data = client.get('/api/search/players?job=WAR,PLD,GNB&min_level=90').get_json()
+        unlocked = client.get('/api/search/players?job=GNB').get_json()
+
+        assert sorted(p['username'] for p in data['players']) == ['a', 'b']
+        assert [p['username'] for p in unlocked['players']] == ['d']
+
+    def test_invalid_values_rejected(self, client):
+        assert client.get('/api/search/players?job=XYZ').status_code == 400
+        assert client.get('/api/search/players?min_level=90').status_code == 400
+        assert client.get('/api/search/players?job=WAR&min_level=0').status_code == 400
+        assert client.get('/api/search/players?job=WAR&min_level=high').status_code == 400
+
+    def test_legacy_jobs_migrated(self, app):
+        app.db.users.insert_one({
+            '_id': ObjectId(), 'username': 'legacy',
+            'jobs': {'tanks': {'PLD': '100', 'WAR': '-'}, 'crafters': {'CUL': '90'}}
+        })
+
+        assert migrate_job_levels(app.db) == 1
+        assert migrate_job_levels(app.db) == 0
+        legacy = app.db.users.find_one({'username': 'legacy'})
+        assert legacy['job_levels'] == levels(PLD=100, CUL=90)
+        assert 'jobs' not in legacy
+
+
+class TestBackfill:
+    """Test the search field backfill"""
+
+    def test_backfill(self, app):
+        app.db.users.insert_many([
+            {'_id': ObjectId(), 'username': 'legacy', 'character_name': 'Old Timer', 'server': 'Siren'},
+            {'_id': ObjectId(), 'username': 'other'}
+        ])
+
+        app.db.listings.insert_one({'_id': ObjectId(), 'roles_needed': {'Healer': 2, 'tank': 0}})
+
+        assert backfill_search_fields(app.db, batch_size=1) == {'users': 2, 'listings': 1}
+        assert backfill_search_fields(app.db) == {'users': 0, 'listings': 0}
+        assert app.db.listings.find_one()['roles_needed_keys'] == ['healer']
+
+        legacy = app.db.users.find_one({'username': 'legacy'})
+        assert legacy['name_trigrams'] == User.search_fields(legacy)['name_trigrams']
+        assert legacy['server_key'] == 'siren'
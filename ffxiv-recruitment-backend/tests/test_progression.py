@@ -0,0 +1,169 @@
+"""
+Tests for FFLogs progression summaries
+"""
+
+import pytest
+from bson import ObjectId
+from app.routes.search import calculate_match_score, get_match_reasons
+from app.services.fflogs_service import FFLogsRateLimited, FFLogsService
+from app.services.job_queue import JobQueue
+from app.services.progression_sync import CHECKPOINT_ID, refresh_progression, schedule_progression_refresh
+
+# encounterRankings by FFLogs character and encounter ID (93 = M1S, 94 = M2S, 95 = M3S)
+RANKINGS = {
+    101: {
+        93: {'totalKills': 6, 'fastestKill': 401000, 'ranks': [{'rankPercent': 91.3, 'spec': 'Warrior'}]},
+        94: {'totalKills': 2, 'fastestKill': 455000, 'ranks': [{'rankPercent': 64.9, 'spec': 'Warrior'}]}
+    },
+    102: {
+        93: {'totalKills': 1, 'fastestKill': 480000, 'ranks': [{'rankPercent': 35.0, 'spec': 'Sage'}]}
+    },
+    103: {}
+}
+
+
+class TestProgressionRefresh:
+    """Test filling progression from FFLogs through the stub"""
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        with app.app_context():
+            yield
+
+    def _link(self, app, *fflogs_ids):
+        users = [{'_id': ObjectId(), 'username': f'player{i}', 'fflogs_id': fflogs_id}
+                 for i, fflogs_id in enumerate(fflogs_ids)]
+        app.db.users.insert_many(users)
+        return users
+
+    def test_summaries_stored(self, app, fflogs_stub):
+        fflogs_stub.characters = RANKINGS
+        self._link(app, '101', '102', '103', '999', 'not-a-number')
+        app.db.users.insert_one({'_id': ObjectId(), 'username': 'unlinked'})
+
+        totals = refresh_progression(app.db)
+
+        assert (totals['users'], totals['updated'], totals['not_found']) == (5, 5, 2)
+        assert len(fflogs_stub.queries) == 1
+        user = app.db.users.find_one({'fflogs_id': '101'})
+        assert user['progression_clears'] == ['M1S', 'M2S']
+        assert user['progression']['M1S'] == {
+            'kills': 6, 'best_percent': 91.3, 'best_spec': 'Warrior', 'fastest_kill': 401000
+        }
+        assert app.db.users.find_one({'fflogs_id': '103'})['progression'] == {}
+        assert app.db.users.find_one({'fflogs_id': '999'})['progression_clears'] == []
+        assert 'progression' not in app.db.users.find_one({'username': 'unlinked'})
+
+    def test_unchanged_progression_keeps_updated_at(self, app, fflogs_stub, monkeypatch):
+        fflogs_stub.characters = RANKINGS
+        self._link(app, '101', '102')
+        refresh_progression(app.db)
+        before = {user['fflogs_id']: user for user in app.db.users.find()}
+        invalidated = []
+        monkeypatch.setattr('app.services.progression_sync.invalidate_user_summary', invalidated.append)
+
+        fflogs_stub.characters = {**RANKINGS, 102: {}}
+        refresh_progression(app.db, resume=False, force=True)
+
+        after = {user['fflogs_id']: user for user in app.db.users.find()}
+        assert after['101']['updated_at'] == before['101']['updated_at']
+        assert after['101']['progression_updated_at'] > before['101']['progression_updated_at']
+        assert after['102']['updated_at'] > before['102']['updated_at']
+        assert invalidated == [before['102']['_id']]
+
+    def test_errored_users_left_untouched(self, app, fflogs_stub):
+        fflogs_stub.characters = RANKINGS
+        self._link(app, '101', '102')
+        refresh_progression(app.db)
+        before = app.db.users.find_one({'fflogs_id': '101'})
+
+        FFLogsService.reset()
+        fflogs_stub.characters = {101: RANKINGS[101]}  # 102 is gone
+        fflogs_stub.errors = {(101, 94)}
+        totals = refresh_progression(app.db, force=True)
+
+        assert (totals['updated'], totals['not_found'], totals['failed']) == (1, 1, 1)
+        assert app.db.users.find_one({'fflogs_id': '101'}) == before
+        assert app.db.users.find_one({'fflogs_id': '102'})['progression_clears'] == []
+
+    def test_resumes_after_rate_limit(self, app, fflogs_stub):
+        FFLogsService.BATCH_SIZE = 2
+        fflogs_stub.characters = RANKINGS
+        fflogs_stub.points_spent = 3600 - 100 - 1
+        users = self._link(app, '101', '102', '103')
+
+        with pytest.raises(FFLogsRateLimited):
+            refresh_progression(app.db)
+        assert app.db.checkpoints.find_one({'_id': CHECKPOINT_ID})['last_id'] == users[1]['_id']
+
+        FFLogsService.reset()
+        totals = refresh_progression(app.db)
+
+        assert totals['resumed_from'] == users[1]['_id']
+        assert totals['users'] == 3
+        assert len(fflogs_stub.queries) == 2
+        assert 'character(id: 103)' in fflogs_stub.queries[1]
+
+    def test_rate_limited_job_brought_forward(self, app, fflogs_stub):
+        fflogs_stub.points_spent = 3600 - 100
+        self._link(app, '101')
+        FFLogsService.get_encounter_rankings([1], [93])  # records the exhausted budget
+        job = schedule_progression_refresh()
+
+        JobQueue.run_pending()
+
+        assert JobQueue.get(job['_id'])['result'] == {'rate_limited': True, 'retry_after': 1800}
+        next_run = app.db.jobs.find_one({'type': 'fflogs.progression_all', 'status': 'queued'})
+        assert (next_run['run_at'] - job['run_at']).total_seconds() < 1900
+
+    def test_profile_fflogs_id_queues_refresh(self, client, app, sample_user, auth_headers, fflogs_stub):
+        fflogs_stub.characters = RANKINGS
+        app.db.users.update_one({'_id': sample_user['_id']}, {'$set': {
+            'progression': {'M3S': {'kills': 1}}, 'progression_clears': ['M3S']
+        }})
+
+        response = client.put('/api/users/profile', json={'fflogs_id': '102'}, headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.get_json()['progression'] == {}
+        JobQueue.run_pending()
+        user = app.db.users.find_one({'_id': sample_user['_id']})
+        assert user['progression_clears'] == ['M1S']
+
+
+class TestProgressionMatching:
+    """Test matching listings' requirements.progression against clears"""
+
+    def _player(self, username, *clears, best_percent=60.0):
+        return {
+            '_id': ObjectId(), 'username': username, 'data_center': 'Aether',
+            'progression': {code: {'kills': 1, 'best_percent': best_percent} for code in clears},
+            'progression_clears': list(clears)
+        }
+
+    def test_cleared_filter(self, client, app):
+        app.db.users.insert_many([
+            self._player('both', 'M1S', 'M2S'),
+            self._player('first', 'M1S'),
+            self._player('none')
+        ])
+
+        data = client.get('/api/search/players?cleared=m1s,M2S').get_json()
+
+        assert [p['username'] for p in data['players']] == ['both']
+        assert client.get('/api/search/players?cleared=P99S').status_code == 400
+
+    def test_match_score_uses_required_clears(self):
+        listing = {'data_center': 'Aether', 'requirements': {'progression': ['m1s', 'M2S']}}
+        both = self._player('both', 'M1S', 'M2S', best_percent=100.0)
+        first = self._player('first', 'M1S')
+        none = self._player('none')
+
+        assert calculate_match_score(both, listing) == 50 + 10 + 5
+        assert calculate_match_score(first, listing) == 50 + 5 + 3
+        assert calculate_match_score(none, listing) == 50
+        assert "You've cleared M1S, M2S" in get_match_reasons(both, listing)
+
+        # Without requirements any clear counts as experience
+        assert calculate_match_score(first, {'data_center': 'Aether'}) == 55
+        assert calculate_match_score(none, {'data_center': 'Aether'}) == 50
@@ -0,0 +1,133 @@
+"""
+Tests for schedule parsing and available= search
+"""
+
+from datetime import datetime, timezone
+from bson import ObjectId
+from app.models.listing import Listing
+from app.models.user import User
+from app.services.search_fields import refresh_schedule_hours
+from app.utils.schedule import parse_schedule
+
+WINTER = datetime(2024, 1, 10, tzinfo=timezone.utc)
+SUMMER = datetime(2024, 7, 10, tzinfo=timezone.utc)
+
+
+def hours(day, *hours_of_day):
+    """Hour-of-week buckets for hours on a day (0 = Monday)"""
+    return [day * 24 + hour for hour in hours_of_day]
+
+
+class TestParseSchedule:
+    """Test free text to UTC hour-of-week buckets"""
+
+    def test_days_and_time_range(self):
+        assert parse_schedule(['Tue/Thu 7-11 PM UTC']) == hours(1, 19, 20, 21, 22) + hours(3, 19, 20, 21, 22)
+
+    def test_timezone_abbreviation_shifts_to_utc(self):
+        # 8 PM EST Tuesday is 01:00 UTC Wednesday; a start time alone lasts three hours
+        assert parse_schedule('Tuesday 8PM EST') == hours(2, 1, 2, 3)
+
+    def test_daylight_saving_zones(self):
+        assert parse_schedule('Mon 8pm ET', now=WINTER) == hours(1, 1, 2, 3)
+        assert parse_schedule('Mon 8pm ET', now=SUMMER) == hours(1, 0, 1, 2)
+        assert parse_schedule('Fri 21:00-23:00 Europe/London', now=SUMMER) == hours(4, 20, 21)
+
+    def test_day_ranges_groups_and_wrapping(self):
+        assert parse_schedule('Sat-Mon 23:00-01:00') == (
+            hours(0, 0, 23) + hours(1, 0) + hours(5, 23) + hours(6, 0, 23)
+        )
+        assert len(parse_schedule('Weekdays')) == 5 * 24
+
+    def test_default_timezone(self):
+        assert parse_schedule('Wed 18-20', default_tz=timezone.utc) == hours(2, 18, 19)
+        assert parse_schedule('Wed 18-20 PDT') == hours(3, 1, 2)
+        assert parse_schedule('Wed 9-5 UTC') == hours(2, *range(9, 17))
+
+    def test_zone_only_after_time_or_at_end(self):
+        # The "st" of "1st" is not server time
+        assert parse_schedule('Wed 1st week 8pm-10pm PT', now=WINTER) == hours(3, 4, 5)
+        assert parse_schedule('Wed 8pm-10pm PT 1st week', now=WINTER) == hours(3, 4, 5)
+        assert parse_schedule('Weekends ST') == parse_schedule('Weekends UTC')
+
+    def test_unparseable_entries_are_skipped(self):
+        assert parse_schedule(['Whenever works', None, 'Sun 20:00-21:00']) == hours(6, 20)
+
+    def test_plural_day_names(self):
+        assert parse_schedule('Tuesdays and Thursdays 8pm-11pm EST') == hours(2, 1, 2, 3) + hours(4, 1, 2, 3)
+        assert len(parse_schedule('Mondays-Fridays')) == 5 * 24
+
+    def test_military_times(self):
+        # 23:00-02:00 EST Tuesday is 04:00-07:00 UTC Wednesday
+        assert parse_schedule('Tue 2300-0200 EST') == hours(2, 4, 5, 6)
+        assert parse_schedule('Sat 0900-1200') == hours(5, 9, 10, 11)
+
+    def test_time_without_day_matches_nothing(self):
+        assert parse_schedule('8-11 PM EST') == []
+
+
+class TestAvailableFilter:
+    """Test available= on listing and player search"""
+
+    def _listing(self, app, schedule):
+        doc = {
+            '_id': ObjectId(), 'title': 'Static', 'description': '', 'owner_id': ObjectId(),
+            'content_type': 'savage', 'data_center': 'Primal', 'state': 'recruiting',
+            'schedule': schedule, 'created_at': datetime.utcnow(), 'updated_at': datetime.utcnow()
+        }
+        doc.update(Listing.search_fields(doc))
+        app.db.listings.insert_one(doc)
+        return doc
+
+    def test_listing_overlap(self, client, app):
+        evening = self._listing(app, ['Tue/Thu 8-11 PM EST'])
+        self._listing(app, ['Sat 10am-2pm EST'])
+        self._listing(app, ['Flexible'])
+
+        data = client.get('/api/search/listings?available=Tue/Thu 7-11 PM&tz=PST').get_json()
+
+        assert [listing['id'] for listing in data['listings']] == [str(evening['_id'])]
+
+    def test_no_overlap(self, client, app):
+        self._listing(app, ['Tue 8-11 PM EST'])
+
+        data = client.get('/api/search/listings?available=Tue 1-3 PM EST').get_json()
+
+        assert data['total'] == 0
+
+    def test_player_overlap_after_profile_update(self, client, app, sample_user, auth_headers):
+        client.put('/api/users/profile', headers=auth_headers, json={'availability': ['Weekends 20:00-23:00 UTC']})
+        app.db.users.insert_one(dict(
+            {'_id': ObjectId(), 'username': 'other', 'availability': ['Mon 9-5 UTC']},
+            **User.search_fields({'username': 'other', 'availability': ['Mon 9-5 UTC']})
+        ))
+
+        data = client.get('/api/search/players?available=Sun 9pm&tz=UTC').get_json()
+
+        assert [player['username'] for player in data['players']] == ['testuser']
+
+    def test_listing_update_reparses_schedule(self, client, app, sample_user, auth_headers):
+        listing_id = client.post('/api/listings/', headers=auth_headers, json={
+            'title': 'Static', 'description': 'x', 'content_type': 'savage', 'data_center': 'Primal',
+            'state': 'recruiting', 'schedule': ['Mon 20:00-22:00 UTC']
+        }).get_json()['id']
+        assert client.get('/api/search/listings?available=Mon 21:00').get_json()['total'] == 1
+
+        client.put(f'/api/listings/{listing_id}', headers=auth_headers, json={'schedule': ['Fri 20:00-22:00 UTC']})
+
+        assert client.get('/api/search/listings?available=Mon 21:00').get_json()['total'] == 0
+        assert client.get('/api/search/listings?available=Fri 21:00').get_json()['total'] == 1
+
+    def test_invalid_input(self, client):
+        assert client.get('/api/search/listings?available=whenever').status_code == 400
+        assert client.get('/api/search/players?available=Mon 8pm&tz=Mars/Olympus').status_code == 400
+
+    def test_refresh_follows_daylight_saving(self, app):
+        doc = self._listing(app, ['Mon 8pm ET'])
+        app.db.listings.update_one({'_id': doc['_id']}, {'$set': {'schedule_hours': parse_schedule('Mon 8pm ET', now=WINTER)}})
+        self._listing(app, ['Mon 20:00-22:00 UTC'])
+
+        updated = refresh_schedule_hours(app.db)
+
+        assert app.db.listings.find_one({'_id': doc['_id']})['schedule_hours'] == parse_schedule('Mon 8pm ET')
+        assert updated['listings'] == (parse_schedule('Mon 8pm ET') != parse_schedule('Mon 8pm ET', now=WINTER))
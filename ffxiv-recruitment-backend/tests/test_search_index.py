@@ -0,0 +1,256 @@
+"""
+Tests for listing search
+"""
+
+import pytest
+from datetime import datetime
+from bson import ObjectId
+from app.models.listing import Listing
+from app.services.search_index import ListingSearchIndex, listing_index, tokenize
+
+
+def listing(title, description='', content_name=None, **fields):
+    doc = {
+        '_id': ObjectId(),
+        'title': title,
+        'description': description,
+        'content_name': content_name,
+        'owner_id': ObjectId(),
+        'content_type': 'savage',
+        'data_center': 'Primal',
+        'state': 'recruiting',
+        'application_count': 0,
+        'created_at': datetime.utcnow(),
+        'updated_at': datetime.utcnow()
+    }
+    doc.update(fields)
+    return doc
+
+
+class TestListingSearchIndex:
+    """Test ranking and prefix matching"""
+
+    def test_tokenize(self):
+        assert tokenize('M4S Static: LF Healer!') == ['m4s', 'static', 'lf', 'healer']
+        assert tokenize(None) == []
+
+    def test_title_match_ranks_above_description(self):
+        index = ListingSearchIndex()
+        in_description = listing('Weekly static', 'Looking for a healer main')
+        in_title = listing('Healer wanted', 'Weekly static')
+        index.add(in_description)
+        index.add(in_title)
+
+        ranked = [listing_id for listing_id, _ in index.search('healer')]
+
+        assert ranked == [in_title['_id'], in_description['_id']]
+
+    def test_prefix_matching(self):
+        index = ListingSearchIndex()
+        dragonsong = listing('Dragonsong Ultimate prog')
+        index.add(dragonsong)
+
+        assert [listing_id for listing_id, _ in index.search('drag')] == [dragonsong['_id']]
+        assert index.search('d') == []  # too short to expand
+
+    def test_exact_match_beats_prefix(self):
+        index = ListingSearchIndex()
+        exact = listing('Tank')
+        prefix = listing('Tanks')
+        index.add(prefix)
+        index.add(exact)
+
+        assert index.search('tank')[0][0] == exact['_id']
+
+    def test_reindex_and_remove(self):
+        index = ListingSearchIndex()
+        doc = listing('Savage static')
+        index.add(doc)
+        index.add(dict(doc, title='Ultimate static'))
+
+        assert index.search('savage') == []
+        assert index.search('ultimate')[0][0] == doc['_id']
+
+        index.remove(doc['_id'])
+        assert index.search('static') == []
+        assert index.postings == {}
+
+
+class TestSearchListingsRoute:
+    """Test q= on /api/search/listings"""
+
+    def test_ranked_results(self, client, app):
+        docs = [
+            listing('Casual static', 'We might do some savage later'),
+            listing('Savage static LF healer', 'Savage prog group', 'AAC Savage'),
+            listing('Ultimate prog', 'No savage')
+        ]
+        app.db.listings.insert_many(docs)
+
+        data = client.get('/api/search/listings?q=savage').get_json()
+
+        assert data['total'] == 3
+        assert data['listings'][0]['id'] == str(docs[1]['_id'])
+
+    def test_private_listings_not_leaked(self, client, app, sample_user, auth_headers):
+        """Test that q= keeps the visibility filter instead of replacing it"""
+        app.db.listings.insert_many([
+            listing('Secret savage static', state='private'),
+            listing('Own secret static', state='private', owner_id=sample_user['_id']),
+            listing('Public savage static')
+        ])
+
+        anonymous = client.get('/api/search/listings?q=secret').get_json()
+        signed_in = client.get('/api/search/listings?q=secret', headers=auth_headers).get_json()
+
+        assert anonymous['total'] == 0
+        assert [item['title'] for item in signed_in['listings']] == ['Own secret static']
+
+    def test_filters_and_pagination(self, client, app):
+        app.db.listings.insert_many(
+            [listing(f'Savage static {i}', data_center='Aether') for i in range(3)]
+            + [listing('Savage static Primal')]
+        )
+
+        first = client.get('/api/search/listings?q=savage&data_center=Aether&per_page=2').get_json()
+        second = client.get('/api/search/listings?q=savage&data_center=Aether&per_page=2&page=2').get_json()
+
+        assert first['total'] == 3
+        assert len(first['listings']) == 2
+        assert len(second['listings']) == 1
+
+    def test_visible_match_ranked_below_private_ones(self, client, app):
+        """Test that visibility is applied to every match, not just the best ranked"""
+        app.db.listings.insert_many(
+            [listing(f'Savage static {i}', 'Savage savage', state='private') for i in range(1200)]
+            + [listing('Weekly static', 'Some savage later')]
+        )
+
+        data = client.get('/api/search/listings?q=savage&facets=data_center').get_json()
+
+        assert data['total'] == 1
+        assert data['listings'][0]['title'] == 'Weekly static'
+        assert data['facets']['data_center'] == [{'value': 'Primal', 'count': 1}]
+
+    def test_candidates_bounded_by_page(self, client, app, monkeypatch):
+        """Test that only a window of the best matches is read, growing while too few are visible"""
+        monkeypatch.setitem(app.config, 'SEARCH_CANDIDATE_MARGIN', 0)
+        app.db.listings.insert_many(
+            [listing(f'Savage savage static {i}', state='private') for i in range(2)]
+            + [listing(f'Savage static {i}') for i in range(10)]
+        )
+
+        data = client.get('/api/search/listings?q=savage&per_page=2').get_json()
+
+        assert len(data['listings']) == 2
+        assert data['total_capped'] is True
+        assert data['total'] < 10
+
+        everything = client.get('/api/search/listings?q=savage&per_page=10').get_json()
+        assert (everything['total'], everything['total_capped']) == (10, False)
+
+    def test_rebuild_runs_in_background(self, client, app):
+        """Test that a due rebuild does not block the request and drops deleted listings"""
+        kept, deleted = listing('Savage static'), listing('Savage prog')
+        app.db.listings.insert_many([kept, deleted])
+        client.get('/api/search/listings?q=savage')
+
+        app.db.listings.delete_one({'_id': deleted['_id']})
+        listing_index.built_at -= listing_index.rebuild_seconds
+        with app.app_context():
+            listing_index.sync()
+            thread = listing_index._rebuild_thread
+        thread.join(timeout=5)
+
+        assert [listing_id for listing_id, _ in listing_index.search('savage')] == [kept['_id']]
+
+    def test_regex_characters_are_literal(self, client, app):
+        app.db.listings.insert_one(listing('Static (M4S)'))
+
+        response = client.get('/api/search/listings?q=.*(')
+
+        assert response.status_code == 200
+        assert response.get_json()['total'] == 0
+
+    def test_writes_update_index(self, client, app, auth_headers):
+        response = client.post('/api/listings/', headers=auth_headers, json={
+            'title': 'Futures Rewritten prog',
+            'description': 'Ultimate',
+            'content_type': 'ultimate',
+            'data_center': 'Primal',
+            'state': 'recruiting'
+        })
+        listing_id = response.get_json()['id']
+        assert client.get('/api/search/listings?q=futures').get_json()['total'] == 1
+
+        client.put(f'/api/listings/{listing_id}', headers=auth_headers, json={'title': 'TOP prog'})
+        assert client.get('/api/search/listings?q=futures').get_json()['total'] == 0
+        assert client.get('/api/search/listings?q=top').get_json()['total'] == 1
+
+        client.delete(f'/api/listings/{listing_id}', headers=auth_headers)
+        assert client.get('/api/search/listings?q=top').get_json()['total'] == 0
+
+
+class TestListingFacets:
+    """Test multi-value filters and facets= on /api/search/listings"""
+
+    def _insert(self, app, data_center, content_type, roles_needed):
+        doc = listing('Static', data_center=data_center, content_type=content_type, roles_needed=roles_needed)
+        doc.update(Listing.search_fields(doc))
+        app.db.listings.insert_one(doc)
+
+    @pytest.fixture
+    def listings(self, app):
+        self._insert(app, 'Aether', 'savage', {'healer': 1, 'tank': 0})
+        self._insert(app, 'Aether', 'ultimate', {'tank': 1})
+        self._insert(app, 'Primal', 'savage', {'healer': 2, 'dps': 1})
+        self._insert(app, 'Crystal', 'extreme', {})
+
+    def test_multi_value_filters(self, client, listings):
+        data = client.get('/api/search/listings?data_center=Aether,primal&role=Healer').get_json()
+
+        assert data['total'] == 2
+        assert 'facets' not in data
+
+    def test_unknown_filter_values_rejected(self, client):
+        assert client.get('/api/search/listings?data_center=Nowhere').status_code == 400
+        assert client.get('/api/search/listings?facets=owner').status_code == 400
+
+    def test_facet_counts_exclude_own_filter(self, client, listings):
+        data = client.get(
+            '/api/search/listings?data_center=Aether&facets=data_center,content_type,role&per_page=1'
+        ).get_json()
+
+        assert data['total'] == 2
+        assert len(data['listings']) == 1
+        facets = data['facets']
+        assert facets['data_center'] == [
+            {'value': 'Aether', 'count': 2}, {'value': 'Crystal', 'count': 1}, {'value': 'Primal', 'count': 1}
+        ]
+        assert facets['content_type'] == [{'value': 'savage', 'count': 1}, {'value': 'ultimate', 'count': 1}]
+        assert facets['role'] == [{'value': 'healer', 'count': 1}, {'value': 'tank', 'count': 1}]
+
+    def test_facets_with_text_search(self, client, app, listings):
+        app.db.listings.insert_one(listing('Savage prog', data_center='Dynamis'))
+
+        data = client.get('/api/search/listings?q=prog&facets=data_center').get_json()
+
+        assert data['total'] == 1
+        assert data['facets']['data_center'] == [{'value': 'Dynamis', 'count': 1}]
+
+    def test_facets_cached_until_listing_write(self, client, app, auth_headers, listings, monkeypatch):
+        from app.utils.cache import app_cache
+        monkeypatch.setattr(app_cache, 'enabled', True)
+        url = '/api/search/listings?facets=data_center'
+        signed_in = {'headers': auth_headers}  # bypasses the anonymous page cache
+
+        assert client.get(url, **signed_in).get_json()['facets']['data_center'][0] == {'value': 'Aether', 'count': 2}
+        # Written behind the API's back: counts still come from the cache
+        self._insert(app, 'Primal', 'savage', {})
+        self._insert(app, 'Primal', 'savage', {})
+        assert client.get(url, **signed_in).get_json()['facets']['data_center'][0]['value'] == 'Aether'
+
+        client.post('/api/listings/', headers=auth_headers, json={
+            'title': 'New', 'description': 'x', 'content_type': 'savage', 'data_center': 'Primal', 'state': 'recruiting'
+        })
+        assert client.get(url, **signed_in).get_json()['facets']['data_center'][0] == {'value': 'Primal', 'count': 4}